@@ -0,0 +1,1237 @@
+"""Benchmarks for the functions in ta_functions.
+
+Run from the repository root, e.g.
+
+    python benchmarks.py rsi --rows 1000000
+    python benchmarks.py suite --output results.json
+    python benchmarks.py compare --files old.json results.json
+"""
+
+import argparse
+from itertools import product
+import json
+import multiprocessing
+import os
+import platform
+import Queue
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from timeit import default_timer
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import USFederalHolidayCalendar
+
+import ta_functions as ta
+
+
+def _trading_index(n_rows, freq):
+    """Returns a DatetimeIndex of n_rows timestamps that skips weekends
+    and US federal holidays."""
+    n_candidates = n_rows
+    while True:
+        index = pd.date_range('2000-01-03', periods=int(1.5 * n_candidates) + 10,
+                              freq=freq, name='Date')
+        days = index.normalize()
+        holidays = USFederalHolidayCalendar().holidays(days[0], days[-1])
+        index = index[(index.dayofweek < 5) & ~days.isin(holidays)]
+        if len(index) >= n_rows:
+            return index[:n_rows]
+        n_candidates *= 2
+
+
+def make_security_df(n_rows, securities=('aapl',), seed=0, freq='T',
+                     holidays=False, gap_prob=0.0):
+    """Returns a deterministic DataFrame of synthetic open, high, low,
+    close and volume columns in the same layout as get_security_data().
+    The close prices follow a geometric Brownian motion.
+
+    Parameters
+    ----------
+    n_rows : int
+        The number of rows
+    securities : tuple of str, default ('aapl',)
+        The ticker symbols to generate
+    seed : int, default 0
+        The random seed
+    freq : str, default 'T'
+        The frequency of the DatetimeIndex. Minute bars are used so that
+        very long frames stay within the Timestamp range.
+    holidays : bool, default False
+        If set to True, skip weekends and US federal holidays, like a
+        trading calendar
+    gap_prob : float, default 0.0
+        The probability of each row of each security being missing, like
+        a halted security. Missing rows are NaN in all five columns.
+    """
+
+    rng = np.random.RandomState(seed)
+    if holidays:
+        index = _trading_index(n_rows, freq)
+    else:
+        index = pd.date_range('2000-01-03', periods=n_rows, freq=freq,
+                              name='Date')
+    columns = {}
+    for security in securities:
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, n_rows)))
+        open_ = close * np.exp(rng.normal(0, 0.0005, n_rows))
+        spread = np.abs(rng.normal(0, 0.001, n_rows))
+        columns['open_' + security] = open_
+        columns['high_' + security] = np.maximum(open_, close) * (1 + spread)
+        columns['low_' + security] = np.minimum(open_, close) * (1 - spread)
+        columns['close_' + security] = close
+        columns['volume_' + security] = rng.randint(100, 10000, n_rows)
+        if gap_prob > 0:
+            gaps = rng.rand(n_rows) < gap_prob
+            columns['volume_' + security] = \
+                columns['volume_' + security].astype(float)
+            for col in ['open', 'high', 'low', 'close', 'volume']:
+                columns['{}_{}'.format(col, security)][gaps] = np.nan
+
+    column_order = ['{}_{}'.format(col, security)
+                        for security in securities
+                        for col in ['open', 'high', 'low', 'close', 'volume']]
+    return pd.DataFrame(columns, index=index)[column_order]
+
+
+def _time_call(func, *args, **kwargs):
+    """Returns the result of func and the wall time it took."""
+    start = default_timer()
+    result = func(*args, **kwargs)
+    return result, default_timer() - start
+
+
+def bench_rsi(n_rows=1000000, ndays=14, legacy_rows=None):
+    """Compares the vectorized RSI against the per-window aggregate.
+
+    Parameters
+    ----------
+    n_rows : int, default 1000000
+        The number of rows for the vectorized RSI
+    ndays : int, default 14
+        The RSI window
+    legacy_rows : int, default None
+        The number of rows for the per-window aggregate. If set to None,
+        use n_rows. The speedup is compared per row.
+    """
+
+    if legacy_rows is None:
+        legacy_rows = n_rows
+
+    prices = make_security_df(n_rows)['close_aapl']
+
+    simple_rsi, simple_time = _time_call(ta._get_rsi, prices, ndays)
+    _, wilder_time = _time_call(ta._get_rsi, prices, ndays, method='wilder')
+    legacy_rsi, legacy_time = _time_call(
+        lambda: prices[:legacy_rows].rolling(ndays)
+                                    .apply(ta._rsi_agg, raw=True)
+                                    .values
+    )
+
+    max_diff = np.nanmax(np.abs(legacy_rsi - simple_rsi[:legacy_rows]))
+    speedup = (legacy_time/legacy_rows) / (simple_time/n_rows)
+
+    print 'RSI, ndays={}'.format(ndays)
+    print '\tsimple ({} rows): {:.3f}s'.format(n_rows, simple_time)
+    print '\twilder ({} rows): {:.3f}s'.format(n_rows, wilder_time)
+    print '\tper-window aggregate ({} rows): {:.3f}s'\
+          .format(legacy_rows, legacy_time)
+    print '\tspeedup: {:.0f}x'.format(speedup)
+    print '\tmax abs difference: {}'.format(max_diff)
+
+
+def bench_simulation(n_rows=1000000, n_securities=3, legacy_rows=None,
+                     indicators=None):
+    """Compares the array and iterrows engines of run_simulation_df().
+
+    Parameters
+    ----------
+    n_rows : int, default 1000000
+        The number of rows for the array engine
+    n_securities : int, default 3
+        The number of securities
+    legacy_rows : int, default None
+        The number of rows for the iterrows engine. If set to None, use
+        n_rows. The speedup is compared per row and the trades are
+        checked against the array engine over the same rows.
+    indicators : dict, default None
+        The run_simulation_df() indicators. If set to None, use both MA
+        crossovers and Bollinger bands.
+    """
+
+    if legacy_rows is None:
+        legacy_rows = n_rows
+    if indicators is None:
+        indicators = {'ma_crossovers': [5, 20], 'bollinger_bands': (20, 2.0)}
+
+    securities = tuple('sec{}'.format(i) for i in range(n_securities))
+    security_df = make_security_df(n_rows, securities)
+    kwargs = dict(indicators=indicators, verbose=False, plot_options=set())
+
+    array_port, array_time = _time_call(ta.run_simulation_df, security_df,
+                                        'close', **kwargs)
+    legacy_port, legacy_time = _time_call(ta.run_simulation_df,
+                                          security_df[:legacy_rows], 'close',
+                                          engine='iterrows', **kwargs)
+
+    # The iterrows run only covers the first legacy_rows rows
+    array_port_head = ta.run_simulation_df(security_df[:legacy_rows], 'close',
+                                           **kwargs)
+    trans_match = array_port_head.get_all_transactions().values.tolist()\
+        == legacy_port.get_all_transactions().values.tolist()
+    speedup = (legacy_time/legacy_rows) / (array_time/n_rows)
+
+    print 'run_simulation_df, {} securities, {}'.format(n_securities,
+                                                        indicators)
+    print '\tarray ({} rows, {} trades): {:.3f}s'\
+          .format(n_rows, len(array_port.get_all_transactions()), array_time)
+    print '\titerrows ({} rows): {:.3f}s'.format(legacy_rows, legacy_time)
+    print '\tspeedup: {:.0f}x'.format(speedup)
+    print '\tidentical transactions: {}'.format(trans_match)
+
+
+def bench_ledger(n_trades=500000):
+    """Times recording trades in a security_portfolio, one at a time
+    through buy_securities() and sell_securities() and in bulk through
+    _add_transactions().
+
+    Parameters
+    ----------
+    n_trades : int, default 500000
+        The number of trades
+    """
+
+    dates = list(pd.date_range('2000-01-03', periods=n_trades, freq='T'))
+    n_pairs = n_trades // 2
+
+    def _trade_one_at_a_time():
+        sec_port = ta.security_portfolio(1e12)
+        for i in xrange(n_pairs):
+            sec_port.buy_securities('aapl', 10, 100.0, dates[2*i])
+            sec_port.sell_securities('aapl', 10, 101.0, dates[2*i + 1])
+        return sec_port
+
+    def _trade_in_bulk():
+        sec_port = ta.security_portfolio(1e12)
+        trans_types = np.tile(np.array([ta.BUY, ta.SELL], dtype=np.int8),
+                              n_pairs)
+        prices = np.tile([100.0, 101.0], n_pairs)
+        amounts = np.full(2 * n_pairs, 10, dtype=np.int64)
+        cash_amts = 1e12 + np.cumsum(np.where(trans_types == ta.BUY, -1, 1)
+                                         * prices * amounts)
+        sec_port._add_transactions(dates[:2 * n_pairs],
+                                   np.full(2 * n_pairs, 'aapl', dtype=object),
+                                   trans_types, amounts, prices, cash_amts)
+        return sec_port
+
+    sec_port, single_time = _time_call(_trade_one_at_a_time)
+    _, df_time = _time_call(sec_port.get_all_transactions)
+    _, bulk_time = _time_call(_trade_in_bulk)
+
+    print 'security_portfolio ledger, {} trades'.format(2 * n_pairs)
+    print '\tbuy_securities/sell_securities: {:.3f}s'.format(single_time)
+    print '\t_add_transactions: {:.3f}s'.format(bulk_time)
+    print '\tget_all_transactions: {:.3f}s'.format(df_time)
+
+
+class _latency_provider:
+    def __init__(self, provider, latency):
+        """Wraps a provider and waits latency seconds before each fetch,
+        to stand in for a network round trip."""
+        self.provider = provider
+        self.latency = latency
+
+    def get_data(self, security, start_date, end_date):
+        time.sleep(self.latency)
+        return self.provider.get_data(security, start_date, end_date)
+
+
+def bench_fetch(n_securities=100, n_rows=2500, latency=0.05, max_workers=16):
+    """Compares serial and concurrent get_security_data() against a local
+    directory of CSV files with simulated latency.
+
+    Parameters
+    ----------
+    n_securities : int, default 100
+        The number of securities
+    n_rows : int, default 2500
+        The number of daily rows per security
+    latency : float, default 0.05
+        The simulated latency of each fetch, in seconds
+    max_workers : int, default 16
+        The number of concurrent fetches
+    """
+
+    securities = ['sec{}'.format(i) for i in range(n_securities)]
+    directory = tempfile.mkdtemp()
+    try:
+        for i, security in enumerate(securities):
+            security_df = make_security_df(n_rows, (security,), seed=i,
+                                           freq='D')
+            security_df.columns = ['Open', 'High', 'Low', 'Close', 'Volume']
+            security_df.to_csv(os.path.join(directory, security + '.csv'))
+
+        provider = _latency_provider(ta.directory_provider(directory), latency)
+        start_date = '2000-01-01'
+        end_date = '2030-01-01'
+
+        serial_df, serial_time = _time_call(ta.get_security_data, securities,
+                                            start_date, end_date,
+                                            data_source=provider,
+                                            max_workers=1)
+        concurrent_df, concurrent_time = _time_call(ta.get_security_data,
+                                                    securities, start_date,
+                                                    end_date,
+                                                    data_source=provider,
+                                                    max_workers=max_workers)
+    finally:
+        shutil.rmtree(directory)
+
+    print 'get_security_data, {} securities, {}s latency'.format(n_securities,
+                                                                latency)
+    print '\tserial: {:.3f}s'.format(serial_time)
+    print '\t{} workers: {:.3f}s'.format(max_workers, concurrent_time)
+    print '\tidentical: {}'.format(serial_df.equals(concurrent_df))
+
+
+def bench_align(n_securities=1000, n_rows=2500, legacy_securities=None):
+    """Compares align_security_data() against merging the securities
+    with repeated DataFrame.join and with one pd.concat.
+
+    Parameters
+    ----------
+    n_securities : int, default 1000
+        The number of securities
+    n_rows : int, default 2500
+        The number of daily rows per security. Every other security is
+        missing a different 5% of the dates.
+    legacy_securities : int, default None
+        The number of securities for the repeated join. If set to None,
+        use n_securities.
+    """
+
+    if legacy_securities is None:
+        legacy_securities = n_securities
+
+    rng = np.random.RandomState(0)
+    df_list = []
+    for i in range(n_securities):
+        security_df = make_security_df(n_rows, ('sec{}'.format(i),), seed=i,
+                                       freq='D')
+        if i % 2 == 1:
+            security_df = security_df[rng.rand(n_rows) > 0.05]
+        df_list.append(security_df)
+
+    def _join_loop():
+        security_df = df_list[0].copy()
+        for i in range(1, legacy_securities):
+            security_df = security_df.join(df_list[i])
+        return security_df
+
+    _, align_time = _time_call(ta.align_security_data, df_list)
+    _, concat_time = _time_call(pd.concat, df_list, axis=1)
+    _, join_time = _time_call(_join_loop)
+
+    print 'Merging {} securities of {} rows'.format(n_securities, n_rows)
+    print '\talign_security_data: {:.3f}s'.format(align_time)
+    print '\tpd.concat: {:.3f}s'.format(concat_time)
+    print '\trepeated join ({} securities): {:.3f}s'.format(legacy_securities,
+                                                            join_time)
+
+
+def bench_profiler(n_calls=1000000, n_rows=1000):
+    """Measures the overhead of the pipeline_profiler instrumentation,
+    per call of an instrumented function and on generate_ma_columns().
+
+    Parameters
+    ----------
+    n_calls : int, default 1000000
+        The number of calls of an empty instrumented function
+    n_rows : int, default 1000
+        The number of rows for generate_ma_columns()
+    """
+
+    def _noop():
+        pass
+    profiled_noop = ta._profiled(_noop)
+
+    def _call_loop(func):
+        for _ in xrange(n_calls):
+            func()
+
+    _, plain_time = _time_call(_call_loop, _noop)
+    _, disabled_time = _time_call(_call_loop, profiled_noop)
+    with ta.pipeline_profiler():
+        _, enabled_time = _time_call(_call_loop, profiled_noop)
+
+    security_df = make_security_df(n_rows)
+    ma_times = []
+    for profiler in [None, ta.pipeline_profiler()]:
+        runs = []
+        for _ in range(20):
+            if profiler is None:
+                _, run_time = _time_call(ta.generate_ma_columns, security_df,
+                                         ['aapl'], 'close', [5, 20])
+            else:
+                with profiler:
+                    _, run_time = _time_call(ta.generate_ma_columns,
+                                             security_df, ['aapl'], 'close',
+                                             [5, 20])
+            runs.append(run_time)
+        ma_times.append(min(runs))
+
+    print 'pipeline_profiler overhead per instrumented call'
+    print '\tdisabled: {:.0f}ns'.format((disabled_time - plain_time)
+                                        / n_calls * 1e9)
+    print '\tenabled: {:.0f}ns'.format((enabled_time - plain_time)
+                                       / n_calls * 1e9)
+    print '\tgenerate_ma_columns ({} rows): {:.2f}ms disabled, {:.2f}ms '\
+          'enabled'.format(n_rows, ma_times[0] * 1e3, ma_times[1] * 1e3)
+
+
+def bench_cache(n_rows=1000000):
+    """Times the generate_* functions without an indicator_cache, on a
+    cold cache and on a warm one.
+
+    Parameters
+    ----------
+    n_rows : int, default 1000000
+        The number of rows
+    """
+
+    security_df = make_security_df(n_rows)
+    calls = [('generate_bollinger_columns', (20, 2.0)),
+             ('generate_ma_columns', ([5, 20],)),
+             ('generate_rsi_columns', (14, [30, 70]))]
+
+    def _run_calls():
+        for func_name, args in calls:
+            getattr(ta, func_name)(security_df, ['aapl'], 'close', *args)
+
+    _, uncached_time = _time_call(_run_calls)
+    with ta.indicator_cache() as cache:
+        _, cold_time = _time_call(_run_calls)
+        _, warm_time = _time_call(_run_calls)
+
+    print 'indicator_cache, {} rows, Bollinger, MA crossover and RSI'\
+          .format(n_rows)
+    print '\tno cache: {:.3f}s'.format(uncached_time)
+    print '\tcold cache: {:.3f}s'.format(cold_time)
+    print '\twarm cache: {:.3f}s'.format(warm_time)
+    print '\t{}'.format(cache.get_stats())
+
+
+def bench_plot_signals(n_rows=2500, legacy_rows=None):
+    """Compares drawing the Bollinger signals of a security with
+    _plot_signals() against one axvline() per signal, including the
+    time to render the figure.
+
+    Parameters
+    ----------
+    n_rows : int, default 2500
+        The number of daily rows. Bands of one standard deviation are
+        used so that about half the rows have a signal.
+    legacy_rows : int, default None
+        The number of rows for the axvline() loop. If set to None, use
+        n_rows.
+    """
+
+    if legacy_rows is None:
+        legacy_rows = n_rows
+
+    signal_col = 'bollinger_signal_aapl'
+    security_df = ta.generate_bollinger_columns(
+        make_security_df(n_rows, freq='D'), ['aapl'], 'close', 20, 1.0)
+    n_signals = (security_df[signal_col] != 'N/A').sum()
+
+    def _draw(plot_func, plot_df):
+        figure, ax = ta.plt.subplots()
+        ax.plot(plot_df.index, plot_df['close_aapl'])
+        plot_func(plot_df, ax)
+        figure.canvas.draw()
+        ta.plt.close(figure)
+
+    def _axvline_loop(plot_df, ax):
+        for index, signal in zip(plot_df.index, plot_df[signal_col]):
+            if signal != 'N/A':
+                ax.axvline(x=index, label=signal_col, linestyle='--',
+                           c=ta.red if signal == 'Buy' else ta.green)
+
+    # Import and set up matplotlib before timing
+    _draw(lambda plot_df, ax: None, security_df[:10])
+    _, vlines_time = _time_call(
+        _draw, lambda plot_df, ax: ta._plot_signals(plot_df, signal_col, ax),
+        security_df)
+    _, legacy_time = _time_call(_draw, _axvline_loop,
+                                security_df[:legacy_rows])
+
+    print '_plot_signals, {} rows, {} signals'.format(n_rows, n_signals)
+    print '\tLineCollection per signal: {:.3f}s'.format(vlines_time)
+    print '\taxvline per signal ({} rows): {:.3f}s'.format(legacy_rows,
+                                                          legacy_time)
+
+
+def bench_lod(n_rows=2000000, legacy_rows=20000):
+    """Compares drawing and rendering a long series of minute bars at
+    full resolution and with the level of detail mode, as a line and as
+    candlesticks.
+
+    Parameters
+    ----------
+    n_rows : int, default 2000000
+        The number of rows
+    legacy_rows : int, default 20000
+        The number of rows for the full resolution candlesticks, which
+        draw one patch per bar
+    """
+
+    security_df = make_security_df(n_rows)
+
+    def _draw(plot_func, plot_df):
+        figure, ax = ta.plt.subplots(figsize=(12, 6))
+        plot_func(plot_df, ax)
+        figure.canvas.draw()
+        ta.plt.close(figure)
+
+    # Import and set up matplotlib before timing
+    _draw(lambda plot_df, ax: None, security_df)
+    _, line_time = _time_call(
+        _draw, lambda plot_df, ax: ax.plot(plot_df.index,
+                                           plot_df['close_aapl']),
+        security_df)
+    _, lod_line_time = _time_call(
+        _draw, lambda plot_df, ax: ta.plot_lod_line(plot_df.index,
+                                                    plot_df['close_aapl'],
+                                                    ax),
+        security_df)
+    _, candles_time = _time_call(_draw, ta.plot_candlesticks,
+                                 security_df[:legacy_rows])
+    _, lod_candles_time = _time_call(
+        _draw, lambda plot_df, ax: ta.plot_candlesticks(plot_df, ax,
+                                                        lod=True),
+        security_df)
+
+    print 'Plotting {} minute bars'.format(n_rows)
+    print '\tline: {:.3f}s'.format(line_time)
+    print '\tlevel of detail line: {:.3f}s'.format(lod_line_time)
+    print '\tcandlesticks ({} rows): {:.3f}s'.format(legacy_rows,
+                                                     candles_time)
+    print '\tlevel of detail candlesticks: {:.3f}s'.format(lod_candles_time)
+
+
+def bench_pairs(n_rows=982800, lookback=390):
+    """Times pairs_trade() on a pair of minute-bar securities. The
+    default is ten years of 252 days of 390 minutes.
+
+    Parameters
+    ----------
+    n_rows : int, default 982800
+        The number of rows
+    lookback : int, default 390
+        The rolling window of the spread z-score
+    """
+
+    security_df = make_security_df(n_rows, ('aapl', 'msft'))
+    df_list = []
+    for security in ['aapl', 'msft']:
+        df = security_df[['close_' + security]]
+        df.columns = ['close']
+        df_list.append(df)
+
+    (sec_port, _), pairs_time = _time_call(ta.pairs_trade, df_list[0],
+                                           df_list[1], 'close',
+                                           ['_aapl', '_msft'],
+                                           lookback=lookback)
+
+    print 'pairs_trade, {} rows, lookback={}'.format(n_rows, lookback)
+    print '\t{:.3f}s, {} trades'.format(pairs_time,
+                                        len(sec_port.get_all_transactions()))
+
+
+def bench_screen(n_securities=3000, n_rows=2520, top_k=5):
+    """Times screen_pairs() on a universe of daily securities, about
+    4.5M pairs for the default 3,000.
+
+    Parameters
+    ----------
+    n_securities : int, default 3000
+        The number of securities
+    n_rows : int, default 2520
+        The number of daily rows, ten years of 252 days
+    top_k : int, default 5
+        The number of partners kept per security
+    """
+
+    securities = tuple('sec{}'.format(i) for i in range(n_securities))
+    security_df = make_security_df(n_rows, securities, freq='D',
+                                   holidays=True, gap_prob=0.001)
+
+    pairs_df, screen_time = _time_call(ta.screen_pairs, security_df,
+                                       top_k=top_k)
+
+    n_pairs = n_securities * (n_securities - 1) // 2
+    print 'screen_pairs, {} securities ({} pairs), {} rows, top_k={}'\
+          .format(n_securities, n_pairs, n_rows, top_k)
+    print '\t{:.3f}s, {} candidate pairs tested'.format(screen_time,
+                                                        len(pairs_df))
+
+
+def bench_ewma(n_rows=10000000, spans=(12, 26)):
+    """Compares the blocked EWMAs of generate_ewma_columns() against
+    pandas.Series.ewm() on one security.
+
+    Parameters
+    ----------
+    n_rows : int, default 10000000
+        The number of rows
+    spans : tuple, default (12, 26)
+        The EWMA spans
+    """
+
+    security_df = make_security_df(n_rows)
+    prices = security_df['close_aapl']
+    alphas = [ta._get_ewma_alpha(span=span) for span in spans]
+
+    ewmas, blocked_time = _time_call(ta._get_ewmas, prices.values[:, None],
+                                     alphas)
+    pandas_ewmas, pandas_time = _time_call(
+        lambda: [prices.ewm(span=span).mean().values for span in spans]
+    )
+    _, generate_time = _time_call(ta.generate_ewma_columns, security_df,
+                                  'aapl', 'close', list(spans))
+
+    max_diff = max(np.nanmax(np.abs(ewma[:, 0] - pandas_ewma) / pandas_ewma)
+                   for ewma, pandas_ewma in zip(ewmas, pandas_ewmas))
+
+    print 'EWMA, {} rows, spans={}'.format(n_rows, list(spans))
+    print '	blocked: {:.3f}s'.format(blocked_time)
+    print '	pandas ewm: {:.3f}s'.format(pandas_time)
+    print '	generate_ewma_columns: {:.3f}s'.format(generate_time)
+    print '	speedup: {:.1f}x'.format(pandas_time / blocked_time)
+    print '	max relative difference: {}'.format(max_diff)
+
+
+def bench_ma_bank(n_rows=2520, n_securities=500, ndays=range(5, 105, 5)):
+    """Compares ma_bank against a rolling mean per window, and times the
+    crossover matrix of every window pair.
+
+    Parameters
+    ----------
+    n_rows : int, default 2520
+        The number of daily rows, ten years of 252 days
+    n_securities : int, default 500
+        The number of securities
+    ndays : list of int, default 5 to 100 in steps of 5
+        The moving average lengths
+    """
+
+    securities = tuple('sec{}'.format(i) for i in range(n_securities))
+    security_df = make_security_df(n_rows, securities, freq='D',
+                                   gap_prob=0.001)
+    price_df = security_df[['close_' + security for security in securities]]
+
+    bank, bank_time = _time_call(ta.ma_bank, security_df, list(securities),
+                                 'close', ndays)
+    rolling_means, rolling_time = _time_call(
+        lambda: [price_df.rolling(nday).mean().values for nday in ndays]
+    )
+    (pairs, _), crossover_time = _time_call(bank.get_crossover_matrix)
+
+    max_diff = max(np.nanmax(np.abs(bank.values[:, i] - rolling_mean)
+                             / rolling_mean)
+                   for i, rolling_mean in enumerate(rolling_means))
+
+    print 'MA bank, {} rows, {} securities, {} windows'\
+          .format(n_rows, n_securities, len(ndays))
+    print '\tma_bank: {:.3f}s'.format(bank_time)
+    print '\trolling mean per window: {:.3f}s'.format(rolling_time)
+    print '\tcrossover matrix ({} pairs): {:.3f}s'.format(len(pairs),
+                                                         crossover_time)
+    print '\tmax relative difference: {}'.format(max_diff)
+
+
+def bench_panel(n_securities=1000, n_rows=2520):
+    """Compares the generate_* functions on a security_panel against the
+    wide DataFrame layout.
+
+    Parameters
+    ----------
+    n_securities : int, default 1000
+        The number of securities
+    n_rows : int, default 2520
+        The number of daily rows, ten years of 252 days
+    """
+
+    securities = ['sec{}'.format(i) for i in range(n_securities)]
+    security_df = make_security_df(n_rows, tuple(securities), freq='D',
+                                   gap_prob=0.001)
+    panel, from_time = _time_call(ta.security_panel.from_frame, security_df,
+                                  securities)
+
+    def _generate(data):
+        """Runs each indicator in turn."""
+        data = ta.generate_ma_columns(data, securities, 'close', [5, 20])
+        data = ta.generate_bollinger_columns(data, securities, 'close', 20,
+                                             2.0)
+        data = ta.generate_rsi_columns(data, securities, 'close', 14,
+                                       [30, 70])
+        return ta.generate_returns(data, securities, 'close')
+
+    _, wide_time = _time_call(_generate, security_df)
+    panel, panel_time = _time_call(_generate, panel)
+    _, to_time = _time_call(panel.to_frame)
+
+    print 'security_panel, {} securities, {} rows'.format(n_securities,
+                                                          n_rows)
+    print '\twide generate_*: {:.3f}s'.format(wide_time)
+    print '\tpanel generate_*: {:.3f}s'.format(panel_time)
+    print '\tfrom_frame: {:.3f}s, to_frame: {:.3f}s'.format(from_time,
+                                                           to_time)
+
+
+def _get_process_result(process, queue, timeout):
+    """Returns the result that a benchmark process puts on queue. Raises
+    RuntimeError if the process exits without one, e.g. when it crashes
+    or runs out of memory, or if it is still running after timeout
+    seconds, in which case it is terminated."""
+    deadline = default_timer() + timeout
+    while True:
+        try:
+            return queue.get(timeout=1)
+        except Queue.Empty:
+            pass
+        if not process.is_alive():
+            # The result may have been put just before the process exited
+            try:
+                return queue.get(timeout=1)
+            except Queue.Empty:
+                raise RuntimeError('exited with code {} without a result'
+                                   .format(process.exitcode))
+        if default_timer() > deadline:
+            process.terminate()
+            raise RuntimeError('timed out after {}s'.format(timeout))
+
+
+def _run_chunked_case(input_path, output_path, indicators, memory_budget,
+                      queue):
+    """Computes the indicators of input_path, in memory if memory_budget
+    is None and in chunks otherwise, and puts the wall time and peak RSS
+    on queue. Runs in its own process so that the peak memory of each
+    case is measured separately."""
+    start = default_timer()
+    if memory_budget is None:
+        security_df = pd.read_csv(input_path, index_col=0, parse_dates=True,
+                                  float_precision='round_trip')
+        securities = ta._listify_security(ta._get_security_names(security_df))
+        security_df = ta._generate_indicator_columns(security_df, securities,
+                                                     'close', indicators,
+                                                     'str')
+        security_df.to_csv(output_path)
+    else:
+        ta.generate_columns_chunked(input_path, output_path, indicators,
+                                    memory_budget=memory_budget)
+    queue.put({'wall_time': default_timer() - start,
+               'peak_rss_mb': _peak_rss_mb()})
+
+
+def bench_chunked(n_rows=1000000, n_securities=2,
+                  memory_budget=32 * 1024 ** 2, timeout=3600):
+    """Compares generate_columns_chunked() against reading the whole CSV
+    file into memory, for the wall time and the peak memory.
+
+    Parameters
+    ----------
+    n_rows : int, default 1000000
+        The number of rows in the CSV file
+    n_securities : int, default 2
+        The number of securities
+    memory_budget : int, default 32MB
+        The memory budget of the chunked run
+    timeout : float, default 3600
+        The number of seconds to wait for each run
+    """
+
+    indicators = {'bollinger_bands': (20, 2.0), 'ma_crossovers': [5, 30],
+                  'rsi': (14, 30, 70)}
+    securities = tuple('sec{}'.format(i) for i in range(n_securities))
+    temp_dir = tempfile.mkdtemp()
+    try:
+        input_path = os.path.join(temp_dir, 'prices.csv')
+        make_security_df(n_rows, securities, gap_prob=0.001)\
+            .to_csv(input_path)
+        file_mb = os.path.getsize(input_path) / 1024. ** 2
+
+        print 'Chunked indicators, {} rows, {} securities, {:.0f}MB CSV'\
+              .format(n_rows, n_securities, file_mb)
+        for name, budget in [('in memory', None),
+                             ('chunked ({:.0f}MB budget)'
+                                  .format(memory_budget / 1024. ** 2),
+                              memory_budget)]:
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(
+                target=_run_chunked_case,
+                args=(input_path, os.path.join(temp_dir, 'out.csv'),
+                      indicators, budget, queue))
+            process.start()
+            try:
+                result = _get_process_result(process, queue, timeout)
+            except RuntimeError as e:
+                print '\t{}: failed, {}'.format(name, e)
+                continue
+            finally:
+                process.join()
+            print '\t{}: {:.3f}s, peak RSS {:.0f}MB'\
+                  .format(name, result['wall_time'], result['peak_rss_mb'])
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+
+def bench_copies(n_rows=2520, n_securities=500):
+    """Compares chaining the Bollinger band, MA crossover and RSI columns
+    with each output mode of the generate_* functions, for the wall time
+    and the bytes copied.
+
+    Parameters
+    ----------
+    n_rows : int, default 2520
+        The number of rows
+    n_securities : int, default 500
+        The number of securities
+    """
+
+    securities = ['sec{}'.format(i) for i in range(n_securities)]
+    security_df = make_security_df(n_rows, securities)
+    calls = [('generate_bollinger_columns', (20, 2.0)),
+             ('generate_ma_columns', ([5, 20],)),
+             ('generate_rsi_columns', (14, [30, 70]))]
+
+    def _run_chain(df, output):
+        column_dfs = []
+        for func_name, args in calls:
+            result = getattr(ta, func_name)(df, securities, 'close', *args,
+                                            output=output)
+            if output == 'columns':
+                column_dfs.append(result)
+            else:
+                df = result
+        if output == 'columns':
+            return pd.concat(column_dfs, axis=1)
+        return df
+
+    print 'Indicator chain, {} rows, {} securities, {:.0f}MB of prices'\
+          .format(n_rows, n_securities,
+                  security_df.memory_usage(index=True).sum() / 1024. ** 2)
+    for output in ['copy', 'inplace', 'columns']:
+        # The inplace chain works on its own copy, made outside the
+        # profiler, so that security_df is the same for every mode
+        df = security_df.copy() if output == 'inplace' else security_df
+        with ta.pipeline_profiler() as profiler:
+            result, run_time = _time_call(_run_chain, df, output)
+        print '\t{}: {:.3f}s, {:.0f}MB copied, {:.0f}MB returned'\
+              .format(output, run_time,
+                      profiler.counters.get('bytes_copied', 0) / 1024. ** 2,
+                      result.memory_usage(index=True).sum() / 1024. ** 2)
+
+
+def bench_precision(n_rows=1000000, n_securities=4):
+    """Compares float_dtype='float32' against 'float64' for the
+    generate_* functions and run_simulation_df(): the wall time, the
+    bytes of the new columns, the largest relative difference of the
+    values and whether the signals and trades are the same.
+
+    Parameters
+    ----------
+    n_rows : int, default 1000000
+        The number of rows
+    n_securities : int, default 4
+        The number of securities
+    """
+
+    securities = ['sec{}'.format(i) for i in range(n_securities)]
+    security_df = make_security_df(n_rows, securities, gap_prob=0.001)
+    calls = [('generate_bollinger_columns', (20, 2.0)),
+             ('generate_ma_columns', ([5, 20],)),
+             ('generate_rsi_columns', (14, [30, 70])),
+             ('generate_ewma_columns', ([12, 26],)),
+             ('generate_returns', ())]
+
+    print 'float32 against float64, {} rows, {} securities'\
+          .format(n_rows, n_securities)
+    for func_name, args in calls:
+        func = getattr(ta, func_name)
+        results = {}
+        for float_dtype in ['float64', 'float32']:
+            runs = [_time_call(func, security_df, securities, 'close', *args,
+                               signal_dtype='int8', output='columns',
+                               float_dtype=float_dtype)
+                    if func_name != 'generate_returns' else
+                    _time_call(func, security_df, securities, 'close',
+                               output='columns', float_dtype=float_dtype)
+                    for _ in range(3)]
+            results[float_dtype] = (runs[0][0], min(run[1] for run in runs))
+
+        df_64, time_64 = results['float64']
+        df_32, time_32 = results['float32']
+        max_diff = 0.
+        same_codes = None
+        for column in df_64.columns:
+            if df_64[column].dtype.kind == 'f':
+                # Differences such as ma_diff are compared with the prices
+                if column.startswith(('ma_diff', 'ewma_diff')):
+                    scale = security_df['close_' + column.split('_')[-1]]
+                else:
+                    scale = df_64[column]
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    diffs = np.abs(df_32[column].values - df_64[column].values)\
+                        / np.abs(scale.values)
+                max_diff = max(max_diff, np.nanmax(diffs[np.isfinite(diffs)]))
+            else:
+                same_codes = (same_codes is not False
+                              and (df_32[column].values
+                                   == df_64[column].values).all())
+        print '\t{}: {:.3f}s -> {:.3f}s, {:.1f}MB -> {:.1f}MB, max relative '\
+              'difference {:.2g} ({}), {}'\
+              .format(func_name, time_64, time_32,
+                      df_64.memory_usage().sum() / 1024. ** 2,
+                      df_32.memory_usage().sum() / 1024. ** 2, max_diff,
+                      'within 1e-7' if max_diff <= 1e-7 else 'ABOVE 1e-7',
+                      {None: 'no signals', True: 'same signals',
+                       False: 'DIFFERENT signals'}[same_codes])
+
+    indicators = {'ma_crossovers': [5, 20], 'ewma_crossovers': [12, 26],
+                  'bollinger_bands': (20, 2.0)}
+    trades = {}
+    for float_dtype in ['float64', 'float32']:
+        port, run_time = _time_call(ta.run_simulation_df, security_df,
+                                    'close', indicators=indicators,
+                                    verbose=False, plot_options=set(),
+                                    float_dtype=float_dtype)
+        trades[float_dtype] = port.get_all_transactions()
+        print '\trun_simulation_df, {}: {:.3f}s, {} trades'\
+              .format(float_dtype, run_time, len(trades[float_dtype]))
+    print '\t\ttrades {}'.format(
+        'the same' if trades['float64'].equals(trades['float32'])
+        else 'DIFFERENT')
+
+_SUITE_FUNCTIONS = [
+    ('generate_ma_columns',
+     lambda security_df, securities:
+         ta.generate_ma_columns(security_df, securities, 'close', [5, 20])),
+    ('generate_bollinger_columns',
+     lambda security_df, securities:
+         ta.generate_bollinger_columns(security_df, securities, 'close', 20,
+                                       2.0)),
+    ('generate_rsi_columns',
+     lambda security_df, securities:
+         ta.generate_rsi_columns(security_df, securities, 'close', 14,
+                                 [30, 70])),
+    ('generate_ewma_columns',
+     lambda security_df, securities:
+         ta.generate_ewma_columns(security_df, securities, 'close',
+                                  [12, 26])),
+    ('ma_bank',
+     lambda security_df, securities:
+         ta.ma_bank(security_df, securities, 'close', range(5, 105, 5))),
+    ('generate_returns',
+     lambda security_df, securities:
+         ta.generate_returns(security_df, securities, 'close')),
+    ('run_simulation_df',
+     lambda security_df, securities:
+         ta.run_simulation_df(security_df, 'close',
+                              indicators={'ma_crossovers': [5, 20]},
+                              verbose=False, plot_options=set())),
+]
+
+
+def _peak_rss_mb():
+    """Returns the peak RSS of this process in MB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def _run_suite_case(func_name, n_rows, n_securities, repeat, seed, queue):
+    """Times one function on one size in the current process and puts the
+    result on queue. Runs in its own process so that the peak memory
+    of each case is measured separately."""
+    func = dict(_SUITE_FUNCTIONS)[func_name]
+    securities = ['sec{}'.format(i) for i in range(n_securities)]
+    security_df = make_security_df(n_rows, securities, seed=seed,
+                                   holidays=True, gap_prob=0.001)
+
+    base_rss = _peak_rss_mb()
+    wall_times = []
+    for i in range(repeat):
+        # The functions add columns, so each repeat gets a fresh copy
+        run_df = security_df.copy() if i < repeat - 1 else security_df
+        _, wall_time = _time_call(func, run_df, securities)
+        wall_times.append(wall_time)
+        del run_df
+    peak_rss = _peak_rss_mb()
+
+    wall_time = min(wall_times)
+    queue.put({'function': func_name,
+               'n_rows': n_rows,
+               'n_securities': n_securities,
+               'wall_time': wall_time,
+               'rows_per_sec': n_rows * n_securities / wall_time,
+               'peak_rss_mb': peak_rss,
+               'data_rss_mb': base_rss,
+               'extra_rss_mb': peak_rss - base_rss})
+
+
+def _get_environment():
+    """Returns the commit and library versions the suite ran against."""
+    try:
+        with open(os.devnull, 'w') as devnull:
+            commit = subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'], stderr=devnull,
+                cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'platform': platform.platform()}
+
+
+def run_suite(row_counts=(1000, 100000, 1000000, 10000000),
+              security_counts=(1, 100, 1000), functions=None,
+              max_cells=20000000, repeat=1, seed=0, output=None,
+              timeout=3600):
+    """Runs the generate_* functions and run_simulation_df() on synthetic
+    data of every size, each in a fresh process, and returns the results
+    as a dictionary ready for json.
+
+    Parameters
+    ----------
+    row_counts : tuple of int, default (1000, 100000, 1000000, 10000000)
+        The numbers of rows
+    security_counts : tuple of int, default (1, 100, 1000)
+        The numbers of securities
+    functions : list of str, default None
+        The functions to run. If set to None, run all of them.
+    max_cells : int, default 20000000
+        Sizes with more than max_cells rows times securities are skipped
+        and listed in the results, since they don't fit in memory
+    repeat : int, default 1
+        The number of runs of each case. The fastest is reported.
+    seed : int, default 0
+        The random seed of the synthetic data
+    output : str, default None
+        A path to write the results to as JSON
+    timeout : float, default 3600
+        The number of seconds to wait for each case before it is
+        terminated and reported as failed
+
+    Returns
+    -------
+    results : dict
+        'environment' holds the commit and library versions, 'results' a
+        record per case with wall_time in seconds, rows_per_sec in
+        security rows per second, and peak_rss_mb, data_rss_mb and
+        extra_rss_mb, the peak RSS of the case and how much of it was
+        the synthetic data. 'skipped' lists the sizes over max_cells,
+        and 'failed' the cases that crashed or timed out, with the
+        error.
+    """
+
+    if functions is None:
+        functions = [func_name for func_name, _ in _SUITE_FUNCTIONS]
+    unknown_functions = set(functions) - set(dict(_SUITE_FUNCTIONS))
+    if unknown_functions:
+        raise ValueError('Unknown functions: {}.'
+                         .format(', '.join(sorted(unknown_functions))))
+
+    results = {'environment': _get_environment(), 'results': [],
+               'skipped': [], 'failed': []}
+    for func_name, n_securities, n_rows in product(functions,
+                                                   security_counts,
+                                                   row_counts):
+        if n_rows * n_securities > max_cells:
+            results['skipped'].append({'function': func_name,
+                                       'n_rows': n_rows,
+                                       'n_securities': n_securities})
+            continue
+
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=_run_suite_case,
+            args=(func_name, n_rows, n_securities, repeat, seed, queue))
+        process.start()
+        try:
+            result = _get_process_result(process, queue, timeout)
+        except RuntimeError as e:
+            results['failed'].append({'function': func_name,
+                                      'n_rows': n_rows,
+                                      'n_securities': n_securities,
+                                      'error': str(e)})
+            print '{:<28}{:>10} rows{:>6} secs    failed, {}'\
+                  .format(func_name, n_rows, n_securities, e)
+            continue
+        finally:
+            process.join()
+
+        results['results'].append(result)
+        print '{:<28}{:>10} rows{:>6} secs{:>10.3f}s{:>14.0f} rows/s'\
+              '{:>9.0f}MB'.format(func_name, n_rows, n_securities,
+                                  result['wall_time'], result['rows_per_sec'],
+                                  result['peak_rss_mb'])
+
+    if output is not None:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return results
+
+
+def compare_results(old_path, new_path):
+    """Prints the speedup of every case in common between two JSON files
+    written by run_suite(), e.g. from two commits."""
+    with open(old_path) as f:
+        old_results = json.load(f)
+    with open(new_path) as f:
+        new_results = json.load(f)
+
+    def _by_case(results):
+        return {(result['function'], result['n_rows'],
+                 result['n_securities']): result
+                for result in results['results']}
+
+    old_cases = _by_case(old_results)
+    new_cases = _by_case(new_results)
+    print '{} -> {}'.format(old_results['environment']['commit'],
+                            new_results['environment']['commit'])
+    for case in sorted(set(old_cases) & set(new_cases)):
+        old_result = old_cases[case]
+        new_result = new_cases[case]
+        print '{:<28}{:>10} rows{:>6} secs{:>8.2f}x speed{:>+9.0f}MB'\
+              .format(case[0], case[1], case[2],
+                      old_result['wall_time'] / new_result['wall_time'],
+                      new_result['peak_rss_mb'] - old_result['peak_rss_mb'])
+
+
+_PLOTTING_MODULES = ['IPython', 'matplotlib.pyplot', 'seaborn', 'mpl_finance',
+                     'pandas_datareader']
+
+
+def _time_import(statement):
+    """Runs statement in a fresh interpreter and returns its wall time,
+    its peak RSS in MB and the plotting modules it loaded."""
+    code = ('import sys\n{}\nprint(",".join(m for m in {!r} '
+            'if m in sys.modules))'.format(statement, _PLOTTING_MODULES))
+    start = default_timer()
+    with open(os.devnull, 'w') as devnull:
+        output = subprocess.check_output([sys.executable, '-c', code],
+                                         stderr=devnull)
+    import_time = default_timer() - start
+    # This is the peak over all the children so far, so the lighter
+    # imports have to run first
+    peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.
+    return import_time, peak_rss, output.strip()
+
+
+def bench_import(n_runs=5):
+    """Times importing ta_functions in a fresh interpreter, on its own and
+    together with the plotting and data-reader modules.
+
+    Parameters
+    ----------
+    n_runs : int, default 5
+        The number of imports. The fastest is reported.
+    """
+
+    statements = [('ta_functions', 'import ta_functions'),
+                  ('ta_functions + plotting',
+                   'import ta_functions; ta_functions.plt.figure; '
+                   'ta_functions.mpl_finance.candlestick_ohlc; '
+                   'ta_functions.data.DataReader; import IPython')]
+
+    print 'Import time, best of {}'.format(n_runs)
+    for name, statement in statements:
+        runs = [_time_import(statement) for _ in range(n_runs)]
+        import_time = min(run[0] for run in runs)
+        peak_rss = max(run[1] for run in runs)
+        print '\t{}: {:.3f}s, peak RSS {:.0f}MB'.format(name, import_time,
+                                                        peak_rss)
+        print '\t\tplotting modules loaded: {}'.format(runs[0][2] or 'none')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('benchmark',
+                        choices=['rsi', 'simulation', 'ledger', 'fetch',
+                                 'align', 'import', 'suite', 'compare',
+                                 'profiler', 'cache', 'plot_signals', 'lod',
+                                 'pairs', 'screen', 'ewma', 'ma_bank',
+                                 'panel', 'chunked', 'copies',
+                                 'precision'])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--legacy-rows', type=int, default=None)
+    parser.add_argument('--row-counts', type=int, nargs='+',
+                        default=[1000, 100000, 1000000, 10000000])
+    parser.add_argument('--security-counts', type=int, nargs='+',
+                        default=[1, 100, 1000])
+    parser.add_argument('--functions', nargs='+', default=None)
+    parser.add_argument('--max-cells', type=int, default=20000000)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=3600,
+                        help='the seconds to wait for each suite case')
+    parser.add_argument('--output', default=None,
+                        help='the JSON file for the suite results')
+    parser.add_argument('--files', nargs=2, default=None,
+                        help='the old and new JSON files to compare')
+    args = parser.parse_args()
+
+    if args.benchmark == 'rsi':
+        bench_rsi(args.rows, legacy_rows=args.legacy_rows)
+    elif args.benchmark == 'simulation':
+        bench_simulation(args.rows, legacy_rows=args.legacy_rows)
+    elif args.benchmark == 'ledger':
+        bench_ledger()
+    elif args.benchmark == 'fetch':
+        bench_fetch()
+    elif args.benchmark == 'align':
+        bench_align()
+    elif args.benchmark == 'import':
+        bench_import()
+    elif args.benchmark == 'profiler':
+        bench_profiler()
+    elif args.benchmark == 'cache':
+        bench_cache(args.rows)
+    elif args.benchmark == 'plot_signals':
+        bench_plot_signals()
+    elif args.benchmark == 'lod':
+        bench_lod()
+    elif args.benchmark == 'pairs':
+        bench_pairs()
+    elif args.benchmark == 'screen':
+        bench_screen()
+    elif args.benchmark == 'ewma':
+        bench_ewma()
+    elif args.benchmark == 'ma_bank':
+        bench_ma_bank()
+    elif args.benchmark == 'panel':
+        bench_panel()
+    elif args.benchmark == 'chunked':
+        bench_chunked()
+    elif args.benchmark == 'copies':
+        bench_copies()
+    elif args.benchmark == 'precision':
+        bench_precision(args.rows)
+    elif args.benchmark == 'suite':
+        run_suite(args.row_counts, args.security_counts, args.functions,
+                  args.max_cells, args.repeat, output=args.output,
+                  timeout=args.timeout)
+    elif args.benchmark == 'compare':
+        if args.files is None:
+            parser.error('compare needs --files OLD NEW')
+        compare_results(*args.files)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,361 @@
+"""A live signal service that keeps incremental indicator state for each
+symbol and publishes Buy and Sell events as ticks arrive.
+
+Ticks are lines of 'symbol,timestamp,price', read from a file, a TCP
+socket or the replay feeder, e.g.
+
+    python signal_service.py --file ticks.csv
+    python signal_service.py --connect localhost:9999
+    python signal_service.py --replay prices.csv --col-name close
+"""
+
+import argparse
+from collections import deque, namedtuple
+import Queue
+import socket
+import SocketServer
+import sys
+import threading
+from timeit import default_timer
+
+import numpy as np
+import pandas as pd
+
+import ta_functions as ta
+
+
+signal_event = namedtuple('signal_event', ['symbol', 'timestamp', 'indicator',
+                                           'signal', 'price', 'value'])
+
+
+class signal_engine:
+    def __init__(self, indicators={'ma_crossovers': [5, 10]}):
+        """Keeps the streaming indicators of every symbol and turns each
+        tick into signal events.
+
+        Parameters
+        ----------
+        indicators : dict, default {'ma_crossovers': [5, 10]}
+            A dictionary of which indicators to use, in the same form as
+            for get_buy_sell_signals()
+
+            Possible Keys:
+            bollinger_bands : tuple
+                A 2-tuple representing the length and standard deviation
+                of the bollinger bands
+            ma_crossovers : tuple
+                A 2-tuple of the moving average crossover lengths
+            rsi : tuple
+                A 3-tuple of the form for the number of days and the
+                RSI thresholds
+        """
+        unknown_indicators = set(indicators)\
+            - {'ma_crossovers', 'bollinger_bands', 'rsi'}
+        if unknown_indicators:
+            raise ValueError('Unknown indicators: {}.'
+                             .format(', '.join(sorted(unknown_indicators))))
+        self.indicators = indicators
+        self.state_dict = {}
+
+    def _make_state(self):
+        """Returns new (indicator name, streaming indicator) pairs."""
+        state = []
+        if 'bollinger_bands' in self.indicators:
+            bollinger_len, bollinger_std = self.indicators['bollinger_bands']
+            state.append(('bollinger_bands',
+                          ta.streaming_bollinger(bollinger_len,
+                                                 bollinger_std)))
+        if 'ma_crossovers' in self.indicators:
+            state.append(('ma_crossovers',
+                          ta.streaming_ma_crossover(
+                              self.indicators['ma_crossovers'])))
+        if 'rsi' in self.indicators:
+            ndays = self.indicators['rsi'][0]
+            thresholds = self.indicators['rsi'][1:]
+            state.append(('rsi', ta.streaming_rsi(ndays, thresholds)))
+        return state
+
+    def seed(self, symbol, prices):
+        """Sets the state of a symbol from its historical prices, e.g. a
+        column of get_security_data()."""
+        state = self._make_state()
+        for _, indicator in state:
+            indicator.seed(prices)
+        self.state_dict[symbol] = state
+
+    def on_tick(self, symbol, timestamp, price):
+        """Updates the indicators of a symbol and returns a list of
+        signal_event for the indicators that signal Buy or Sell."""
+        state = self.state_dict.get(symbol)
+        if state is None:
+            state = self.state_dict[symbol] = self._make_state()
+
+        events = []
+        for name, indicator in state:
+            value, signal = indicator.update(price)
+            if signal != ta.NO_SIGNAL:
+                events.append(signal_event(symbol, timestamp, name,
+                                           ta._SIGNAL_STRS[signal], price,
+                                           value))
+        return events
+
+
+class signal_subscriber:
+    def __init__(self, maxsize=10000, overflow='block'):
+        """A bounded queue of the events published by a signal_service.
+
+        Parameters
+        ----------
+        maxsize : int, default 10000
+            The maximum number of events waiting in the queue
+        overflow : str, default 'block'
+            What to do when the queue is full. 'block' makes the service
+            wait for this subscriber, which slows the feed down to the
+            subscriber's pace. 'drop' discards the event instead and
+            counts it in n_dropped.
+        """
+        if overflow not in ('block', 'drop'):
+            raise ValueError("overflow must be 'block' or 'drop'.")
+        self.queue = Queue.Queue(maxsize=maxsize)
+        self.overflow = overflow
+        self.n_dropped = 0
+
+    def _put(self, event):
+        """Adds an event, applying the overflow policy."""
+        if self.overflow == 'block':
+            self.queue.put(event)
+        else:
+            try:
+                self.queue.put_nowait(event)
+            except Queue.Full:
+                self.n_dropped += 1
+
+    def _close(self):
+        """Adds the None that tells the subscriber the service has
+        stopped. A 'drop' subscriber discards its oldest event if the
+        queue is full, so that closing never waits."""
+        if self.overflow == 'block':
+            self.queue.put(None)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(None)
+                return
+            except Queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.n_dropped += 1
+                except Queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """Returns the next event, or None once the service has stopped."""
+        return self.queue.get(timeout=timeout)
+
+    def __iter__(self):
+        while True:
+            event = self.get()
+            if event is None:
+                return
+            yield event
+
+
+class signal_service:
+    def __init__(self, engine, n_latencies=100000):
+        """Runs a signal_engine over a feed of ticks and publishes the
+        events to every subscriber.
+
+        Parameters
+        ----------
+        engine : signal_engine
+            The engine holding the indicator state of every symbol
+        n_latencies : int, default 100000
+            The number of most recent tick-to-signal latencies kept for
+            get_latency_stats()
+        """
+        self.engine = engine
+        self.subscribers = []
+        self.n_ticks = 0
+        self.n_events = 0
+        self.latencies = deque(maxlen=n_latencies)
+        self._lock = threading.Lock()
+
+    def subscribe(self, maxsize=10000, overflow='block'):
+        """Returns a new signal_subscriber. See signal_subscriber for the
+        parameters."""
+        subscriber = signal_subscriber(maxsize=maxsize, overflow=overflow)
+        with self._lock:
+            self.subscribers.append(subscriber)
+        return subscriber
+
+    def process_tick(self, symbol, timestamp, price):
+        """Updates the engine with one tick and publishes its events."""
+        start = default_timer()
+        events = self.engine.on_tick(symbol, timestamp, price)
+        if events:
+            # subscribe() may be called from another thread meanwhile
+            with self._lock:
+                subscribers = list(self.subscribers)
+            for event in events:
+                for subscriber in subscribers:
+                    subscriber._put(event)
+        self.latencies.append(default_timer() - start)
+        self.n_ticks += 1
+        self.n_events += len(events)
+        return events
+
+    def run(self, ticks):
+        """Processes an iterable of (symbol, timestamp, price) ticks, then
+        tells every subscriber that the service has stopped."""
+        try:
+            for symbol, timestamp, price in ticks:
+                self.process_tick(symbol, timestamp, price)
+        finally:
+            with self._lock:
+                subscribers = list(self.subscribers)
+            for subscriber in subscribers:
+                subscriber._close()
+
+    def get_latency_stats(self):
+        """Returns the median, 99th percentile and maximum tick-to-signal
+        latency, in seconds, of the most recent ticks."""
+        if len(self.latencies) == 0:
+            return {'p50': np.nan, 'p99': np.nan, 'max': np.nan}
+        latencies = np.array(self.latencies)
+        return {'p50': np.percentile(latencies, 50),
+                'p99': np.percentile(latencies, 99),
+                'max': latencies.max()}
+
+
+def read_ticks(stream):
+    """Yields (symbol, timestamp, price) from lines of
+    'symbol,timestamp,price'. Blank lines are skipped."""
+    for line in stream:
+        line = line.strip()
+        if line:
+            symbol, timestamp, price = line.split(',')
+            yield symbol, timestamp, float(price)
+
+
+def connect_ticks(host, port):
+    """Yields (symbol, timestamp, price) from a TCP socket sending lines of
+    'symbol,timestamp,price', until the sender closes it."""
+    sock = socket.create_connection((host, port))
+    try:
+        for tick in read_ticks(sock.makefile('r')):
+            yield tick
+    finally:
+        sock.close()
+
+
+def replay_ticks(security_df, col_name='close'):
+    """Yields (symbol, timestamp, price) for every price of a merged
+    DataFrame of security data, in date order and then column order.
+
+    Parameters
+    ----------
+    security_df : DataFrame
+        The merged DataFrame of security data
+    col_name : str, default 'close'
+        Close, Open, etc.
+    """
+    col_name = col_name.lower()
+    securities = ta._listify_security(ta._get_security_names(security_df))
+    price_cols = ['{}_{}'.format(col_name, security)
+                      for security in securities]
+    prices = security_df[price_cols].values
+    timestamps = [str(timestamp) for timestamp in security_df.index]
+
+    # Skip missing prices
+    rows, cols = np.nonzero(~np.isnan(prices))
+    for row, col, price in zip(rows.tolist(), cols.tolist(),
+                               prices[rows, cols].tolist()):
+        yield securities[col], timestamps[row], price
+
+
+class _tick_handler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        for symbol, timestamp, price in self.server.ticks:
+            self.wfile.write('{},{},{!r}\n'.format(symbol, timestamp, price))
+
+
+def serve_ticks(ticks, host='localhost', port=0):
+    """Starts a TCP server on a background thread that sends the ticks as
+    lines of 'symbol,timestamp,price' to the first client, for replaying
+    a feed into connect_ticks().
+
+    Parameters
+    ----------
+    ticks : iterable
+        (symbol, timestamp, price) ticks, e.g. from replay_ticks()
+    host : str, default 'localhost'
+    port : int, default 0
+        The port to listen on. If set to 0, use any free port.
+
+    Returns
+    -------
+    server : SocketServer.TCPServer
+        The server. server.server_address gives the host and port.
+    """
+    server = SocketServer.TCPServer((host, port), _tick_handler)
+    server.ticks = ticks
+    thread = threading.Thread(target=server.handle_request)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--file', help="a file of 'symbol,timestamp,price' "
+                                       "lines, or - for stdin")
+    source.add_argument('--connect', help='host:port of a tick feed')
+    source.add_argument('--replay', help='a CSV file of merged security '
+                                         'data to replay')
+    parser.add_argument('--col-name', default='close')
+    parser.add_argument('--ma-crossovers', type=int, nargs=2)
+    parser.add_argument('--bollinger-bands', type=float, nargs=2)
+    parser.add_argument('--rsi', type=int, nargs=3)
+    args = parser.parse_args()
+
+    indicators = {}
+    if args.ma_crossovers:
+        indicators['ma_crossovers'] = args.ma_crossovers
+    if args.bollinger_bands:
+        indicators['bollinger_bands'] = (int(args.bollinger_bands[0]),
+                                         args.bollinger_bands[1])
+    if args.rsi:
+        indicators['rsi'] = tuple(args.rsi)
+    if not indicators:
+        indicators['ma_crossovers'] = [5, 10]
+
+    if args.file == '-':
+        ticks = read_ticks(sys.stdin)
+    elif args.file:
+        ticks = read_ticks(open(args.file))
+    elif args.connect:
+        host, port = args.connect.rsplit(':', 1)
+        ticks = connect_ticks(host, int(port))
+    else:
+        security_df = pd.read_csv(args.replay, index_col=0, parse_dates=True)
+        ticks = replay_ticks(security_df, args.col_name)
+
+    service = signal_service(signal_engine(indicators))
+    subscriber = service.subscribe()
+    thread = threading.Thread(target=service.run, args=(ticks,))
+    thread.daemon = True
+    thread.start()
+
+    for event in subscriber:
+        print '{},{},{},{},{}'.format(event.timestamp, event.symbol,
+                                      event.indicator, event.signal,
+                                      event.price)
+
+    stats = service.get_latency_stats()
+    print >> sys.stderr, '{} ticks, {} events, p99 latency {:.1f}us'\
+        .format(service.n_ticks, service.n_events, stats['p99'] * 1e6)
+
+
+if __name__ == '__main__':
+    main()
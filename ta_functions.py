@@ -1,23 +1,237 @@
-from datetime import date, datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date
 from dateutil.relativedelta import relativedelta
-from itertools import izip
-from textwrap import dedent
+from functools import wraps
+import hashlib
+import importlib
+from itertools import izip, product
+import json
+import math
+import multiprocessing
+import os
+import socket
+import tempfile
+import time
+from timeit import default_timer
 
-from IPython.core.display import display
-import matplotlib.dates as mdates
-import matplotlib.pyplot as plt
-from mpl_finance import candlestick_ohlc
 import numpy as np
 import pandas as pd
-from pandas_datareader import data
-import seaborn as sns
 
 
-blue, green, red, purple, yellow, teal = sns.color_palette('colorblind')
+class _lazy_module(object):
+    def __init__(self, name, requires=()):
+        """Stands in for a module that is only imported on first
+        attribute access, so that the compute core can be imported
+        without the plotting and network dependencies.
+
+        Parameters
+        ----------
+        name : str
+            The name of the module
+        requires : tuple of str, default ()
+            Modules to import beforehand, e.g. seaborn for its plot style
+        """
+        self._name = name
+        self._requires = requires
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            for name in self._requires:
+                importlib.import_module(name)
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+mcollections = _lazy_module('matplotlib.collections')
+mcolors = _lazy_module('matplotlib.colors')
+mdates = _lazy_module('matplotlib.dates')
+mpl_finance = _lazy_module('mpl_finance')
+plt = _lazy_module('matplotlib.pyplot', requires=('seaborn',))
+data = _lazy_module('pandas_datareader.data')
+
+
+# seaborn's 'colorblind' palette and its 'Blues' palette of 6 colours in
+# reverse, as literals so that they don't need seaborn at import time
+blue = (0.0, 0.4470588235294118, 0.6980392156862745)
+green = (0.0, 0.6196078431372549, 0.45098039215686275)
+red = (0.8352941176470589, 0.3686274509803922, 0.0)
+purple = (0.8, 0.4745098039215686, 0.6549019607843137)
+yellow = (0.9411764705882353, 0.8941176470588236, 0.25882352941176473)
+teal = (0.33725490196078434, 0.7058823529411765, 0.9137254901960784)
 black = (0, 0, 0)
 white = (1, 1, 1)
-blues = sns.color_palette('Blues', n_colors=6)[::-1]
+blues = [(0.044059976931949255, 0.3338869665513264, 0.6244521337946944),
+         (0.16696655132641292, 0.48069204152249134, 0.7291503267973857),
+         (0.32628988850442137, 0.6186236063052672, 0.802798923490965),
+         (0.5356862745098039, 0.746082276047674, 0.8642522106881968),
+         (0.7309496347558632, 0.8394771241830065, 0.9213225682429834),
+         (0.8584083044982699, 0.9134486735870818, 0.9645674740484429)]
+
+
+# The pipeline_profiler objects that are currently collecting. When it is
+# empty, the instrumented stages cost one list check each.
+_active_profilers = []
+
+
+class pipeline_profiler:
+    def __init__(self, callback=None):
+        """Collects the time spent in each stage of the signal pipeline,
+        and counters such as the rows processed and trades executed,
+        while it is active, e.g.
+
+            with pipeline_profiler() as profiler:
+                run_simulation(['aapl', 'msft'], 'close', '2015-01-01')
+            profiler.print_report()
+
+        The stages are the instrumented functions, e.g. get_security_data
+        or generate_ma_columns, plus 'simulation' and 'plotting' within
+        run_simulation_df(). Stage times include any stages nested in
+        them.
+
+        Counters:
+        rows_processed : rows times securities passed to generate_*
+        trades_executed : trades made by run_simulation_df()
+        securities_fetched, fetch_failures : from get_security_data()
+        data_store_hits, data_store_misses : data_storage requests that
+            were or were not fully covered by the stored dates
+        bytes_copied : bytes of the DataFrames copied by the pipeline
+        indicator_cache_hits, indicator_cache_misses : lookups in the
+            active indicator_cache
+
+        Parameters
+        ----------
+        callback : function, default None
+            Called as callback(kind, name, value) for every measurement,
+            where kind is 'time', with value in seconds, or 'count'
+        """
+        self.callback = callback
+        self.reset()
+
+    def __enter__(self):
+        _active_profilers.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _active_profilers.remove(self)
+
+    def reset(self):
+        """Clears all timings and counters."""
+        self.stage_times = {}
+        self.stage_calls = {}
+        self.counters = {}
+
+    def _add_time(self, stage, seconds):
+        self.stage_times[stage] = self.stage_times.get(stage, 0.0) + seconds
+        self.stage_calls[stage] = self.stage_calls.get(stage, 0) + 1
+        if self.callback is not None:
+            self.callback('time', stage, seconds)
+
+    def _add_count(self, counter, n):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+        if self.callback is not None:
+            self.callback('count', counter, n)
+
+    def get_stage_report(self):
+        """Returns a DataFrame of the calls, total time and mean time of
+        each stage, slowest first."""
+        stages = sorted(self.stage_times, key=self.stage_times.get,
+                        reverse=True)
+        total_times = [self.stage_times[stage] for stage in stages]
+        calls = [self.stage_calls[stage] for stage in stages]
+        return pd.DataFrame({'calls': calls,
+                             'total_time': total_times,
+                             'mean_time': np.divide(total_times, calls)},
+                            index=pd.Index(stages, name='stage'),
+                            columns=['calls', 'total_time', 'mean_time'])
+
+    def print_report(self):
+        """Prints the stage timings and the counters."""
+        print self.get_stage_report().to_string()
+        for counter in sorted(self.counters):
+            print '{}: {}'.format(counter, self.counters[counter])
+
+
+class _timed_stage(object):
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = default_timer()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = default_timer() - self.start
+        for profiler in _active_profilers:
+            profiler._add_time(self.stage, elapsed)
+
+
+class _null_stage(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NULL_STAGE = _null_stage()
+
+
+def _stage(stage):
+    """Returns a context manager that times a stage for the active
+    profilers, or does nothing if there are none."""
+    if _active_profilers:
+        return _timed_stage(stage)
+    return _NULL_STAGE
+
+
+def _profiled(func):
+    """Decorator that times every call of func as a stage named after
+    it."""
+    stage = func.__name__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _active_profilers:
+            return func(*args, **kwargs)
+        with _timed_stage(stage):
+            return func(*args, **kwargs)
+    return wrapper
+
 
+def _count(counter, n=1):
+    """Adds n to a counter of the active profilers."""
+    for profiler in _active_profilers:
+        profiler._add_count(counter, n)
+
+
+def _copy_df(df):
+    """Returns df.copy(), counting the bytes copied."""
+    df_copy = df.copy()
+    if _active_profilers:
+        _count('bytes_copied', int(df_copy.memory_usage(index=True).sum()))
+    return df_copy
+
+
+_OUTPUT_MODES = ('copy', 'inplace', 'columns')
+
+
+def _get_output_df(security_df, output):
+    """Returns the DataFrame that a generate_* function adds its columns
+    to: a copy of security_df for output 'copy', security_df itself for
+    'inplace', or an empty DataFrame with its index for 'columns'."""
+    if output not in _OUTPUT_MODES:
+        raise ValueError('output must be one of {}.'
+                         .format(', '.join(_OUTPUT_MODES)))
+    if output == 'copy':
+        return _copy_df(security_df)
+    elif output == 'inplace':
+        return security_df
+    return pd.DataFrame(index=security_df.index)
 
 
 def _listify_security(securities):
@@ -43,15 +257,69 @@ def _get_security_names(security_df):
         return security_list
 
 
+def _plot_vlines(x, ax=None, **kwargs):
+    """Draws a vertical line across the full height of the axes at each
+    x, like axvline(), but as a single LineCollection.
+
+    Parameters
+    ----------
+    x : sequence
+        The x positions, e.g. dates
+    ax : Matplotlib Axes, default None
+        If set to None, use the current Axes
+    kwargs : LineCollection keyword arguments, e.g. colors and label
+
+    Returns
+    -------
+    lines : LineCollection
+    """
+
+    if ax is None:
+        ax = plt.gca()
+
+    # Convert dates etc. to axis units the same way axvline() would
+    ax.xaxis.update_units(x)
+    x = np.asarray(ax.xaxis.convert_units(x), dtype=float)
+
+    # Each segment runs from the bottom to the top of the axes
+    segments = np.zeros((len(x), 2, 2))
+    segments[:, :, 0] = x[:, np.newaxis]
+    segments[:, 1, 1] = 1
+    lines = mcollections.LineCollection(segments,
+                                        transform=ax.get_xaxis_transform(),
+                                        **kwargs)
+    ax.add_collection(lines, autolim=False)
+
+    # Only widen the x-axis, as the lines span the y-axis already
+    if len(x) > 0:
+        ax.update_datalim(np.column_stack([x, np.zeros(len(x))]),
+                          updatey=False)
+        ax.autoscale_view(scaley=False)
+    return lines
+
+
+def _plot_trade_lines(trans_df, ax=None, **kwargs):
+    """Draws a vertical line at the date of each transaction, one
+    LineCollection for buys in red and one for sells in green."""
+    trans_types = trans_df['trans_type'].values
+    for trans_type, colour in [('Buy', red), ('Sell', green)]:
+        dates = trans_df['date'].values[trans_types == trans_type]
+        if len(dates) > 0:
+            _plot_vlines(list(dates), ax, colors=[colour], label=trans_type,
+                         **kwargs)
+
+
+@_profiled
 def _plot_signals(security_df, signal_type, ax=None):
-    """Plots buy or sell signals.
+    """Plots buy or sell signals, with one LineCollection and legend
+    entry per signal type.
 
     Parameters
     ----------
     df : DataFrame
         buy_df or sell_df
     signal_type : str
-        'Buy' or 'Sell'
+        The name of the signal column, of any signal_dtype
     colour : Plotting colour
     ax : Matplotlib Axes
     """
@@ -59,21 +327,13 @@ def _plot_signals(security_df, signal_type, ax=None):
     if isinstance(ax, np.ndarray):
         ax = ax[0]
 
-    for index, row in security_df.iterrows():
-        if ax is  None:
-            if row[signal_type] == 'Buy':
-                plt.axvline(x=index, label=signal_type,
-                            c=red, linestyle='--', linewidth=2.5)
-            elif row[signal_type] == 'Sell':
-                plt.axvline(x=index, label=signal_type,
-                            c=green, linestyle='--', linewidth=2.5)
-        else:
-            if row[signal_type] == 'Buy':
-                ax.axvline(x=index, label=signal_type,
-                           c=red, linestyle='--', linewidth=2.5)
-            elif row[signal_type] == 'Sell':
-                ax.axvline(x=index, label=signal_type,
-                           c=green, linestyle='--', linewidth=2.5)
+    signals = signal_strings(security_df[signal_type]).values
+    for signal, colour in [('Buy', red), ('Sell', green)]:
+        is_signal = signals == signal
+        if is_signal.any():
+            _plot_vlines(list(security_df.index[is_signal]), ax,
+                         colors=[colour], linestyles='--', linewidths=2.5,
+                         label='{} {}'.format(signal_type, signal))
 
 
 def _trim_security_name(sec_string, sec_name):
@@ -89,15 +349,357 @@ def _trim_security_name(sec_string, sec_name):
     return sec_string
 
 
+# Integer codes of the signal columns
+BUY = 1
+SELL = -1
+NO_SIGNAL = 0
+
+_SIGNAL_STRS = {BUY: 'Buy', SELL: 'Sell', NO_SIGNAL: 'N/A'}
+_SIGNAL_DTYPES = ('str', 'int8', 'category')
+
+
+_FLOAT_DTYPES = ('float64', 'float32')
+
+
+def _get_float_dtype(float_dtype):
+    """Returns the NumPy dtype of a float_dtype option, 'float64' or
+    'float32'."""
+    if float_dtype not in _FLOAT_DTYPES:
+        raise ValueError('float_dtype must be one of {}.'
+                         .format(', '.join(_FLOAT_DTYPES)))
+    return np.dtype(float_dtype)
+
+
+def _encode_signals(buy, sell):
+    """Returns an int8 array of BUY where buy is True, SELL where sell is
+    True and NO_SIGNAL elsewhere. Buy takes precedence over sell."""
+    return np.select([np.asarray(buy), np.asarray(sell)],
+                     [BUY, SELL], NO_SIGNAL).astype(np.int8)
+
+
+def _format_signals(signals, signal_dtype):
+    """Converts an int8 array of signal codes to the requested signal
+    column type.
+
+    Parameters
+    ----------
+    signals : array
+        int8 array of BUY, SELL and NO_SIGNAL codes
+    signal_dtype : str
+        'str' for an object column of 'Buy', 'Sell' and 'N/A', 'int8'
+        for the codes themselves, or 'category' for a Categorical whose
+        values are the strings but which is stored as the codes
+    """
+
+    if signal_dtype not in _SIGNAL_DTYPES:
+        raise ValueError('signal_dtype must be one of {}.'
+                         .format(', '.join(_SIGNAL_DTYPES)))
+
+    if signal_dtype == 'int8':
+        return signals
+    elif signal_dtype == 'category':
+        # Codes are offset by one so that SELL maps to the first category
+        return pd.Categorical.from_codes(signals + 1,
+                                         [_SIGNAL_STRS[SELL],
+                                          _SIGNAL_STRS[NO_SIGNAL],
+                                          _SIGNAL_STRS[BUY]])
+    else:
+        return np.array([_SIGNAL_STRS[SELL], _SIGNAL_STRS[NO_SIGNAL],
+                         _SIGNAL_STRS[BUY]], dtype=object)[signals + 1]
+
+
+def _get_crossovers(ma_diff):
+    """Returns a boolean array of whether ma_diff changes sign from the
+    previous row to the current row. Works along the first axis, so
+    ma_diff can be a single series or (dates, securities)."""
+    # Multiply successive ma_diffs. A sign change will be negative.
+    # Account for the missing first entry, which is never a crossover
+    is_crossover = np.zeros(ma_diff.shape, dtype=bool)
+    with np.errstate(invalid='ignore'):
+        is_crossover[1:] = ma_diff[:-1] * ma_diff[1:] < 0
+    return is_crossover
+
+
+def signal_strings(signals):
+    """Returns the 'Buy', 'Sell' and 'N/A' form of a signal column,
+    whichever signal_dtype it was generated with.
+
+    Parameters
+    ----------
+    signals : Series
+        A signal column, e.g. bollinger_signal_SECURITY
+
+    Returns
+    -------
+    signal_srs : Series
+        The signals as strings, with the same index
+    """
+
+    if signals.dtype == object:
+        return signals
+    if hasattr(signals, 'cat'):
+        return signals.astype(object)
+    return pd.Series(_format_signals(np.asarray(signals, dtype=np.int8),
+                                     'str'),
+                     index=signals.index, name=signals.name)
+
+
+# The indicator_cache used by the generate_* functions, if any
+_indicator_cache = None
+
+
+class indicator_cache:
+    def __init__(self, max_bytes=256 * 2**20, spill_dir=None):
+        """Memoizes the Bollinger, MA crossover and RSI columns computed by
+        the generate_* functions. Entries are keyed on the indicator, its
+        parameters and a hash of the input prices, so a repeated request
+        for the same prices returns the stored columns whatever the
+        DataFrame or security they come from.
+
+        The cache is used while it is active, either for a block of code
+
+            with indicator_cache() as cache:
+                get_buy_sell_signals('aapl', 'close', '2015-01-01')
+
+        or for the whole session with set_indicator_cache(cache).
+
+        Parameters
+        ----------
+        max_bytes : int, default 256MB
+            The memory budget. The least recently used entries are
+            evicted to keep the stored arrays within it.
+        spill_dir : str, default None
+            A directory to write evicted entries to, so that they can be
+            loaded back rather than recomputed. If set to None, evicted
+            entries are dropped.
+        """
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        if spill_dir is not None and not os.path.exists(spill_dir):
+            os.makedirs(spill_dir)
+        self._previous_caches = []
+        self.clear()
+
+    def __enter__(self):
+        self._previous_caches.append(set_indicator_cache(self))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        set_indicator_cache(self._previous_caches.pop())
+
+    def clear(self):
+        """Removes all entries from memory and resets the statistics.
+        Spilled files are kept."""
+        self._entries = OrderedDict()
+        self.n_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _get_spill_path(self, key):
+        return os.path.join(self.spill_dir,
+                            hashlib.md5(repr(key)).hexdigest() + '.npz')
+
+    def get(self, key):
+        """Returns the tuple of arrays stored under key, or None."""
+        arrays = self._entries.pop(key, None)
+        if arrays is not None:
+            # Reinsert as the most recently used
+            self._entries[key] = arrays
+            self.hits += 1
+            return arrays
+
+        if self.spill_dir is not None:
+            spill_path = self._get_spill_path(key)
+            if os.path.exists(spill_path):
+                with np.load(spill_path) as npz:
+                    arrays = tuple(npz['arr_{}'.format(i)]
+                                   for i in range(len(npz.files)))
+                self.disk_hits += 1
+                self.put(key, arrays)
+                return self._entries.get(key, arrays)
+
+        self.misses += 1
+        return None
+
+    def put(self, key, arrays):
+        """Stores a tuple of arrays under key, evicting the least recently
+        used entries to stay within max_bytes. The arrays are made
+        read-only."""
+        for array in arrays:
+            array.flags.writeable = False
+        n_bytes = sum(array.nbytes for array in arrays)
+        if key in self._entries:
+            self.n_bytes -= sum(array.nbytes for array in
+                                self._entries.pop(key))
+
+        if n_bytes > self.max_bytes:
+            self._spill(key, arrays)
+            return
+        while self.n_bytes + n_bytes > self.max_bytes:
+            evicted_key, evicted_arrays = self._entries.popitem(last=False)
+            self.n_bytes -= sum(array.nbytes for array in evicted_arrays)
+            self.evictions += 1
+            self._spill(evicted_key, evicted_arrays)
+        self._entries[key] = arrays
+        self.n_bytes += n_bytes
+
+    def _spill(self, key, arrays):
+        """Writes an entry to spill_dir, if set and not already there."""
+        if self.spill_dir is None:
+            return
+        spill_path = self._get_spill_path(key)
+        if not os.path.exists(spill_path):
+            _save_atomic(spill_path, lambda f: np.savez(f, *arrays))
+
+    def get_stats(self):
+        """Returns a dictionary of the hit and miss counts, the hit rate,
+        and the number of entries and bytes held in memory."""
+        n_lookups = self.hits + self.disk_hits + self.misses
+        return {'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': ((self.hits + self.disk_hits) / float(n_lookups)
+                             if n_lookups else np.nan),
+                'evictions': self.evictions,
+                'n_entries': len(self._entries),
+                'n_bytes': self.n_bytes}
+
+
+def set_indicator_cache(cache):
+    """Sets the indicator_cache used by the generate_* functions, or
+    disables caching if cache is None. Returns the previous cache."""
+    global _indicator_cache
+    previous_cache = _indicator_cache
+    _indicator_cache = cache
+    return previous_cache
+
+
+def _get_cached(indicator, params, prices, compute_func):
+    """Returns compute_func(), a tuple of arrays computed from prices,
+    through the active indicator_cache if there is one."""
+    cache = _indicator_cache
+    if cache is None:
+        return compute_func()
+
+    prices = np.ascontiguousarray(prices)
+    fingerprint = hashlib.md5(prices.view(np.uint8)).hexdigest()
+    key = (indicator, params, str(prices.dtype), prices.shape, fingerprint)
+    arrays = cache.get(key)
+    if arrays is None:
+        _count('indicator_cache_misses')
+        arrays = compute_func()
+        cache.put(key, arrays)
+    else:
+        _count('indicator_cache_hits')
+    return arrays
+
+
+# The number of values in each block of _get_blocked(), so that the
+# float64 temporaries of a block are a few MB however long the prices
+_BLOCK_SIZE = 1 << 18
+
+
+def _get_blocked(compute_func, prices, overlap, float_dtype):
+    """Returns compute_func(prices), a tuple of arrays with one row for
+    each row of prices, with the float arrays stored as float_dtype.
 
+    For float32, compute_func runs on blocks of rows, each starting
+    overlap rows early so that its first rows have full windows, and
+    the results are rounded as they are stored. The indicator is still
+    accumulated in float64, only the block sized temporaries are
+    float64, and flags and signals are those of the float64 values.
+    Indicators without a finite window pass overlap=None and are
+    computed in one block.
+    """
+    if float_dtype == np.float64:
+        return compute_func(prices)
+
+    n_rows = len(prices)
+    if overlap is None:
+        block_rows = max(n_rows, 1)
+    else:
+        n_cols = prices.shape[1] if prices.ndim > 1 else 1
+        block_rows = max(4 * overlap, _BLOCK_SIZE // n_cols, 1)
+
+    outputs = None
+    for start in xrange(0, max(n_rows, 1), block_rows):
+        end = min(start + block_rows, n_rows)
+        first = max(0, start - (overlap or 0))
+        if isinstance(prices, np.ndarray):
+            block = prices[first:end]
+        else:
+            block = prices.iloc[first:end]
+        results = compute_func(block)
+        if outputs is None:
+            outputs = tuple(
+                np.empty((n_rows,) + result.shape[1:],
+                         dtype=float_dtype if result.dtype.kind == 'f'
+                         else result.dtype)
+                for result in results)
+        for output, result in zip(outputs, results):
+            output[start:end] = result[start - first:]
+    return outputs
+
+
+def _compute_bollinger(prices, bollinger_len, bollinger_std):
+    """Returns the Bollinger high and low bands of a price Series, and
+    the signals as int8 codes."""
+    rolling_window = prices.rolling(bollinger_len)
+    rolling_mean = rolling_window.mean().values
+    rolling_std = rolling_window.std().values
+    high = rolling_mean + bollinger_std * rolling_std
+    low = rolling_mean - bollinger_std * rolling_std
+
+    # Comparisons against NaN are False, so an incomplete window gives
+    # no signal
+    with np.errstate(invalid='ignore'):
+        signals = _encode_signals(prices.values < low, prices.values > high)
+    return high, low, signals
+
+
+def _compute_ma_crossover(prices, ndays):
+    """Returns the short and long moving averages of a price Series,
+    their difference, whether each date is a crossover, and the signals
+    as int8 codes."""
+    short_ma = prices.rolling(ndays[0]).mean().values
+    long_ma = prices.rolling(ndays[1]).mean().values
+    ma_diff = short_ma - long_ma
+    is_crossover = _get_crossovers(ma_diff)
+
+    # Buy when short_ma crosses above long_ma and sell when it crosses
+    # below
+    with np.errstate(invalid='ignore'):
+        signals = _encode_signals(is_crossover & (short_ma > long_ma),
+                                  is_crossover & (short_ma < long_ma))
+    return short_ma, long_ma, ma_diff, is_crossover, signals
+
+
+def _compute_rsi(prices, ndays, thresholds, method):
+    """Returns the RSI of a price Series and the signals as int8 codes."""
+    rsi = _get_rsi(prices, ndays, method=method)
+
+    # Comparisons against NaN are False, so an incomplete window gives
+    # no signal
+    with np.errstate(invalid='ignore'):
+        signals = _encode_signals(rsi < thresholds[0], rsi > thresholds[1])
+    return rsi, signals
+
+
+@_profiled
 def generate_bollinger_columns(security_df, securities, col_name,
-                               bollinger_len, bollinger_std):
+                               bollinger_len, bollinger_std,
+                               signal_dtype='str', output='copy',
+                               float_dtype='float64'):
     """Creates columns for Bollinger bands and buy signals.
 
     Parameters
     ----------
-    security_df : DataFrame
-        The merged DataFrame of security data
+    security_df : DataFrame or security_panel
+        The merged DataFrame of security data. If a security_panel is
+        given, every security is computed at once and a security_panel
+        with the new fields is returned.
     securities : str or list
         The corresponding list of securities, ETFs, etc.
     col_name : str
@@ -106,6 +708,20 @@ def generate_bollinger_columns(security_df, securities, col_name,
         The number of days to use for the moving average
     bollinger_std : float
         The standard deviation of the Bollinger bands
+    signal_dtype : str, default 'str'
+        The type of the signal column: 'str' for 'Buy', 'Sell' and
+        'N/A', 'int8' for BUY, SELL and NO_SIGNAL codes or 'category'
+    output : str, default 'copy'
+        'copy' to return a copy of security_df with the new columns,
+        'inplace' to add them to security_df itself, or 'columns' to
+        return a DataFrame of only the new columns. Ignored for a
+        security_panel.
+    float_dtype : str, default 'float64'
+        The type of the indicator values: 'float64', or 'float32' to
+        halve their memory. The values are still accumulated in float64
+        and only rounded when stored, so they are within a relative 1e-7
+        of the float64 values and the signals are the same. A
+        security_panel stores them in its own type.
 
     Returns
     -------
@@ -113,17 +729,31 @@ def generate_bollinger_columns(security_df, securities, col_name,
         DataFrame with the new Bollinger columns
     """
 
-    def _get_buy_sell_str(buy, sell):
-        """Returns 'Buy' or 'Sell' depending on buy and sell booleans."""
-        if buy:
-            return 'Buy'
-        elif sell:
-            return 'Sell'
-        else:
-            return 'N/A'
+    float_dtype = _get_float_dtype(float_dtype)
+    params = (bollinger_len, bollinger_std, float_dtype.name)
+
+    def _compute(prices):
+        return _get_blocked(
+            lambda block: _compute_bollinger(block, bollinger_len,
+                                             bollinger_std),
+            prices, bollinger_len - 1, float_dtype)
+
+    if isinstance(security_df, security_panel):
+        locs, prices = security_df._get_prices(securities, col_name)
+        _count('rows_processed', prices.size)
+        high, low, signals = _get_cached(
+            'bollinger_bands', params, prices,
+            lambda: _compute(pd.DataFrame(prices))
+        )
+        col_name = col_name.lower()
+        return security_df._add_fields(
+            locs, ['{}_bollinger_high'.format(col_name),
+                   '{}_bollinger_low'.format(col_name), 'bollinger_signal'],
+            [high, low, signals])
 
-    security_df = security_df.copy()
+    output_df = _get_output_df(security_df, output)
     securities = _listify_security(securities)
+    _count('rows_processed', len(security_df) * len(securities))
 
     for security in securities:
         col_name = col_name.lower()
@@ -134,42 +764,57 @@ def generate_bollinger_columns(security_df, securities, col_name,
         bollinger_high = '{}_bollinger_high_{}'.format(col_name, security)
         bollinger_low = '{}_bollinger_low_{}'.format(col_name, security)
 
-        # Get rolling mean and standard deviation
-        rolling_window = security_df[desired_col].rolling(bollinger_len)
-        rolling_mean = rolling_window.mean()
-        rolling_std = rolling_window.std()
+        prices = security_df[desired_col]
+        high, low, signals = _get_cached(
+            'bollinger_bands', params, prices.values,
+            lambda: _compute(prices)
+        )
 
         # Set bollinger band columns
-        security_df[bollinger_high] = rolling_mean + bollinger_std * rolling_std
-        security_df[bollinger_low] = rolling_mean - bollinger_std * rolling_std
-
-        # Buy and sell signal series
-        buy_signal = (security_df[desired_col] < security_df[bollinger_low])
-        sell_signal = (security_df[desired_col] > security_df[bollinger_high])
+        output_df[bollinger_high] = high
+        output_df[bollinger_low] = low
 
         signal_col_name = 'bollinger_signal_{}'.format(security)
+        output_df[signal_col_name] = _format_signals(signals, signal_dtype)
 
-        security_df[signal_col_name] =\
-            [_get_buy_sell_str(buy, sell)
-                 for buy, sell in zip(buy_signal, sell_signal)]
-
-    return security_df
+    return output_df
 
 
-def generate_ma_columns(security_df, securities, col_name, ndays):
+@_profiled
+def generate_ma_columns(security_df, securities, col_name, ndays,
+                        signal_dtype='str', output='copy',
+                        float_dtype='float64'):
     """Create columns for moving averages and determines when there are
     crossovers.
 
     Parameters
     ----------
-    security_df : DataFrame
-        The merged DataFrame of security data
+    security_df : DataFrame or security_panel
+        The merged DataFrame of security data. If a security_panel is
+        given, every security is computed at once and a security_panel
+        with the new fields is returned.
     securities : list
         The corresponding list of securities, ETFs, etc.
     col_name : str
         Close, Open, etc.
     ndays : list of int
         A list of the moving average lengths we want to generate
+    signal_dtype : str, default 'str'
+        The type of the signal column: 'str' for 'Buy', 'Sell' and
+        'N/A', 'int8' for BUY, SELL and NO_SIGNAL codes or 'category'
+    output : str, default 'copy'
+        'copy' to return a copy of security_df with the new columns,
+        'inplace' to add them to security_df itself, or 'columns' to
+        return a DataFrame of only the new columns. Ignored for a
+        security_panel.
+    float_dtype : str, default 'float64'
+        The type of the indicator values: 'float64', or 'float32' to
+        halve their memory. The values are still accumulated in float64
+        and only rounded when stored, so they are within a relative 1e-7
+        of the float64 values, ma_diff is within that of the moving
+        averages, and the signals are the same. The crossover column is
+        int8 for float32. A security_panel stores the values in its own
+        type.
 
     Returns
     -------
@@ -177,82 +822,258 @@ def generate_ma_columns(security_df, securities, col_name, ndays):
         DataFrame with the new moving average columns
     """
 
-    def _is_crossover(x):
-        """Whether is crossover based off successive ma_diffs"""
-        if np.sign(x) == -1:
-            return 1
-        else:
-            return 0
-
-    def _get_signal(srs, crossover_col, short_ma_col, long_ma_col):
-        """Converts a crossover value to a signal"""
-        if srs[crossover_col] == 0:
-            return 'N/A'
-        if srs[short_ma_col] > srs[long_ma_col]:
-            return 'Buy'
-        if srs[short_ma_col] < srs[long_ma_col]:
-            return 'Sell'
-
-    security_df = security_df.copy()
+    float_dtype = _get_float_dtype(float_dtype)
+    params = (tuple(ndays), float_dtype.name)
+
+    def _compute(prices):
+        # One extra row of overlap gives the first crossover of a block
+        return _get_blocked(lambda block: _compute_ma_crossover(block, ndays),
+                            prices, max(ndays), float_dtype)
+
+    if isinstance(security_df, security_panel):
+        if len(ndays) != 2:
+            raise Exception('Length of ndays must be 2.')
+        locs, prices = security_df._get_prices(securities, col_name)
+        _count('rows_processed', prices.size)
+        short_ma, long_ma, ma_diff, is_crossover, signals = _get_cached(
+            'ma_crossovers', params, prices,
+            lambda: _compute(pd.DataFrame(prices))
+        )
+        col_name = col_name.lower()
+        return security_df._add_fields(
+            locs, ['{}_{}d_ma'.format(col_name, n) for n in ndays]
+                  + ['ma_diff', 'crossover', 'ma_crossover_signal'],
+            [short_ma, long_ma, ma_diff, is_crossover, signals])
+
     if len(ndays) != 2:
         raise Exception('Length of ndays must be 2.')
+    output_df = _get_output_df(security_df, output)
 
     col_name = col_name.lower()
     securities = _listify_security(securities)
+    _count('rows_processed', len(security_df) * len(securities))
 
     for security in securities:
         # Add moving average
         security = security.lower()
         desired_col = '{}_{}'.format(col_name, security)
 
+        prices = security_df[desired_col]
+        short_ma, long_ma, ma_diff, is_crossover, signals = _get_cached(
+            'ma_crossovers', params, prices.values,
+            lambda: _compute(prices)
+        )
+
         # Create moving average columns
-        for n in ndays:
+        for n, ma in zip(ndays, [short_ma, long_ma]):
             ma_col = '{}_{}d_ma_{}'.format(col_name, n, security)
-            security_df[ma_col] = security_df[desired_col].rolling(n).mean()
-
-        short_ma_col_name = '{}_{}d_ma_{}'.format(col_name, ndays[0], security)
-        long_ma_col_name = '{}_{}d_ma_{}'.format(col_name, ndays[1], security)
-        short_ma = security_df[short_ma_col_name]
-        long_ma = security_df[long_ma_col_name]
+            output_df[ma_col] = ma
 
         ma_diff_col_name = 'ma_diff_{}'.format(security)
-        ma_diff = np.array(short_ma - long_ma)
-        security_df[ma_diff_col_name] = ma_diff
-
-        # Multiply successive ma_diffs. A sign change will equal -1.
-        ma_diff_prod = ma_diff[:-1] * ma_diff[1:]
-        # Account for missing entry
-        ma_diff_prod = [0] + ma_diff_prod.tolist()
+        output_df[ma_diff_col_name] = ma_diff
 
         # Equal to 1 if crossed over from previous day to current day,
         # i.e., the signs of ma_diff switches
         crossover_col_name = 'crossover_{}'.format(security)
-        security_df[crossover_col_name] = [_is_crossover(x)
-                                               for x in ma_diff_prod]
+        output_df[crossover_col_name] = is_crossover.astype(
+            int if float_dtype == np.float64 else np.int8)
 
         # Make a new variable signal_SECURITY which determines, based
         # off the moving average, whether to buy, sell or do nothing. We
         # buy when short_ma is larger than long_ma
         signal_col_name = 'ma_crossover_signal_{}'.format(security)
-        signal_cols = [crossover_col_name, short_ma_col_name, long_ma_col_name]
+        output_df[signal_col_name] = _format_signals(signals, signal_dtype)
 
-        security_df[signal_col_name] = security_df[signal_cols]\
-            .apply(lambda srs: _get_signal(srs, *signal_cols), axis=1)
+    return output_df
 
-    return security_df
 
+def _get_ma_bank(prices, ndays):
+    """Returns the simple moving averages of an array of shape (dates,
+    securities) for each window, as an array of shape (dates, windows,
+    securities). A window with a missing price is NaN, as for
+    pandas.DataFrame.rolling().mean().
 
-def generate_returns(security_df, securities, col_name):
+    Every window is the difference of two prefix sums. To keep the
+    rounding error of the differences close to that of a rolling sum,
+    the prefix sums restart at every block of block_len rows, which is
+    at least the longest window, so a window spans at most one block
+    boundary and adds the total of the block it starts in. Prices are
+    also taken relative to the first valid price of each security.
+    """
+    n_rows, n_cols = prices.shape
+    block_len = max(256, max(ndays))
+    n_blocks = n_rows // block_len + 1
+
+    is_nan = np.isnan(prices)
+    has_nan = is_nan.any()
+    if has_nan:
+        # The number of missing prices before each row
+        nan_counts = np.zeros((n_rows + 1, n_cols), dtype=np.int32)
+        np.cumsum(is_nan, axis=0, out=nan_counts[1:])
+
+    first_prices = pd.DataFrame(prices).bfill().values[0]
+    first_prices[np.isnan(first_prices)] = 0.
+    diffs = np.zeros((n_blocks * block_len, n_cols))
+    np.subtract(prices, first_prices, out=diffs[:n_rows])
+    if has_nan:
+        diffs[:n_rows][is_nan] = 0.
+
+    # sums[k] is the sum of diffs from the start of the block of row k up
+    # to, but not including, row k
+    diff_blocks = diffs.reshape(n_blocks, block_len, n_cols)
+    sums = np.empty_like(diffs)
+    sum_blocks = sums.reshape(n_blocks, block_len, n_cols)
+    sum_blocks[:, 0] = 0.
+    np.cumsum(diff_blocks[:, :-1], axis=1, out=sum_blocks[:, 1:])
+    block_totals = (sum_blocks[:, -1] + diff_blocks[:, -1])[:, None]
+
+    # window[k] is the sum of the window starting at row k
+    window = np.zeros_like(diffs)
+    window_blocks = window.reshape(n_blocks, block_len, n_cols)
+    ma_bank = np.empty((n_rows, len(ndays), n_cols))
+    for i, nday in enumerate(ndays):
+        ma_bank[:nday - 1, i] = np.nan
+        if nday > n_rows:
+            continue
+        n_windows = n_rows + 1 - nday
+        np.subtract(sums[nday:n_rows + 1], sums[:n_windows],
+                    out=window[:n_windows])
+        # Windows that end in the next block
+        window_blocks[:, block_len - nday:] += block_totals
+
+        means = window[:n_windows]
+        means /= nday
+        means += first_prices
+        if has_nan:
+            means[nan_counts[nday:] != nan_counts[:n_windows]] = np.nan
+        ma_bank[nday - 1:, i] = means
+
+    return ma_bank
+
+
+class ma_bank:
+    def __init__(self, security_df, securities, col_name, ndays,
+                 float_dtype='float64'):
+        """The simple moving averages of any number of windows for a set
+        of securities, computed together from one pass of prefix sums
+        over the prices.
+
+        Parameters
+        ----------
+        security_df : DataFrame
+            The merged DataFrame of security data
+        securities : str or list
+            The corresponding list of securities, ETFs, etc.
+        col_name : str
+            Close, Open, etc.
+        ndays : list of int
+            The moving average lengths
+        float_dtype : str, default 'float64'
+            The type of values: 'float64', or 'float32' to halve its
+            memory. float32 values are the float64 values rounded, and
+            get_crossover_matrix() compares the rounded values.
+
+        Attributes
+        ----------
+        values : 3D array
+            The moving averages, of shape (dates, windows, securities)
+        """
+        self.index = security_df.index
+        self.securities = [security.lower()
+                               for security in _listify_security(securities)]
+        self.col_name = col_name.lower()
+        self.ndays = list(ndays)
+        if len(self.ndays) == 0 or min(self.ndays) < 1:
+            raise ValueError('ndays must be a non-empty list of positive '
+                             'lengths.')
+        float_dtype = _get_float_dtype(float_dtype)
+        _count('rows_processed', len(security_df) * len(self.securities))
+
+        prices = security_df[['{}_{}'.format(self.col_name, security)
+                                  for security in self.securities]].values\
+            .astype(float)
+        self.values, = _get_cached(
+            'ma_bank', (tuple(self.ndays), float_dtype.name), prices,
+            lambda: _get_blocked(
+                lambda block: (_get_ma_bank(block, self.ndays),),
+                prices, max(self.ndays) - 1, float_dtype)
+        )
+
+    def to_frame(self):
+        """Returns the moving averages as a wide DataFrame with a
+        {col_name}_{nday}d_ma_{security} column for each window and
+        security, as in generate_ma_columns(). The DataFrame is a view of
+        values, so it is not copied."""
+        n_rows, n_windows, n_cols = self.values.shape
+        columns = ['{}_{}d_ma_{}'.format(self.col_name, nday, security)
+                       for nday in self.ndays
+                       for security in self.securities]
+        return pd.DataFrame(self.values.reshape(n_rows, n_windows * n_cols),
+                            index=self.index, columns=columns, copy=False)
+
+    def get_crossover_matrix(self):
+        """Returns the crossover signals of every pair of windows.
+
+        Returns
+        -------
+        pairs : list of tuple
+            The (first, second) window lengths of each pair, for every
+            first window before the second in ndays
+        signals : 3D array
+            int8 signal codes of shape (dates, pairs, securities). BUY
+            where the first moving average crosses above the second,
+            SELL where it crosses below and NO_SIGNAL elsewhere.
+        """
+        n_rows, n_windows, n_cols = self.values.shape
+        pairs = [(self.ndays[i], self.ndays[j])
+                     for i in xrange(n_windows)
+                     for j in xrange(i + 1, n_windows)]
+        signals = np.empty((n_rows, len(pairs), n_cols), dtype=np.int8)
+
+        # Compare each window against all of the windows after it at once.
+        # A crossover is a change between a positive and a negative
+        # difference, and its signal is the sign after the change.
+        pair_start = 0
+        for i in xrange(n_windows - 1):
+            pair_end = pair_start + n_windows - i - 1
+            ma_diff = self.values[:, i:i + 1] - self.values[:, i + 1:]
+            with np.errstate(invalid='ignore'):
+                signs = (ma_diff > 0).view(np.int8)\
+                    - (ma_diff < 0).view(np.int8)
+            pair_signals = signals[:, pair_start:pair_end]
+            pair_signals[0] = NO_SIGNAL
+            np.multiply(signs[1:], signs[1:] * signs[:-1] < 0,
+                        out=pair_signals[1:])
+            pair_start = pair_end
+
+        return pairs, signals
+
+
+@_profiled
+def generate_returns(security_df, securities, col_name, output='inplace',
+                     float_dtype='float64'):
     """Generates the returns of a given security.
 
     Parameters
     ----------
-    security_df : DataFrame
-        The merged DataFrame of security data
+    security_df : DataFrame or security_panel
+        The merged DataFrame of security data. If a security_panel is
+        given, every security is computed at once and a security_panel
+        with the new fields is returned.
     securities : list
         The corresponding list of securities, ETFs, etc.
     col_name : str
         Close, Open, etc.
+    output : str, default 'inplace'
+        'copy' to return a copy of security_df with the new columns,
+        'inplace' to add them to security_df itself, or 'columns' to
+        return a DataFrame of only the new columns. Ignored for a
+        security_panel.
+    float_dtype : str, default 'float64'
+        The type of the returns: 'float64', or 'float32' to halve their
+        memory. The returns are computed in float64 and only rounded
+        when stored, so they are within a relative 1e-7 of the float64
+        returns. A security_panel stores them in its own type.
 
     Returns
     -------
@@ -260,29 +1081,212 @@ def generate_returns(security_df, securities, col_name):
         DataFrame with the returns columns
     """
 
+    float_dtype = _get_float_dtype(float_dtype)
+
+    if isinstance(security_df, security_panel):
+        locs, prices = security_df._get_prices(securities, col_name)
+        _count('rows_processed', prices.size)
+        return security_df._add_fields(locs, ['returns'],
+                                       [_get_returns(prices, float_dtype)])
+
+    output_df = _get_output_df(security_df, output)
+
     # Get the first security name
     col_name = col_name.lower()
     securities = _listify_security(securities)
+    _count('rows_processed', len(security_df) * len(securities))
 
     for security in securities:
         security = security.lower()
         desired_column = '{}_{}'.format(col_name, security)
-        df_col = security_df[desired_column]
-        df_last_col = df_col.shift(1)
-
         returns_col_name = 'returns_{}'.format(security)
-        security_df[returns_col_name] = ((df_col - df_last_col)/df_last_col)
+        output_df[returns_col_name] = \
+            _get_returns(security_df[desired_column].values, float_dtype)
 
-    return security_df
+    return output_df
+
+
+def _get_returns(prices, float_dtype=np.float64):
+    """Returns the returns of a price array from the previous row, along
+    the first axis, so prices can be a single series or (dates,
+    securities). The first row is NaN. The returns are computed in
+    float64 and stored as float_dtype."""
+    def _compute(prices):
+        prices = np.asarray(prices, dtype=float)
+        returns = np.empty(prices.shape)
+        returns[:1] = np.nan
+        with np.errstate(invalid='ignore', divide='ignore'):
+            returns[1:] = (prices[1:] - prices[:-1]) / prices[:-1]
+        return returns,
+
+    returns, = _get_blocked(_compute, np.asarray(prices), 1, float_dtype)
+    return returns
+
+
+def _rsi_agg(security_array):
+    """Returns the RSI of a single window of prices. This is the
+    per-window reference implementation of the 'simple' method of
+    _get_rsi(), kept for comparison purposes.
+    """
+    # Get differences of the security
+    sec_diff = np.diff(security_array)
+    pos_array = sec_diff[sec_diff > 0]
+    neg_array = sec_diff[sec_diff < 0]
+
+    if len(pos_array) > 0:
+        pos_mean = pos_array.mean()
+    if len(neg_array) > 0:
+        neg_mean = -neg_array.mean()
+
+    if len(neg_array) == 0 and len(pos_array) == 0:
+        rsi = 50
+    elif len(neg_array) == 0 and len(pos_array) > 0:
+        rsi = 100
+    elif len(pos_array) == 0 and len(neg_array) > 0:
+        rsi = 0
+    else:
+        rsi = 100 - 100/(1 + float(pos_mean)/float(neg_mean))
+    return rsi
+
+
+def _get_wilder_averages(gains, losses, period):
+    """Returns Wilder's smoothed average gains and losses, seeded with the
+    mean of the first full window of period values.
+
+    Returns
+    -------
+    first : int
+        The position of the first average, or None if there is no full
+        window
+    avg_gains : array
+        The average gains from first onwards
+    avg_losses : array
+        The average losses from first onwards
+    """
+    seeds = pd.DataFrame({'gains': gains, 'losses': losses})\
+        .rolling(period).mean()
+    valid_seeds = np.flatnonzero(seeds['gains'].notnull().values)
+    if len(valid_seeds) == 0:
+        return None, None, None
+    first = valid_seeds[0]
+
+    smoothed = pd.DataFrame({'gains': gains[first:],
+                             'losses': losses[first:]})
+    smoothed.iloc[0] = seeds.iloc[first].values
+    smoothed = smoothed.ewm(alpha=1./period, adjust=False).mean()
+    return first, smoothed['gains'].values, smoothed['losses'].values
+
+
+def _get_rsi(prices, ndays, method='simple'):
+    """Returns the RSI of a price series as an array. The gains and
+    losses are computed once over the whole series, then averaged over
+    each window with rolling sums, so the cost is O(n) regardless of
+    ndays.
+
+    Parameters
+    ----------
+    prices : Series or array
+        The security prices, a single series or (dates, securities)
+    ndays : int
+        The number of days in each RSI window. A window of ndays prices
+        contains ndays - 1 price differences.
+    method : str, default 'simple'
+        'simple' averages the gains and the losses over the days on
+        which they occur, giving the values of _rsi_agg() applied to
+        each rolling window up to the rounding of the rolling sums,
+        i.e., within about 1e-10. 'wilder' uses Wilder's smoothing with a
+        period of ndays - 1, seeded with the mean of the first window.
+
+    Returns
+    -------
+    rsi : array
+        The RSI, NaN wherever the window is not yet full
+    """
 
+    if method not in ('simple', 'wilder'):
+        raise ValueError("method must be 'simple' or 'wilder'.")
+    if ndays < 2:
+        raise ValueError('ndays must be at least 2.')
 
-def generate_rsi_columns(security_df, securities, col_name, ndays, thresholds):
+    prices = np.asarray(prices, dtype=float)
+    if prices.ndim == 1:
+        return _get_rsi(prices[:, None], ndays, method=method)[:, 0]
+
+    rsi = np.full(prices.shape, np.nan)
+    if len(prices) < ndays:
+        return rsi
+
+    sec_diff = np.diff(prices, axis=0)
+    missing = np.isnan(sec_diff)
+    # Comparisons against NaN are False, and the missing differences
+    # are set back to NaN below
+    with np.errstate(invalid='ignore'):
+        gains = np.where(sec_diff > 0, sec_diff, 0.)
+        losses = np.where(sec_diff < 0, -sec_diff, 0.)
+        is_gain = sec_diff > 0
+        is_loss = sec_diff < 0
+    gains[missing] = np.nan
+    losses[missing] = np.nan
+    period = ndays - 1
+
+    if method == 'simple':
+        # Only the days with a gain (loss) count towards the mean gain
+        # (loss), so the number of such days is summed as well
+        n_gains = np.where(missing, np.nan, is_gain)
+        n_losses = np.where(missing, np.nan, is_loss)
+        gain_sums, loss_sums, n_gains, n_losses = [
+            pd.DataFrame(values).rolling(period).sum().values
+            for values in (gains, losses, n_gains, n_losses)
+        ]
+        no_gains = n_gains == 0
+        no_losses = n_losses == 0
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pos_mean = gain_sums / n_gains
+            neg_mean = loss_sums / n_losses
+            diff_rsi = 100 - 100/(1 + pos_mean/neg_mean)
+    else:
+        # Seed the averages with the mean of the first full window, then
+        # apply avg = ((period - 1) * avg + value) / period from there.
+        # Each security has its own first full window.
+        diff_rsi = np.full(sec_diff.shape, np.nan)
+        no_gains = np.zeros(sec_diff.shape, dtype=bool)
+        no_losses = np.zeros(sec_diff.shape, dtype=bool)
+        for j in xrange(sec_diff.shape[1]):
+            first, avg_gains, avg_losses = _get_wilder_averages(
+                gains[:, j], losses[:, j], period)
+            if first is None:
+                continue
+
+            # A smoothed average is only exactly zero when every value
+            # that went into it was zero
+            no_gains[first:, j] = avg_gains == 0
+            no_losses[first:, j] = avg_losses == 0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                diff_rsi[first:, j] = 100 - 100/(1 + avg_gains/avg_losses)
+
+    diff_rsi[no_losses & ~no_gains] = 100
+    diff_rsi[no_gains & ~no_losses] = 0
+    diff_rsi[no_gains & no_losses] = 50
+
+    # The first price has no difference before it
+    rsi[1:] = diff_rsi
+    rsi[np.isnan(prices)] = np.nan
+    return rsi
+
+
+@_profiled
+def generate_rsi_columns(security_df, securities, col_name, ndays, thresholds,
+                         method='simple', signal_dtype='str',
+                         output='copy', float_dtype='float64'):
     """Returns a DataFrame with the computed RSI.
 
     Parameters
     ----------
-    security_df : DataFrame
-        The merged DataFrame of security data
+    security_df : DataFrame or security_panel
+        The merged DataFrame of security data. If a security_panel is
+        given, every security is computed at once and a security_panel
+        with the new fields is returned.
     securities : list
         The corresponding list of securities, ETFs, etc.
     col_name : str
@@ -291,6 +1295,23 @@ def generate_rsi_columns(security_df, securities, col_name, ndays, thresholds):
         The number of days to use for computing the RSI
     thresholds : list
         List of integers representing the RSI thresholds
+    method : str, default 'simple'
+        'simple' for the mean gain and loss over the window, 'wilder'
+        for Wilder's smoothing
+    signal_dtype : str, default 'str'
+        The type of the signal column: 'str' for 'Buy', 'Sell' and
+        'N/A', 'int8' for BUY, SELL and NO_SIGNAL codes or 'category'
+    output : str, default 'copy'
+        'copy' to return a copy of security_df with the new columns,
+        'inplace' to add them to security_df itself, or 'columns' to
+        return a DataFrame of only the new columns. Ignored for a
+        security_panel.
+    float_dtype : str, default 'float64'
+        The type of the indicator values: 'float64', or 'float32' to
+        halve their memory. The values are still accumulated in float64
+        and only rounded when stored, so they are within a relative 1e-7
+        of the float64 values and the signals are the same. A
+        security_panel stores them in its own type.
 
     Returns
     -------
@@ -298,40 +1319,28 @@ def generate_rsi_columns(security_df, securities, col_name, ndays, thresholds):
         DataFrame with the new moving average columns
     """
 
-    def _get_rsi_signals(rsi_val, thresholds):
-        """Returns the RSI Buy and Sell signals based off thresholds."""
-        if rsi_val < thresholds[0]:
-            return 'Buy'
-        elif rsi_val > thresholds[1]:
-            return 'Sell'
-        else:
-            return 'N/A'
-
-    def _rsi_agg(security_array):
-        """Returns RSI."""
-        # Get differences of the security
-        sec_diff = np.diff(security_array)
-        pos_array = sec_diff[sec_diff > 0]
-        neg_array = sec_diff[sec_diff < 0]
-
-        if len(pos_array) > 0:
-            pos_mean = pos_array.mean()
-        if len(neg_array) > 0:
-            neg_mean = -neg_array.mean()
-
-        if len(neg_array) == 0 and len(pos_array) == 0:
-            rs = 50
-        elif len(neg_array) == 0 and len(pos_array) > 0:
-            rsi = 100
-        elif len(pos_array) == 0 and len(neg_array) > 0:
-            rsi = 0
-        else:
-            rsi = 100 - 100/(1 + float(pos_mean)/float(neg_mean))
-        return rsi
+    float_dtype = _get_float_dtype(float_dtype)
+    params = (ndays, tuple(thresholds), method, float_dtype.name)
+
+    def _compute(prices):
+        # Wilder's smoothing depends on every earlier price, so it is
+        # computed in one block
+        return _get_blocked(
+            lambda block: _compute_rsi(block, ndays, thresholds, method),
+            prices, ndays - 1 if method == 'simple' else None, float_dtype)
+
+    if isinstance(security_df, security_panel):
+        locs, prices = security_df._get_prices(securities, col_name)
+        _count('rows_processed', prices.size)
+        rsi, signals = _get_cached('rsi', params, prices,
+                                   lambda: _compute(prices))
+        return security_df._add_fields(locs, ['rsi', 'rsi_signal'],
+                                       [rsi, signals])
 
     col_name = col_name.lower()
     securities = _listify_security(securities)
-    security_df = security_df.copy()
+    output_df = _get_output_df(security_df, output)
+    _count('rows_processed', len(security_df) * len(securities))
 
     for security in securities:
         security = security.lower()
@@ -339,20 +1348,1340 @@ def generate_rsi_columns(security_df, securities, col_name, ndays, thresholds):
         rsi_col_name = 'rsi_{}'.format(security)
         signal_col_name = 'rsi_signal_{}'.format(security)
 
-        security_df[rsi_col_name] = security_df[desired_column]\
-            .rolling(ndays)\
-            .aggregate(_rsi_agg)
+        prices = security_df[desired_column]
+        rsi, signals = _get_cached('rsi', params, prices.values,
+                                   lambda: _compute(prices))
+        output_df[rsi_col_name] = rsi
+        output_df[signal_col_name] = _format_signals(signals, signal_dtype)
+
+    return output_df
+
+
+def _get_ewma_alpha(com=None, span=None, halflife=None, alpha=None):
+    """Returns the smoothing factor of an exponentially weighted moving
+    average from exactly one of com, span, halflife and alpha, as in
+    pandas.DataFrame.ewm()."""
+    n_given = sum(param is not None for param in (com, span, halflife, alpha))
+    if n_given != 1:
+        raise ValueError('Exactly one of com, span, halflife and alpha must '
+                         'be given.')
+    if com is not None:
+        return 1. / (1 + com)
+    elif span is not None:
+        return 2. / (span + 1)
+    elif halflife is not None:
+        return 1 - np.exp(np.log(0.5) / halflife)
+    return float(alpha)
+
+
+def _get_ewma_blocks(prices, alphas):
+    """Yields the exponentially weighted moving averages of an array of
+    shape (dates, securities) for each smoothing factor, one block of
+    rows at a time, as (start, end, ewmas) where ewmas has the shape
+    (alphas, end - start, securities) and is overwritten by the next
+    block. Matches pandas.DataFrame.ewm() with adjust=True, i.e.,
+    missing prices carry no weight but still age the prices before
+    them.
+
+    Within a block, the prices are scaled by decay**-k so that one cumsum
+    gives every weighted sum, and the block length keeps decay**-k below
+    about 1e150 for every smoothing factor.
+    """
+    n_rows, n_cols = prices.shape
+    is_valid = ~np.isnan(prices)
+    decays = [1. - alpha for alpha in alphas]
+
+    block_len = min([int(150 * np.log(10) / -np.log(decay))
+                     for decay in decays if decay != 0] or [n_rows])
+    block_len = max(1, min(block_len, 1 << 16, n_rows))
+    powers = np.arange(block_len, dtype=float)
+    with np.errstate(divide='ignore'):
+        growths = [(decay ** -powers)[:, None] for decay in decays]
+    shrinks = [(decay ** powers)[:, None] for decay in decays]
+
+    # The weighted sums of the prices and of the weights up to the end
+    # of the previous block
+    weighted_sums = np.zeros((len(alphas), n_cols))
+    weight_sums = np.zeros((len(alphas), n_cols))
+    # The latest valid prices, for a decay of zero
+    last_prices = np.full(n_cols, np.nan)
+    ewmas = np.empty((len(alphas), block_len, n_cols))
+
+    for start in xrange(0, n_rows, block_len):
+        end = min(start + block_len, n_rows)
+        n = end - start
+        block_valid = is_valid[start:end]
+        values = np.where(block_valid, prices[start:end], 0.)
+
+        for i, decay in enumerate(decays):
+            if decay == 0:
+                # Only the latest price has any weight
+                block_prices = np.vstack([last_prices, prices[start:end]])
+                ewmas[i, :n] = pd.DataFrame(block_prices).ffill().values[1:]
+                continue
+
+            growth = growths[i][:n]
+            shrink = shrinks[i][:n]
+            block_sums = shrink * (decay * weighted_sums[i]
+                                   + np.cumsum(values * growth, axis=0))
+            block_weights = shrink * (decay * weight_sums[i]
+                                      + np.cumsum(block_valid * growth,
+                                                  axis=0))
+            # No weight before the first valid price gives NaN
+            with np.errstate(invalid='ignore'):
+                np.divide(block_sums, block_weights, out=ewmas[i, :n])
+            weighted_sums[i] = block_sums[-1]
+            weight_sums[i] = block_weights[-1]
+
+        last_prices = np.where(block_valid[-1], prices[end - 1], last_prices)
+        yield start, end, ewmas[:, :n]
+
+
+def _get_ewmas(prices, alphas, float_dtype=np.float64):
+    """Returns the exponentially weighted moving averages of an array of
+    shape (dates, securities) for each smoothing factor, as an array of
+    shape (alphas, dates, securities) of float_dtype. See
+    _get_ewma_blocks()."""
+    ewmas = np.empty((len(alphas),) + prices.shape, dtype=float_dtype)
+    for start, end, block_ewmas in _get_ewma_blocks(prices, alphas):
+        ewmas[:, start:end] = block_ewmas
+    return ewmas
+
+
+def _compute_ewma_crossover(prices, spans, float_dtype=np.float64):
+    """Returns the EWMAs of an array of shape (dates, securities) for
+    each span, the difference of the first two, whether each date is a
+    crossover, and the signals as int8 codes. The EWMAs and their
+    difference are computed in float64 and stored as float_dtype."""
+    ewmas = np.empty((len(spans),) + prices.shape, dtype=float_dtype)
+    ewma_diff = np.empty(prices.shape, dtype=float_dtype)
+    is_crossover = np.empty(prices.shape, dtype=bool)
+    signals = np.empty(prices.shape, dtype=np.int8)
+
+    # The last difference of the previous block, for its crossovers
+    last_diff = np.full((1, prices.shape[1]), np.nan)
+    for start, end, block_ewmas in _get_ewma_blocks(
+            prices, [_get_ewma_alpha(span=span) for span in spans]):
+        ewmas[:, start:end] = block_ewmas
+        block_diff = block_ewmas[0] - block_ewmas[1]
+        ewma_diff[start:end] = block_diff
+        block_crossover = _get_crossovers(np.vstack([last_diff,
+                                                     block_diff]))[1:]
+        is_crossover[start:end] = block_crossover
+
+        # Buy when the short EWMA crosses above the long EWMA and sell
+        # when it crosses below
+        with np.errstate(invalid='ignore'):
+            signals[start:end] = _encode_signals(
+                block_crossover & (block_diff > 0),
+                block_crossover & (block_diff < 0))
+        last_diff = block_diff[-1:]
+    return ewmas, ewma_diff, is_crossover, signals
+
+
+@_profiled
+def generate_ewma_columns(security_df, securities, col_name, spans=[12, 26],
+                          signal_dtype='str', output='copy',
+                          float_dtype='float64'):
+    """Creates columns for exponentially weighted moving averages and
+    determines when there are crossovers. Every span is computed for all
+    securities together.
+
+    Parameters
+    ----------
+    security_df : DataFrame or security_panel
+        The merged DataFrame of security data. If a security_panel is
+        given, every security is computed at once and a security_panel
+        with the new fields is returned.
+    securities : str or list
+        The corresponding list of securities, ETFs, etc.
+    col_name : str
+        Close, Open, etc.
+    spans : list of float, default [12, 26]
+        The EWMA spans we want to generate, as for
+        pandas.DataFrame.ewm(). The crossovers are those of the first
+        span over the second.
+    signal_dtype : str, default 'str'
+        The type of the signal column: 'str' for 'Buy', 'Sell' and
+        'N/A', 'int8' for BUY, SELL and NO_SIGNAL codes or 'category'
+    output : str, default 'copy'
+        'copy' to return a copy of security_df with the new columns,
+        'inplace' to add them to security_df itself, or 'columns' to
+        return a DataFrame of only the new columns. Ignored for a
+        security_panel.
+    float_dtype : str, default 'float64'
+        The type of the indicator values: 'float64', or 'float32' to
+        halve their memory. The values are still accumulated in float64
+        and only rounded when stored, so they are within a relative 1e-7
+        of the float64 values, ewma_diff is within that of the EWMAs,
+        and the signals are the same. The crossover column is int8 for
+        float32. A security_panel stores the values in its own type.
+
+    Returns
+    -------
+    security_df : DataFrame
+        DataFrame with the new EWMA columns
+    """
+
+    if len(spans) < 2:
+        raise ValueError('spans must have at least 2 lengths.')
+    float_dtype = _get_float_dtype(float_dtype)
+    params = (tuple(spans), float_dtype.name)
+    if isinstance(security_df, security_panel):
+        locs, prices = security_df._get_prices(securities, col_name)
+        _count('rows_processed', prices.size)
+        ewmas, ewma_diff, is_crossover, signals = _get_cached(
+            'ewma_crossovers', params, prices,
+            lambda: _compute_ewma_crossover(prices, spans, float_dtype)
+        )
+        col_name = col_name.lower()
+        return security_df._add_fields(
+            locs, ['{}_{}d_ewma'.format(col_name, span) for span in spans]
+                  + ['ewma_diff', 'ewma_crossover', 'ewma_crossover_signal'],
+            list(ewmas) + [ewma_diff, is_crossover, signals])
+
+    output_df = _get_output_df(security_df, output)
+
+    col_name = col_name.lower()
+    securities = [security.lower()
+                      for security in _listify_security(securities)]
+    _count('rows_processed', len(security_df) * len(securities))
+
+    prices = security_df[['{}_{}'.format(col_name, security)
+                              for security in securities]].values\
+        .astype(float)
+    ewmas, ewma_diff, is_crossover, signals = _get_cached(
+        'ewma_crossovers', params, prices,
+        lambda: _compute_ewma_crossover(prices, spans, float_dtype)
+    )
+
+    for j, security in enumerate(securities):
+        for span, ewma in zip(spans, ewmas):
+            ewma_col = '{}_{}d_ewma_{}'.format(col_name, span, security)
+            output_df[ewma_col] = ewma[:, j]
+
+        output_df['ewma_diff_{}'.format(security)] = ewma_diff[:, j]
+
+        # Equal to 1 if the EWMAs crossed over from the previous day to
+        # the current day
+        output_df['ewma_crossover_{}'.format(security)] = \
+            is_crossover[:, j].astype(int if float_dtype == np.float64
+                                      else np.int8)
+
+        signal_col_name = 'ewma_crossover_signal_{}'.format(security)
+        output_df[signal_col_name] = _format_signals(signals[:, j],
+                                                     signal_dtype)
+
+    return output_df
+
+
+def _generate_indicator_columns(security_df, securities, col_name,
+                                indicators, signal_dtype,
+                                float_dtype='float64'):
+    """Adds the Bollinger band, MA crossover and RSI columns of indicators
+    to security_df in place, in that order."""
+    if 'bollinger_bands' in indicators:
+        bollinger_len, bollinger_std = indicators['bollinger_bands']
+        security_df = generate_bollinger_columns(security_df, securities,
+                                                 col_name, bollinger_len,
+                                                 bollinger_std,
+                                                 signal_dtype=signal_dtype,
+                                                 output='inplace',
+                                                 float_dtype=float_dtype)
+    if 'ma_crossovers' in indicators:
+        security_df = generate_ma_columns(security_df, securities, col_name,
+                                          indicators['ma_crossovers'],
+                                          signal_dtype=signal_dtype,
+                                          output='inplace',
+                                          float_dtype=float_dtype)
+    if 'rsi' in indicators:
+        ndays = indicators['rsi'][0]
+        thresholds = indicators['rsi'][1:]
+        security_df = generate_rsi_columns(security_df, securities, col_name,
+                                           ndays, thresholds,
+                                           signal_dtype=signal_dtype,
+                                           output='inplace',
+                                           float_dtype=float_dtype)
+    return security_df
+
+
+@_profiled
+def generate_columns_chunked(input_path, output_path, indicators,
+                             col_name='close', securities=None,
+                             memory_budget=256 * 1024 ** 2,
+                             signal_dtype='str', float_dtype='float64'):
+    """Computes indicator columns for a CSV file of merged security data
+    that does not fit in memory. The file is read in chunks, and each
+    chunk is written to output_path as soon as its columns are done.
+
+    Each chunk is preceded by the last rows of the chunk before it:
+    max(window) - 1 rows, plus one for the MA crossovers, which compare
+    each row with the one before. Every window therefore sees the same
+    prices as in a single in-memory run, and the output has the same
+    columns and missing values.
+
+    The values are not bit for bit those of an in-memory run. The
+    rolling means, standard deviations and sums of pandas add each
+    price as it enters the window and subtract it as it leaves, so
+    each value carries the rounding of every update since the start of
+    the run. A chunk starts its sums afresh, so its values carry less
+    of that rounding, not more: for a random walk of 50,000 daily
+    prices the Bollinger bands of an in-memory run are about 2e-8 from
+    the bands of each window computed on its own, against 1e-10 for
+    the chunks. Making the chunks match exactly would mean carrying the
+    sums from one chunk to the next, which pandas does not expose.
+    Expect the indicator values to match an in-memory run to a
+    relative 1e-9 or so, growing with the length of the file. The
+    signals and crossovers are the same unless a price or an MA
+    difference is within that rounding of a band or of zero.
+
+    Parameters
+    ----------
+    input_path : str
+        A CSV file in the layout of get_security_data(), with the dates
+        in the first column. Prices are read with
+        float_precision='round_trip', so prices written by to_csv() are
+        read back exactly.
+    output_path : str
+        The CSV file to write the input and indicator columns to. It is
+        replaced only once every chunk has been written.
+    indicators : dict
+        A dictionary of which indicators to use, in the same form as for
+        get_buy_sell_signals()
+
+        Possible Keys:
+        bollinger_bands : tuple
+            A 2-tuple representing the length and standard deviation of
+            the bollinger bands
+        ma_crossovers : tuple
+            A 2-tuple of the moving average crossover lengths
+        rsi : tuple
+            A 3-tuple of the form for the number of days and the RSI
+            thresholds
+    col_name : str, default 'close'
+        Close, Open, etc.
+    securities : list, default None
+        The securities to compute. If set to None, use every security in
+        the file.
+    memory_budget : int, default 256MB
+        The approximate peak memory, in bytes, of one chunk with its
+        indicator columns and the copies made while computing them
+    signal_dtype : str, default 'str'
+        The type of the signal columns, as for generate_ma_columns().
+        read_csv() reads 'N/A' back as NaN unless keep_default_na is
+        False, which 'int8' avoids.
+    float_dtype : str, default 'float64'
+        The type of the indicator values, as for generate_ma_columns().
+        float32 values are written with about 7 significant digits,
+        which makes the file smaller.
+
+    Returns
+    -------
+    n_rows : int
+        The number of rows written
+    """
+
+    unknown_indicators = set(indicators)\
+        - {'bollinger_bands', 'ma_crossovers', 'rsi'}
+    if unknown_indicators:
+        raise ValueError('Cannot compute indicators in chunks: {}.'
+                         .format(', '.join(sorted(unknown_indicators))))
+
+    header_df = pd.read_csv(input_path, index_col=0, nrows=0)
+    if securities is None:
+        securities = _get_security_names(header_df)
+    securities = [security.lower()
+                      for security in _listify_security(securities)]
+    col_name = col_name.lower()
+
+    # The rows of the previous chunk needed by the longest window, and
+    # the number of new columns per security
+    warmup_rows = 0
+    n_new_cols = 0
+    if 'bollinger_bands' in indicators:
+        warmup_rows = max(warmup_rows, indicators['bollinger_bands'][0] - 1)
+        n_new_cols += 3
+    if 'ma_crossovers' in indicators:
+        warmup_rows = max(warmup_rows, max(indicators['ma_crossovers']))
+        n_new_cols += 5
+    if 'rsi' in indicators:
+        warmup_rows = max(warmup_rows, indicators['rsi'][0] - 1)
+        n_new_cols += 2
+
+    # The columns are added in place, but reading, concatenating and the
+    # temporaries of each generate_* function take about as much again
+    # as the frame, so allow four times the output
+    row_bytes = 8 * (len(header_df.columns) + n_new_cols * len(securities))
+    chunk_rows = memory_budget // (4 * row_bytes) - warmup_rows
+    if chunk_rows < 1:
+        raise ValueError('memory_budget must fit more than {} rows.'
+                         .format(warmup_rows))
+
+    n_rows = [0]
+
+    def _write_chunks(f):
+        """Writes each chunk with its indicator columns to f."""
+        warmup_df = None
+        reader = pd.read_csv(input_path, index_col=0, parse_dates=True,
+                             float_precision='round_trip',
+                             chunksize=chunk_rows)
+        for chunk_df in reader:
+            n_chunk_rows = len(chunk_df)
+            if warmup_df is not None:
+                chunk_df = pd.concat([warmup_df, chunk_df])
+            if warmup_rows > 0:
+                warmup_df = chunk_df.iloc[-warmup_rows:]
+
+            chunk_df = _generate_indicator_columns(chunk_df, securities,
+                                                   col_name, indicators,
+                                                   signal_dtype, float_dtype)
+            chunk_df.iloc[-n_chunk_rows:].to_csv(f, header=n_rows[0] == 0)
+            n_rows[0] += n_chunk_rows
+
+    _save_atomic(output_path, _write_chunks)
+    return n_rows[0]
+
+
+def _is_code_field(field):
+    """Returns whether a panel field holds int8 codes rather than floats,
+    i.e., a signal or a crossover flag."""
+    return field.endswith('signal') or field.endswith('crossover')
+
+
+class security_panel:
+    def __init__(self, values, fields, index, securities, codes=None,
+                 code_fields=None):
+        """Security data stored as contiguous 3D arrays of shape (fields,
+        dates, securities), so that an indicator runs on every security
+        in one vectorized call. A field is a column of the wide layout
+        without its security name, e.g. 'close' for close_aapl or
+        'bollinger_signal' for bollinger_signal_aapl.
+
+        The generate_* functions accept a security_panel in place of a
+        DataFrame and return a new security_panel with the new fields.
+
+        Parameters
+        ----------
+        values : 3D array
+            The float fields, of shape (fields, dates, securities). They
+            are stored as float64, unless they are float32.
+        fields : list of str
+            The names of the float fields
+        index : DatetimeIndex
+            The dates
+        securities : list of str
+            The securities
+        codes : 3D array, default None
+            The int8 signal codes and crossover flags, of shape (code
+            fields, dates, securities)
+        code_fields : list of str, default None
+            The names of the code fields
+        """
+        values = np.asarray(values)
+        self.values = np.ascontiguousarray(
+            values, dtype=np.float32 if values.dtype == np.float32 else float)
+        self.fields = list(fields)
+        self.index = index
+        self.securities = [security.lower() for security in securities]
+        shape = (len(index), len(self.securities))
+        if codes is None:
+            codes = np.zeros((0,) + shape, dtype=np.int8)
+            code_fields = []
+        self.codes = np.ascontiguousarray(codes, dtype=np.int8)
+        self.code_fields = list(code_fields)
+
+        if self.values.shape != (len(self.fields),) + shape\
+                or self.codes.shape != (len(self.code_fields),) + shape:
+            raise ValueError('values and codes must have the shape (fields, '
+                             'dates, securities).')
+
+    @staticmethod
+    def from_frame(security_df, securities=None, float_dtype='float64'):
+        """Returns the security_panel of a DataFrame in the wide
+        '{field}_{security}' layout, e.g. from get_security_data(). A
+        field missing for a security is NaN, or NO_SIGNAL for a code
+        field.
+
+        Parameters
+        ----------
+        security_df : DataFrame
+            The merged DataFrame of security data
+        securities : list, default None
+            The securities. If set to None, they are read from the
+            column names as in _get_security_names().
+        float_dtype : str, default 'float64'
+            The type of the float fields, 'float64' or 'float32'. The
+            generate_* functions store their values in this type. float32
+            rounds the prices as well, so a signal can differ from the
+            float64 one where an indicator is within that rounding of
+            its threshold.
+        """
+        float_dtype = _get_float_dtype(float_dtype)
+        if securities is None:
+            securities = _listify_security(_get_security_names(security_df))
+        securities = [security.lower()
+                          for security in _listify_security(securities)]
+
+        # Field names in the order that they first appear
+        fields = []
+        columns = {}
+        for column in security_df.columns:
+            security = column.split('_')[-1].lower()
+            if security not in securities:
+                continue
+            field = _trim_security_name(column, column.split('_')[-1])
+            if field not in columns:
+                fields.append(field)
+                columns[field] = {}
+            columns[field][security] = column
+
+        def _get_field(field, dtype, fill_value, convert):
+            """Returns the (dates, securities) array of a field."""
+            array = np.full((len(security_df), len(securities)), fill_value,
+                            dtype=dtype)
+            for j, security in enumerate(securities):
+                column = columns[field].get(security)
+                if column is not None:
+                    array[:, j] = convert(security_df[column])
+            return array
+
+        def _to_codes(column):
+            """Returns a signal or crossover column as int8 codes."""
+            if column.dtype == object or hasattr(column, 'cat'):
+                codes = {_SIGNAL_STRS[code]: code for code in _SIGNAL_STRS}
+                return column.astype(object).map(codes).values
+            return column.values
+
+        value_fields = [field for field in fields
+                            if not _is_code_field(field)]
+        code_fields = [field for field in fields if _is_code_field(field)]
+        values = np.empty((len(value_fields), len(security_df),
+                           len(securities)), dtype=float_dtype)
+        for i, field in enumerate(value_fields):
+            values[i] = _get_field(field, float_dtype, np.nan,
+                                   lambda column: column.values)
+        codes = np.empty((len(code_fields), len(security_df),
+                          len(securities)), dtype=np.int8)
+        for i, field in enumerate(code_fields):
+            codes[i] = _get_field(field, np.int8, NO_SIGNAL, _to_codes)
+
+        return security_panel(values, value_fields, security_df.index,
+                              securities, codes, code_fields)
+
+    def to_frame(self, signal_dtype='str'):
+        """Returns the panel as a DataFrame in the wide
+        '{field}_{security}' layout, with the same column types as the
+        generate_* functions.
+
+        Parameters
+        ----------
+        signal_dtype : str, default 'str'
+            The type of the signal columns: 'str' for 'Buy', 'Sell' and
+            'N/A', 'int8' for BUY, SELL and NO_SIGNAL codes or 'category'
+        """
+        n_fields, n_rows, n_secs = self.values.shape
+        columns = ['{}_{}'.format(field, security)
+                       for security in self.securities
+                       for field in self.fields]
+        # Reorder to (dates, securities, fields) so that each security's
+        # columns are together
+        security_df = pd.DataFrame(
+            self.values.transpose(1, 2, 0).reshape(n_rows, n_secs * n_fields),
+            index=self.index, columns=columns
+        )
+        frames = [security_df]
+        for is_signal in (False, True):
+            field_locs = [i for i, field in enumerate(self.code_fields)
+                              if field.endswith('signal') == is_signal]
+            if not field_locs:
+                continue
+            columns = ['{}_{}'.format(self.code_fields[i], security)
+                           for security in self.securities
+                           for i in field_locs]
+            codes = self.codes[field_locs].transpose(1, 2, 0)\
+                .reshape(n_rows, n_secs * len(field_locs))
+            if not is_signal:
+                frames.append(pd.DataFrame(codes.astype(int),
+                                           index=self.index,
+                                           columns=columns))
+            elif signal_dtype == 'category':
+                # A Categorical is one dimensional
+                frames.append(pd.DataFrame(
+                    OrderedDict((column, _format_signals(codes[:, k],
+                                                         signal_dtype))
+                                for k, column in enumerate(columns)),
+                    index=self.index
+                ))
+            else:
+                frames.append(pd.DataFrame(_format_signals(codes,
+                                                           signal_dtype),
+                                           index=self.index,
+                                           columns=columns))
+        return pd.concat(frames, axis=1)
+
+    def get_field(self, field):
+        """Returns a field as a (dates, securities) array, which is a view
+        of the panel."""
+        if field in self.fields:
+            return self.values[self.fields.index(field)]
+        elif field in self.code_fields:
+            return self.codes[self.code_fields.index(field)]
+        raise KeyError(field)
+
+    def _get_prices(self, securities, col_name):
+        """Returns the securities' locations in the panel and their
+        (dates, securities) array of col_name."""
+        securities = [security.lower()
+                          for security in _listify_security(securities)]
+        locs = [self.securities.index(security) for security in securities]
+        prices = self.get_field(col_name.lower())
+        if locs != range(len(self.securities)):
+            prices = prices[:, locs]
+        return locs, prices
+
+    def _add_fields(self, locs, fields, arrays):
+        """Returns a new panel with the (dates, securities) arrays of
+        fields at locs added, or replacing the values at locs of existing
+        fields of the same name. The other securities keep their values,
+        or are NaN, or NO_SIGNAL for a code field, if the field is new."""
+        all_locs = locs == range(len(self.securities))
+
+        def _combine(old, names, new_fields, fill_value):
+            """Returns old with the new fields added and their names."""
+            names = list(names)
+            names += [field for field in new_fields if field not in names]
+            combined = np.empty((len(names),) + old.shape[1:],
+                                dtype=old.dtype)
+            combined[:len(old)] = old
+            _count('bytes_copied', old.nbytes)
+            for field in new_fields:
+                i = names.index(field)
+                if all_locs:
+                    combined[i] = arrays[fields.index(field)]
+                else:
+                    if i >= len(old):
+                        combined[i] = fill_value
+                    combined[i][:, locs] = arrays[fields.index(field)]
+            return combined, names
+
+        values, value_fields = _combine(
+            self.values, self.fields,
+            [field for field in fields if not _is_code_field(field)], np.nan)
+        codes, code_fields = _combine(
+            self.codes, self.code_fields,
+            [field for field in fields if _is_code_field(field)], NO_SIGNAL)
+        return security_panel(values, value_fields, self.index,
+                              self.securities, codes, code_fields)
+
+
+class streaming_sma(object):
+    """A simple moving average updated one price at a time in O(1), from
+    a ring buffer of the last ndays prices and their running sum. As with
+    pandas.DataFrame.rolling().mean(), the average is NaN while any of
+    the last ndays prices is missing (NaN).
+
+    Parameters
+    ----------
+    ndays : int
+        The number of days in the moving average
+    """
+
+    __slots__ = ('ndays', 'value', '_buffer', '_pos', '_count', '_sum',
+                 '_n_missing')
+
+    def __init__(self, ndays):
+        self.ndays = ndays
+        self.reset()
+
+    def reset(self):
+        """Clears all prices."""
+        self.value = np.nan
+        self._buffer = [0.] * self.ndays
+        self._pos = 0
+        self._count = 0
+        self._sum = 0.
+        # The number of NaN prices in the buffer, which are left out of
+        # the sum
+        self._n_missing = 0
+
+    def update(self, price):
+        """Adds a price and returns the moving average, which is NaN until
+        ndays prices have been added."""
+        old_price = self._buffer[self._pos]
+        if math.isnan(old_price):
+            self._n_missing -= 1
+        else:
+            self._sum -= old_price
+        if math.isnan(price):
+            self._n_missing += 1
+        else:
+            self._sum += price
+        self._buffer[self._pos] = price
+        self._pos += 1
+        if self._pos == self.ndays:
+            # Recompute the sum once per cycle so rounding errors from
+            # adding and removing prices do not build up
+            self._pos = 0
+            self._sum = sum(buffered_price for buffered_price in self._buffer
+                            if not math.isnan(buffered_price))
+        if self._count < self.ndays:
+            self._count += 1
+        if self._count == self.ndays and self._n_missing == 0:
+            self.value = self._sum / self.ndays
+        else:
+            self.value = np.nan
+        return self.value
+
+    def seed(self, prices):
+        """Resets and adds the last ndays prices of a series, e.g. a
+        column of get_security_data()."""
+        self.reset()
+        for price in np.asarray(prices, dtype=float)[-self.ndays:].tolist():
+            self.update(price)
+        return self.value
+
+
+class streaming_ewma(object):
+    """An exponentially weighted moving average updated one price at a
+    time in O(1). Exactly one of com, span, halflife and alpha must be
+    given, as for pandas.DataFrame.ewm(). As with ewm(ignore_na=False),
+    a missing (NaN) price leaves the average unchanged but still ages
+    the prices before it.
+
+    Parameters
+    ----------
+    com : float, default None
+        Decay in terms of center of mass
+    span : float, default None
+        Decay in terms of span
+    halflife : float, default None
+        Decay in terms of halflife
+    alpha : float, default None
+        Smoothing factor
+    adjust : bool, default True
+        Whether to divide by the decaying sum of the weights, as in
+        pandas.DataFrame.ewm()
+    """
+
+    __slots__ = ('alpha', 'adjust', 'value', '_weight_sum')
+
+    def __init__(self, com=None, span=None, halflife=None, alpha=None,
+                 adjust=True):
+        self.alpha = _get_ewma_alpha(com, span, halflife, alpha)
+        self.adjust = adjust
+        self.reset()
+
+    def reset(self):
+        """Clears all prices."""
+        self.value = np.nan
+        # The weight of the average so far relative to the next price,
+        # zero until the first price that is not missing
+        self._weight_sum = 0.
+
+    def update(self, price):
+        """Adds a price and returns the moving average."""
+        if self._weight_sum == 0.:
+            if not math.isnan(price):
+                self.value = price
+                self._weight_sum = 1.
+            return self.value
+
+        # The same steps as pandas, so the averages match to the bit
+        self._weight_sum *= 1. - self.alpha
+        if math.isnan(price):
+            return self.value
+        new_weight = 1. if self.adjust else self.alpha
+        self.value = (self._weight_sum * self.value + new_weight * price)\
+            / (self._weight_sum + new_weight)
+        if self.adjust:
+            self._weight_sum += new_weight
+        else:
+            self._weight_sum = 1.
+        return self.value
+
+    def seed(self, prices):
+        """Resets and adds every price of a series, e.g. a column of
+        get_security_data()."""
+        self.reset()
+        prices = np.asarray(prices, dtype=float)
+        is_valid = ~np.isnan(prices)
+        if not is_valid.any():
+            return self.value
+
+        self.value = float(pd.Series(prices)
+                               .ewm(alpha=self.alpha, adjust=self.adjust)
+                               .mean().iloc[-1])
+        # The weight of each price decays with its age
+        decay = 1. - self.alpha
+        ages = len(prices) - 1 - np.flatnonzero(is_valid)
+        if self.adjust:
+            self._weight_sum = float((decay ** ages).sum())
+        else:
+            self._weight_sum = decay ** ages[-1]
+        return self.value
+
+
+class streaming_ma_crossover(object):
+    """Moving average crossover signals updated one price at a time,
+    matching the ma_crossover_signal column of generate_ma_columns().
+    A window with a missing (NaN) price has no moving average, and so no
+    crossover.
+
+    Parameters
+    ----------
+    ndays : list of int
+        The short and long moving average lengths
+    """
+
+    __slots__ = ('short_ma', 'long_ma', 'value', 'signal')
+
+    def __init__(self, ndays):
+        if len(ndays) != 2:
+            raise Exception('Length of ndays must be 2.')
+        self.short_ma = streaming_sma(ndays[0])
+        self.long_ma = streaming_sma(ndays[1])
+        self.value = np.nan
+        self.signal = NO_SIGNAL
+
+    def reset(self):
+        """Clears all prices."""
+        self.short_ma.reset()
+        self.long_ma.reset()
+        self.value = np.nan
+        self.signal = NO_SIGNAL
+
+    def update(self, price):
+        """Adds a price and returns the short minus the long moving
+        average, and BUY, SELL or NO_SIGNAL."""
+        last_ma_diff = self.value
+        short_ma = self.short_ma.update(price)
+        long_ma = self.long_ma.update(price)
+        self.value = short_ma - long_ma
+
+        # A sign change of ma_diff is a crossover
+        if last_ma_diff * self.value < 0:
+            self.signal = BUY if short_ma > long_ma else SELL
+        else:
+            self.signal = NO_SIGNAL
+        return self.value, self.signal
+
+    def seed(self, prices):
+        """Resets and adds the prices of a series, e.g. a column of
+        get_security_data(). Only the last prices that affect the state
+        are used."""
+        self.reset()
+        n_prices = max(self.short_ma.ndays, self.long_ma.ndays) + 1
+        for price in np.asarray(prices, dtype=float)[-n_prices:].tolist():
+            self.update(price)
+        return self.value, self.signal
+
+
+class streaming_bollinger(object):
+    """Bollinger bands and signals updated one price at a time in O(1),
+    matching generate_bollinger_columns(). The rolling mean and standard
+    deviation are kept with Welford's algorithm over a ring buffer.
+    Missing (NaN) prices are skipped, so the bands are those of the last
+    bollinger_len prices that are not missing.
+
+    Parameters
+    ----------
+    bollinger_len : int
+        The number of days to use for the moving average
+    bollinger_std : float
+        The standard deviation of the Bollinger bands
+    """
+
+    __slots__ = ('bollinger_len', 'bollinger_std', 'value', 'signal',
+                 '_buffer', '_pos', '_count', '_mean', '_sq_dev_sum')
+
+    def __init__(self, bollinger_len, bollinger_std):
+        self.bollinger_len = bollinger_len
+        self.bollinger_std = bollinger_std
+        self.reset()
+
+    def reset(self):
+        """Clears all prices."""
+        self.value = (np.nan, np.nan)
+        self.signal = NO_SIGNAL
+        self._buffer = [0.] * self.bollinger_len
+        self._pos = 0
+        self._count = 0
+        self._mean = 0.
+        # The sum of squared deviations from the mean
+        self._sq_dev_sum = 0.
+
+    def update(self, price):
+        """Adds a price and returns the (high, low) Bollinger bands, and
+        BUY, SELL or NO_SIGNAL. A NaN price leaves the bands unchanged
+        and gives NO_SIGNAL."""
+        if math.isnan(price):
+            # A NaN would stay in the sums for good
+            self.signal = NO_SIGNAL
+            return self.value, self.signal
+
+        n = self.bollinger_len
+        if self._count < n:
+            self._count += 1
+            delta = price - self._mean
+            self._mean += delta / self._count
+            self._sq_dev_sum += delta * (price - self._mean)
+        else:
+            # Replace the oldest price in the window
+            old_price = self._buffer[self._pos]
+            old_mean = self._mean
+            self._mean += (price - old_price) / n
+            self._sq_dev_sum += (price - old_price)\
+                * (price - self._mean + old_price - old_mean)
+        self._buffer[self._pos] = price
+        self._pos = (self._pos + 1) % n
+
+        if self._count < n:
+            return self.value, self.signal
+
+        if self._pos == 0:
+            # Recompute the sums once per cycle so rounding errors from
+            # adding and removing prices do not build up
+            self._mean = math.fsum(self._buffer) / n
+            self._sq_dev_sum = math.fsum((buffered_price - self._mean) ** 2
+                                         for buffered_price in self._buffer)
+
+        rolling_std = math.sqrt(max(self._sq_dev_sum, 0.) / (n - 1))
+        bollinger_high = self._mean + self.bollinger_std * rolling_std
+        bollinger_low = self._mean - self.bollinger_std * rolling_std
+        self.value = (bollinger_high, bollinger_low)
+
+        if price < bollinger_low:
+            self.signal = BUY
+        elif price > bollinger_high:
+            self.signal = SELL
+        else:
+            self.signal = NO_SIGNAL
+        return self.value, self.signal
+
+    def seed(self, prices):
+        """Resets and adds the last bollinger_len prices of a series that
+        are not missing, e.g. a column of get_security_data()."""
+        self.reset()
+        prices = np.asarray(prices, dtype=float)
+        prices = prices[~np.isnan(prices)][-self.bollinger_len:]
+        for price in prices.tolist():
+            self.update(price)
+        return self.value, self.signal
+
+
+class streaming_rsi(object):
+    """The RSI and its signals updated one price at a time in O(1),
+    matching generate_rsi_columns(). As there, the RSI of a missing
+    (NaN) price is NaN, and so is that of any window with a missing
+    price for the 'simple' method. Wilder's averages are seeded from the
+    first window without a missing price and carried over later gaps.
+
+    Parameters
+    ----------
+    ndays : int
+        The number of days to use for computing the RSI
+    thresholds : list
+        List of integers representing the RSI thresholds
+    method : str, default 'simple'
+        'simple' or 'wilder', as for generate_rsi_columns()
+    """
+
+    __slots__ = ('ndays', 'thresholds', 'method', 'value', 'signal',
+                 '_last_price', '_buffer', '_pos', '_count', '_gain_sum',
+                 '_loss_sum', '_n_gains', '_n_losses', '_n_missing',
+                 '_avg_gain', '_avg_loss', '_weight')
+
+    def __init__(self, ndays, thresholds, method='simple'):
+        if method not in ('simple', 'wilder'):
+            raise ValueError("method must be 'simple' or 'wilder'.")
+        if ndays < 2:
+            raise ValueError('ndays must be at least 2.')
+        self.ndays = ndays
+        self.thresholds = thresholds
+        self.method = method
+        self.reset()
+
+    def reset(self):
+        """Clears all prices."""
+        self.value = np.nan
+        self.signal = NO_SIGNAL
+        self._last_price = None
+        # Ring buffer of the last ndays - 1 price differences
+        self._buffer = [0.] * (self.ndays - 1)
+        self._pos = 0
+        self._count = 0
+        self._gain_sum = 0.
+        self._loss_sum = 0.
+        self._n_gains = 0
+        self._n_losses = 0
+        # The number of NaN differences in the buffer
+        self._n_missing = 0
+        self._avg_gain = np.nan
+        self._avg_loss = np.nan
+        # The weight of Wilder's averages relative to the next difference
+        self._weight = 1.
+
+    def _set_value(self, gain_mean, loss_mean, has_gains, has_losses):
+        """Sets the RSI and signal from the mean gain and loss."""
+        if not has_gains and not has_losses:
+            self.value = 50.
+        elif not has_losses:
+            self.value = 100.
+        elif not has_gains:
+            self.value = 0.
+        else:
+            self.value = 100 - 100/(1 + gain_mean/loss_mean)
+
+        if self.value < self.thresholds[0]:
+            self.signal = BUY
+        elif self.value > self.thresholds[1]:
+            self.signal = SELL
+        else:
+            self.signal = NO_SIGNAL
+
+    def _set_missing(self):
+        """Sets a NaN RSI, which gives no signal."""
+        self.value = np.nan
+        self.signal = NO_SIGNAL
+
+    def update(self, price):
+        """Adds a price and returns the RSI, and BUY, SELL or
+        NO_SIGNAL."""
+        last_price = self._last_price
+        self._last_price = price
+        if last_price is None:
+            return self.value, self.signal
+
+        sec_diff = price - last_price
+        period = self.ndays - 1
+        if self.method == 'wilder' and not math.isnan(self._avg_gain):
+            # Wilder's smoothing once the first window is full, in the
+            # same steps as pandas.DataFrame.ewm(adjust=False). A missing
+            # difference only ages the averages.
+            alpha = 1. / period
+            self._weight *= 1 - alpha
+            if not math.isnan(sec_diff):
+                weight_sum = self._weight + alpha
+                self._avg_gain = (self._weight * self._avg_gain
+                                  + alpha * max(sec_diff, 0.)) / weight_sum
+                self._avg_loss = (self._weight * self._avg_loss
+                                  + alpha * max(-sec_diff, 0.)) / weight_sum
+                self._weight = 1.
+            if math.isnan(price):
+                self._set_missing()
+            else:
+                self._set_value(self._avg_gain, self._avg_loss,
+                                self._avg_gain != 0, self._avg_loss != 0)
+            return self.value, self.signal
+
+        # Replace the oldest difference in the window
+        if self._count == period:
+            old_diff = self._buffer[self._pos]
+            if math.isnan(old_diff):
+                self._n_missing -= 1
+            elif old_diff > 0:
+                self._gain_sum -= old_diff
+                self._n_gains -= 1
+            elif old_diff < 0:
+                self._loss_sum += old_diff
+                self._n_losses -= 1
+        else:
+            self._count += 1
+        if math.isnan(sec_diff):
+            self._n_missing += 1
+        elif sec_diff > 0:
+            self._gain_sum += sec_diff
+            self._n_gains += 1
+        elif sec_diff < 0:
+            self._loss_sum -= sec_diff
+            self._n_losses += 1
+        self._buffer[self._pos] = sec_diff
+        self._pos += 1
+        if self._pos == period:
+            # Recompute the sums once per cycle so rounding errors from
+            # adding and removing differences do not build up. NaN
+            # differences are neither gains nor losses.
+            self._pos = 0
+            self._gain_sum = sum(diff for diff in self._buffer if diff > 0)
+            self._loss_sum = -sum(diff for diff in self._buffer if diff < 0)
+
+        if self._count < period:
+            return self.value, self.signal
+        if self._n_missing > 0:
+            self._set_missing()
+            return self.value, self.signal
+
+        if self.method == 'wilder':
+            # The first full window seeds Wilder's averages
+            self._avg_gain = self._gain_sum / period
+            self._avg_loss = self._loss_sum / period
+            self._set_value(self._avg_gain, self._avg_loss,
+                            self._n_gains > 0, self._n_losses > 0)
+        else:
+            self._set_value(self._gain_sum / max(self._n_gains, 1),
+                            self._loss_sum / max(self._n_losses, 1),
+                            self._n_gains > 0, self._n_losses > 0)
+        return self.value, self.signal
+
+    def seed(self, prices):
+        """Resets and adds the prices of a series, e.g. a column of
+        get_security_data()."""
+        self.reset()
+        prices = np.asarray(prices, dtype=float)
+        period = self.ndays - 1
+        if self.method == 'wilder' and len(prices) > self.ndays:
+            # Wilder's averages depend on the whole history
+            sec_diff = np.diff(prices)
+            missing = np.isnan(sec_diff)
+            with np.errstate(invalid='ignore'):
+                gains = np.where(sec_diff > 0, sec_diff, 0.)
+                losses = np.where(sec_diff < 0, -sec_diff, 0.)
+            gains[missing] = np.nan
+            losses[missing] = np.nan
+            first, avg_gains, avg_losses = _get_wilder_averages(
+                gains, losses, period)
+            if first is not None:
+                self._last_price = float(prices[-1])
+                self._count = period
+                self._avg_gain = float(avg_gains[-1])
+                self._avg_loss = float(avg_losses[-1])
+                # Each missing difference since the last one has aged
+                # the averages
+                n_aged = len(sec_diff) - 1 - np.flatnonzero(~missing)[-1]
+                self._weight = (1 - 1. / period) ** n_aged
+                if math.isnan(self._last_price):
+                    self._set_missing()
+                else:
+                    self._set_value(self._avg_gain, self._avg_loss,
+                                    self._avg_gain != 0,
+                                    self._avg_loss != 0)
+                return self.value, self.signal
+
+        # Otherwise only the last window affects the state
+        for price in prices[-self.ndays:].tolist():
+            self.update(price)
+        return self.value, self.signal
+
+
+class datareader_provider:
+    def __init__(self, data_source='google'):
+        """Provides security data from pandas_datareader.
+
+        Parameters
+        ----------
+        data_source : str, default 'google'
+            The pandas_datareader data source
+        """
+        self.data_source = data_source
+
+    def get_data(self, security, start_date, end_date):
+        """Returns the DataFrame of a single security."""
+        return data.DataReader(security, data_source=self.data_source,
+                               start=start_date, end=end_date)
+
+
+class directory_provider:
+    def __init__(self, directory, file_format='csv'):
+        """Provides security data from a local directory with one file
+        per security, named after the ticker symbol, e.g. AAPL.csv. Each
+        file has a date column first, followed by the Open, High, Low,
+        Close and Volume columns.
+
+        Parameters
+        ----------
+        directory : str
+            The directory of security files
+        file_format : str, default 'csv'
+            'csv' or 'parquet'
+        """
+        if file_format not in ('csv', 'parquet'):
+            raise ValueError("file_format must be 'csv' or 'parquet'.")
+        self.directory = directory
+        self.file_format = file_format
+
+    def get_data(self, security, start_date, end_date):
+        """Returns the DataFrame of a single security."""
+        for name in (security, security.upper(), security.lower()):
+            file_path = os.path.join(self.directory,
+                                     '{}.{}'.format(name, self.file_format))
+            if os.path.exists(file_path):
+                break
+        else:
+            raise IOError('No {} file for {} in {}.'
+                          .format(self.file_format, security, self.directory))
+
+        if self.file_format == 'csv':
+            security_df = pd.read_csv(file_path, index_col=0, parse_dates=True)
+        else:
+            security_df = pd.read_parquet(file_path)
+            if not isinstance(security_df.index, pd.DatetimeIndex):
+                security_df = security_df.set_index(security_df.columns[0])
+                security_df.index = pd.to_datetime(security_df.index)
+
+        security_df = security_df.sort_index()
+        return security_df.loc[pd.Timestamp(start_date):pd.Timestamp(end_date)]
+
+
+class fetch_result:
+    def __init__(self, security_df, errors):
+        """The outcome of get_security_data() for several securities.
+
+        Parameters
+        ----------
+        security_df : DataFrame
+            The merged DataFrame of the securities that were fetched
+        errors : dict
+            The exception raised by the final attempt of each security
+            that could not be fetched
+        """
+        self.security_df = security_df
+        self.errors = errors
+
+    def get_failed_securities(self):
+        """Returns the securities that could not be fetched."""
+        return sorted(self.errors)
+
+
+@_profiled
+def align_security_data(df_list, how='outer', fill_method=None,
+                        fill_limit=None):
+    """Merges the DataFrames of several securities on a common calendar
+    in one pass. The calendar is built once and each security's columns
+    are written into one preallocated array per column type.
+
+    Parameters
+    ----------
+    df_list : list of DataFrame
+        The DataFrames of each security, indexed by date with unique
+        column names, e.g. from get_security_data()
+    how : str, default 'outer'
+        'outer' for the union of all dates, 'inner' for the dates common
+        to every security, or 'left' for the dates of the first security
+    fill_method : str, default None
+        None to leave the dates a security is missing as NaN, or 'ffill'
+        to carry its last value forward
+    fill_limit : int, default None
+        The maximum number of consecutive dates to forward fill
+
+    Returns
+    -------
+    security_df : DataFrame
+        The merged DataFrame of security data
+    """
 
-        security_df[signal_col_name] = security_df[rsi_col_name]\
-            .map(lambda s: _get_rsi_signals(s, thresholds))
+    if how not in ('outer', 'inner', 'left'):
+        raise ValueError("how must be 'outer', 'inner' or 'left'.")
+    if fill_method not in (None, 'ffill'):
+        raise ValueError("fill_method must be None or 'ffill'.")
 
+    first_index = df_list[0].index
+    is_aligned = all(df.index.equals(first_index) for df in df_list[1:])
+    if is_aligned or how == 'left':
+        calendar = first_index
+    else:
+        index_values = [df.index.values for df in df_list]
+        if how == 'outer':
+            calendar_values = np.unique(np.concatenate(index_values))
+        else:
+            calendar_values = index_values[0]
+            for values in index_values[1:]:
+                calendar_values = np.intersect1d(calendar_values, values)
+        calendar = pd.Index(calendar_values, name=first_index.name)
+
+    # The rows of the calendar that each DataFrame fills, or None for all
+    row_locs = []
+    for df in df_list:
+        if df.index.equals(calendar):
+            row_locs.append(None)
+        else:
+            row_locs.append(calendar.get_indexer(df.index))
+
+    # Each column keeps its type, as with DataFrame.join(), except that
+    # integers become floats where dates are missing. The columns of each
+    # type are written into one preallocated array.
+    blocks = OrderedDict()
+    for i, (df, row_loc) in enumerate(zip(df_list, row_locs)):
+        is_complete = row_loc is None\
+            or (row_loc >= 0).sum() == len(calendar)
+        for j, dtype in enumerate(df.dtypes):
+            if not is_complete and dtype.kind in 'iub':
+                dtype = np.dtype(float)
+            blocks.setdefault(dtype, OrderedDict()).setdefault(i, [])\
+                .append(j)
+
+    frames = []
+    for dtype, df_col_locs in blocks.iteritems():
+        n_cols = sum(len(col_locs) for col_locs in df_col_locs.itervalues())
+        block = np.empty((len(calendar), n_cols), dtype=dtype)
+        block_cols = []
+        for i, col_locs in df_col_locs.iteritems():
+            df = df_list[i]
+            block_start = len(block_cols)
+            block_end = block_start + len(col_locs)
+            if len(col_locs) == df.shape[1]:
+                values = df.values
+            else:
+                values = np.column_stack([df.iloc[:, j].values
+                                          for j in col_locs])
+            if row_locs[i] is None:
+                block[:, block_start:block_end] = values
+            else:
+                block[:, block_start:block_end] = np.nan
+                in_calendar = row_locs[i] >= 0
+                block[row_locs[i][in_calendar], block_start:block_end] =\
+                    values[in_calendar]
+            block_cols += [df.columns[j] for j in col_locs]
+        frames.append(pd.DataFrame(block, index=calendar, columns=block_cols))
+
+    columns = [col for df in df_list for col in df.columns]
+    if len(frames) == 1:
+        security_df = frames[0]
+    else:
+        security_df = pd.concat(frames, axis=1)[columns]
+    if fill_method == 'ffill':
+        security_df = security_df.fillna(method='ffill', limit=fill_limit)
     return security_df
 
 
+def _is_transient_error(provider, error):
+    """Returns whether a failed fetch may succeed if retried, i.e. a
+    connection error or timeout rather than, e.g., an unknown ticker. A
+    provider can decide for itself with an is_transient_error(error)
+    method."""
+    if hasattr(provider, 'is_transient_error'):
+        return provider.is_transient_error(error)
+    transient_errors = (socket.error,)
+    try:
+        import requests
+    except ImportError:
+        pass
+    else:
+        transient_errors += (requests.exceptions.ConnectionError,
+                             requests.exceptions.Timeout)
+    return isinstance(error, transient_errors)
+
+
+def _fetch_with_retry(provider, security, start_date, end_date, retries,
+                      backoff):
+    """Fetches a single security, retrying transient errors with
+    exponential backoff."""
+    for attempt in range(retries + 1):
+        try:
+            return provider.get_data(security, start_date, end_date)
+        except Exception as e:
+            if attempt == retries or not _is_transient_error(provider, e):
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+
+@_profiled
 def get_security_data(securities, start_date, end_date=None,
-                      data_source='google'):
+                      data_source='google', max_workers=8, retries=2,
+                      backoff=1.0, how='outer', fill_method=None,
+                      return_result=False):
     """Gets all securities in securities and merges them into a
-    DataFrame.
+    DataFrame. The securities are fetched concurrently, and a security
+    that cannot be fetched does not affect the others.
 
     Parameters
     ----------
@@ -362,13 +2691,34 @@ def get_security_data(securities, start_date, end_date=None,
     end_date : str, default None
         A string indicating the end date of our data. If set to None,
         then end_date will be set as date.today()
-    data_source : str, default 'google'
-        The source of the security data
+    data_source : str or provider, default 'google'
+        The source of the security data. Either a pandas_datareader data
+        source, or an object such as directory_provider with a
+        get_data(security, start_date, end_date) method. The object
+        may also have an is_transient_error(error) method to choose
+        which errors are retried.
+    max_workers : int, default 8
+        The number of securities to fetch at the same time
+    retries : int, default 2
+        The number of times to retry a security that fails with a
+        transient error, such as a connection error or timeout. Other
+        errors, such as an unknown ticker, are not retried.
+    backoff : float, default 1.0
+        The number of seconds to wait before the first retry. The wait
+        doubles with each retry.
+    how : str, default 'outer'
+        Which dates to keep when merging the securities. See
+        align_security_data().
+    fill_method : str, default None
+        None or 'ffill'. See align_security_data().
+    return_result : bool, default False
+        Whether to return a fetch_result, which also reports the
+        securities that failed, instead of the DataFrame
 
     Returns
     -------
     security_df : DataFrame
-        DataFrame with all security data
+        DataFrame with all security data that could be fetched
     """
 
     securities = _listify_security(securities)
@@ -376,29 +2726,55 @@ def get_security_data(securities, start_date, end_date=None,
     if end_date is None:
         end_date = date.today()
 
-    try:
-        df_list = [data.DataReader(security, data_source=data_source,
-                                   start=start_date, end=end_date)
-                       for security in securities]
-    except:
-        columns = ['open', 'high', 'low', 'close', 'volume']
-        columns = [s + '_' + security.lower() for s in columns]
-        return pd.DataFrame(columns=columns)
-
-    # Append security name to columns
-    for security, df in izip(securities, df_list):
-        df.columns = ['{}_{}'.format(col, security).lower()
-                          for col in df.columns]
-
-    security_df = df_list[0].copy()
-    for i in range(1, len(df_list)):
-        security_df = security_df.join(df_list[i])
+    if isinstance(data_source, basestring):
+        provider = datareader_provider(data_source)
+    else:
+        provider = data_source
+
+    df_dict = {}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers,
+                                                   len(securities)))) as executor:
+        futures = {executor.submit(_fetch_with_retry, provider, security,
+                                   start_date, end_date, retries,
+                                   backoff): security
+                       for security in securities}
+        for future in as_completed(futures):
+            security = futures[future]
+            try:
+                df_dict[security] = future.result()
+            except Exception as e:
+                errors[security] = e
+    _count('securities_fetched', len(df_dict))
+    _count('fetch_failures', len(errors))
+
+    # Append security name to columns, keeping the requested order
+    df_list = []
+    for security in securities:
+        if security in df_dict:
+            df = df_dict[security]
+            df.columns = ['{}_{}'.format(col, security).lower()
+                              for col in df.columns]
+            df_list.append(df)
+
+    if len(df_list) == 0:
+        columns = ['{}_{}'.format(col, security.lower())
+                       for security in securities
+                       for col in ['open', 'high', 'low', 'close', 'volume']]
+        security_df = pd.DataFrame(columns=columns)
+    else:
+        security_df = align_security_data(df_list, how=how,
+                                          fill_method=fill_method)
 
+    if return_result:
+        return fetch_result(security_df, errors)
     return security_df
 
 
+@_profiled
 def run_simulation(securities, col_name, start_date, end_date=None,
-                   data_source='google', data_store=None, **simulation_args):
+                   data_source='google', data_store=None, start_cash_amt=10000,
+                   **simulation_args):
     """Run a trading simulation for a list of securities. This is a
     wrapper around run_simulation_df(). Its purpose is to load the data,
     then run run_simulation_df() on it, so we do not need to load the
@@ -437,36 +2813,186 @@ def run_simulation(securities, col_name, start_date, end_date=None,
                                           data_source=data_source)
 
     else:
-        # Pull security data from data store. If they don't exist, then
-        # take from online
-        df_list = []
-        for sec in securities:
-            if sec.upper() in data_store.data_store_dict:
-                _df = data_store.load_security_data(sec,
-                                                    start_date,
-                                                    end_date,
-                                                   )
-            else:
-                _df = data_store.get_security_data(sec,
-                                                   start_date,
-                                                   end_date,
-                                                   data_source=data_source
-                                                  )
-            df_list.append(_df)
-
-        security_data = df_list[0].copy()
+        # Pull security data from data store. Any dates that are not
+        # stored are taken from online
+        df_list = [data_store.get_security_data(sec,
+                                                start_date,
+                                                end_date,
+                                                data_source=data_source
+                                               )
+                       for sec in securities]
 
-        for i in range(1, len(df_list)):
-            security_data = security_data.join(df_list[i])
+        security_data = align_security_data(df_list)
 
     port = run_simulation_df(security_data, col_name, start_cash_amt,
                              **simulation_args)
     return port
 
 
+def _simulate_trades(close, start_cash_amt, ma_diff=None, crossover=None,
+                     bollinger_high=None, bollinger_low=None,
+                     ewma_diff=None, ewma_crossover=None,
+                     bollinger_signal=None):
+    """Runs the buy and sell rules of run_simulation_df() over arrays of
+    shape (dates, securities) and records the trades in a preallocated
+    buffer.
+
+    Only the (date, security) pairs on which an indicator can trigger a
+    trade are visited, in the same order as a row by row loop over the
+    dates and securities.
+
+    Parameters
+    ----------
+    close : 2D array
+        The closing prices
+    start_cash_amt : float
+        Starting portfolio cash amount
+    ma_diff : 2D array, default None
+        The short minus the long moving average. Set to None if moving
+        average crossovers are not used.
+    crossover : 2D array, default None
+        1 where the moving averages cross over, 0 elsewhere
+    bollinger_high : 2D array, default None
+        The upper Bollinger band. Set to None if Bollinger bands are not
+        used.
+    bollinger_low : 2D array, default None
+        The lower Bollinger band
+    ewma_diff : 2D array, default None
+        The short minus the long EWMA. Set to None if EWMA crossovers are
+        not used.
+    ewma_crossover : 2D array, default None
+        1 where the EWMAs cross over, 0 elsewhere
+    bollinger_signal : 2D array, default None
+        The Bollinger signals as int8 codes, to use in place of
+        bollinger_high and bollinger_low. They are computed from the
+        bands before any rounding to float32.
+
+    Returns
+    -------
+    trades : dict of arrays
+        The row and security (column) index of each trade, the
+        trans_type as BUY or SELL, the number of shares, the security
+        price and the total cash amount after the trade
+    """
+
+    use_ma = ma_diff is not None
+    use_ewma = ewma_diff is not None
+    use_bollinger = bollinger_high is not None or bollinger_signal is not None
+
+    is_event = np.zeros(close.shape, dtype=bool)
+    with np.errstate(invalid='ignore'):
+        if use_ma:
+            is_event |= crossover == 1
+        if use_ewma:
+            is_event |= ewma_crossover == 1
+        if bollinger_signal is not None:
+            below_band = bollinger_signal == BUY
+            above_band = bollinger_signal == SELL
+            is_event |= below_band | above_band
+        elif use_bollinger:
+            below_band = close < bollinger_low
+            above_band = close > bollinger_high
+            is_event |= below_band | above_band
+
+    # Row-major order, i.e., every security for one date before the next
+    event_rows, event_secs = np.nonzero(is_event)
+    n_events = len(event_rows)
+
+    # Pull the values at each event into plain lists for the loop
+    prices = close[event_rows, event_secs].tolist()
+    if use_ma:
+        is_crossover = (crossover[event_rows, event_secs] == 1).tolist()
+        ma_diffs = ma_diff[event_rows, event_secs].tolist()
+    if use_ewma:
+        is_ewma_crossover = (ewma_crossover[event_rows, event_secs]
+                             == 1).tolist()
+        ewma_diffs = ewma_diff[event_rows, event_secs].tolist()
+    if use_bollinger:
+        is_below = below_band[event_rows, event_secs].tolist()
+        is_above = above_band[event_rows, event_secs].tolist()
+
+    # Each indicator makes at most one trade per event
+    max_trades = n_events * (int(use_ma) + int(use_ewma)
+                             + int(use_bollinger))
+    trade_rows = np.empty(max_trades, dtype=np.int64)
+    trade_secs = np.empty(max_trades, dtype=np.int64)
+    trade_types = np.empty(max_trades, dtype=np.int8)
+    trade_amounts = np.empty(max_trades, dtype=np.int64)
+    trade_prices = np.empty(max_trades, dtype=float)
+    trade_cash_amts = np.empty(max_trades, dtype=float)
+
+    n_secs = close.shape[1]
+    holdings = [0] * n_secs
+    bought = [False] * n_secs
+    cash_amt = start_cash_amt
+    purchase_price = 0
+    n_trades = 0
+
+    for k, row, sec in izip(xrange(n_events), event_rows.tolist(),
+                            event_secs.tolist()):
+        price = prices[k]
+        for indicator in ('ma_crossovers', 'ewma_crossovers',
+                          'bollinger_bands'):
+            if indicator == 'ma_crossovers':
+                if not use_ma or not is_crossover[k]:
+                    continue
+                buy = not bought[sec] and ma_diffs[k] > 0\
+                    and cash_amt > purchase_price
+                sell = bought[sec] and ma_diffs[k] < 0\
+                    and price > purchase_price
+            elif indicator == 'ewma_crossovers':
+                if not use_ewma or not is_ewma_crossover[k]:
+                    continue
+                buy = not bought[sec] and ewma_diffs[k] > 0\
+                    and cash_amt > purchase_price
+                sell = bought[sec] and ewma_diffs[k] < 0\
+                    and price > purchase_price
+            else:
+                if not use_bollinger:
+                    continue
+                buy = not bought[sec] and is_below[k]\
+                    and cash_amt > purchase_price
+                sell = bought[sec] and is_above[k]
+
+            if buy:
+                amount = int(np.floor(cash_amt/price))
+                if amount * price > cash_amt:
+                    raise Exception('You do not own enough cash to purchase this many securities.')
+                cash_amt -= amount * price
+                holdings[sec] += amount
+                bought[sec] = True
+                purchase_price = price
+                trade_type = BUY
+            elif sell:
+                amount = holdings[sec]
+                cash_amt += amount * price
+                holdings[sec] = 0
+                bought[sec] = False
+                trade_type = SELL
+            else:
+                continue
+
+            trade_rows[n_trades] = row
+            trade_secs[n_trades] = sec
+            trade_types[n_trades] = trade_type
+            trade_amounts[n_trades] = amount
+            trade_prices[n_trades] = price
+            trade_cash_amts[n_trades] = cash_amt
+            n_trades += 1
+
+    return {'row': trade_rows[:n_trades],
+            'security': trade_secs[:n_trades],
+            'trans_type': trade_types[:n_trades],
+            'amount': trade_amounts[:n_trades],
+            'security_price': trade_prices[:n_trades],
+            'total_cash_amt': trade_cash_amts[:n_trades]}
+
+
+@_profiled
 def run_simulation_df(security_data, col_name, start_cash_amt=10000,
                       indicators=dict(ma_crossovers=[5, 10]), verbose=True,
-                      plot_options=set(['transactions'])):
+                      plot_options=set(['transactions']), engine='array',
+                      float_dtype='float64'):
     """Runs a trading simulation on a DataFrame containing all of the
     security data information. This is designed to run on the output
     DataFrame of the get_security_data function.
@@ -476,7 +3002,8 @@ def run_simulation_df(security_data, col_name, start_cash_amt=10000,
     security_data : DataFrame
         A Pandas DataFrame with the relevant stock data
     col_name : str
-        Close, Open, etc.
+        Close, Open, etc. The indicators are computed from, and the
+        trades made at, these prices.
     start_cash_amt : int, default 10000
         Starting portfolio cash amount
     indicators : dict, default {'ma_crossovers': [5, 10]}
@@ -490,6 +3017,8 @@ def run_simulation_df(security_data, col_name, start_cash_amt=10000,
             the bollinger bands
         ma_crossovers : tuple
             A 2-tuple of the moving average crossover lengths
+        ewma_crossovers : tuple
+            A 2-tuple of the EWMA crossover spans
         rsi : tuple
             A 2-tuple of the RSI thresholds
     verbose : bool, default True
@@ -497,15 +3026,26 @@ def run_simulation_df(security_data, col_name, start_cash_amt=10000,
     plot_options : set
         A set of which plotting options. This option can take more than
         one option
-        Possible options: 'transactions', 'ma'
+        Possible options: 'transactions', 'ma', 'ewma', 'bollinger'
+    engine : str, default 'array'
+        'array' runs the trading rules over NumPy arrays of the
+        indicator columns. 'iterrows' runs them row by row over the
+        DataFrame, and is kept as a reference implementation.
+    float_dtype : str, default 'float64'
+        The type of the indicator columns, as for generate_ma_columns().
+        The prices and cash amounts stay float64, and the trades follow
+        the signal and crossover columns, which are worked out before
+        the indicators are rounded, so float32 gives the same trades.
     """
 
-    def _get_ma_crossovers_price(index, row, security, purchase_price):
+    def _get_ma_crossovers_price(index, row, security, purchase_price,
+                                 ma_diff_prefix='ma_diff_'):
         """Checks for MA crossovers, executes transaction if satisfies
-        criteria, and updates purchase_price."""
+        criteria, and updates purchase_price. ma_diff_prefix selects the
+        moving averages, e.g. 'ewma_diff_' for EWMA crossovers."""
 
-        close_col_name = 'close_' + security
-        ma_diff_col_name = 'ma_diff_' + security
+        close_col_name = '{}_{}'.format(col_name, security)
+        ma_diff_col_name = ma_diff_prefix + security
 
         # If ma_diff is positive on a crossover, then it is trending
         # upwards since 50d ma is smaller than 15d ma
@@ -535,12 +3075,13 @@ def run_simulation_df(security_data, col_name, start_cash_amt=10000,
         """Checks for bollinger criteria, executes transaction if
         passes, and updates purchase_price."""
 
-        close_col_name = 'close_{}'.format(security)
-        high_col_name = 'close_{}_bollinger_high'.format(security)
-        low_col_name = 'close_{}_bollinger_low'.format(security)
+        close_col_name = '{}_{}'.format(col_name, security)
+        # The signal compares the price to the bands before they are
+        # rounded to float_dtype
+        signal_col_name = 'bollinger_signal_{}'.format(security)
 
         if security not in bought_securities\
-                and row[close_col_name] < row[low_col_name]\
+                and row[signal_col_name] == BUY\
                 and sec_port.get_total_cash_amt() > purchase_price:
             # Buy securities
             sec_port.buy_max_securities(security,
@@ -550,7 +3091,7 @@ def run_simulation_df(security_data, col_name, start_cash_amt=10000,
             bought_securities.add(security)
             purchase_price = row[close_col_name]
         elif security in bought_securities\
-                and row[close_col_name] > row[high_col_name]:
+                and row[signal_col_name] == SELL:
                 # and row[close_col_name] > purchase_price:
             # Sell securities
             sec_port.sell_all_securities(security, 
@@ -576,6 +3117,14 @@ def run_simulation_df(security_data, col_name, start_cash_amt=10000,
                                                               purchase_price
                                                              )
 
+                ewma_crossover_col_name = 'ewma_crossover_' + security
+                if 'ewma_crossovers' in indicators\
+                        and row[ewma_crossover_col_name] == 1:
+                    purchase_price = _get_ma_crossovers_price(
+                        index, row, security, purchase_price,
+                        ma_diff_prefix='ewma_diff_'
+                    )
+
                 if 'bollinger_bands' in indicators:
                     purchase_price = _get_bollinger_price(index,
                                                           row,
@@ -583,6 +3132,35 @@ def run_simulation_df(security_data, col_name, start_cash_amt=10000,
                                                           purchase_price
                                                          )
 
+    def _run_simulation_arrays():
+        """Runs through the simulation with _simulate_trades()."""
+        def _get_array(col_format):
+            """Returns the (dates, securities) array of a column."""
+            return security_data[[col_format.format(security)
+                                      for security in securities]].values
+
+        kwargs = {}
+        if 'ma_crossovers' in indicators:
+            kwargs['ma_diff'] = _get_array('ma_diff_{}')
+            kwargs['crossover'] = _get_array('crossover_{}')
+        if 'ewma_crossovers' in indicators:
+            kwargs['ewma_diff'] = _get_array('ewma_diff_{}')
+            kwargs['ewma_crossover'] = _get_array('ewma_crossover_{}')
+        if 'bollinger_bands' in indicators:
+            kwargs['bollinger_signal'] = _get_array('bollinger_signal_{}')
+
+        trades = _simulate_trades(_get_array(col_name + '_{}'),
+                                  start_cash_amt,
+                                  **kwargs)
+        sec_port._add_transactions(
+            security_data.index[trades['row']],
+            np.array(securities, dtype=object)[trades['security']],
+            trades['trans_type'],
+            trades['amount'],
+            trades['security_price'],
+            trades['total_cash_amt']
+        )
+
     def _plot_simulation():
         """Plot the security and relevant simulation information."""
         for security in securities:
@@ -597,7 +3175,8 @@ def run_simulation_df(security_data, col_name, start_cash_amt=10000,
                     # Plot each moving average crossover
                     for i in xrange(len(ndays)):
                         day = ndays[i]
-                        ma_col_name = 'close_{}_{}d_ma'.format(security, day)
+                        ma_col_name = '{}_{}d_ma_{}'.format(col_name, day,
+                                                           security)
 
                         # Plot moving average columns
                         plt.plot(security_data.index,
@@ -605,11 +3184,24 @@ def run_simulation_df(security_data, col_name, start_cash_amt=10000,
                                  c=blues[i]
                                 )
 
-                if 'bollinger_std' in indicators\
+                if 'ewma_crossovers' in indicators and 'ewma' in plot_options:
+                    spans = indicators['ewma_crossovers']
+                    for i in xrange(len(spans)):
+                        ewma_col_name = '{}_{}d_ewma_{}'.format(col_name,
+                                                               spans[i],
+                                                               security)
+                        plt.plot(security_data.index,
+                                 security_data[ewma_col_name],
+                                 c=blues[i]
+                                )
+
+                if 'bollinger_bands' in indicators\
                         and 'bollinger' in plot_options:
                     # Get bollinger high and low column names
-                    high_col_name = 'close_{}_bollinger_high'.format(security)
-                    low_col_name = 'close_{}_bollinger_low'.format(security)
+                    high_col_name = '{}_bollinger_high_{}'.format(col_name,
+                                                                  security)
+                    low_col_name = '{}_bollinger_low_{}'.format(col_name,
+                                                                security)
 
                     # Plot bollinger bands
                     plt.plot(security_data.index, security_data[high_col_name],
@@ -618,38 +3210,287 @@ def run_simulation_df(security_data, col_name, start_cash_amt=10000,
                              c=black, linestyle='--', alpha=0.5)
 
         if 'transactions' in plot_options:
-            for row in sec_port.get_all_transactions().itertuples():
-                if row.trans_type == 'Buy':
-                    plt.axvline(x=row.date, label='Buy', linewidth=2.5,
-                                linestyle='--', c=red)
-                elif row.trans_type == 'Sell':
-                    plt.axvline(x=row.date, label='Sell', linewidth=2.5,
-                                linestyle='--', c=green)
-
-    securities = _get_security_names(security_data)
+            _plot_trade_lines(sec_port.get_all_transactions(),
+                              linewidths=2.5, linestyles='--')
+
+    if engine not in ('array', 'iterrows'):
+        raise ValueError("engine must be 'array' or 'iterrows'.")
+
+    securities = _listify_security(_get_security_names(security_data))
     col_name = col_name.lower()
+    # Copy security_data with the first indicator only, then add the
+    # others to that copy. The signal columns are not used, so keep
+    # them as int8 codes.
+    output = 'copy'
     if 'ma_crossovers' in indicators:
         security_data = generate_ma_columns(security_data,
                                             securities,
                                             col_name,
-                                            indicators['ma_crossovers']
+                                            indicators['ma_crossovers'],
+                                            signal_dtype='int8',
+                                            output=output,
+                                            float_dtype=float_dtype
                                            )
+        output = 'inplace'
+    if 'ewma_crossovers' in indicators:
+        security_data = generate_ewma_columns(security_data,
+                                              securities,
+                                              col_name,
+                                              indicators['ewma_crossovers'],
+                                              signal_dtype='int8',
+                                              output=output,
+                                              float_dtype=float_dtype
+                                             )
+        output = 'inplace'
     if 'bollinger_bands' in indicators:
         security_data = generate_bollinger_columns(security_data,
                                                    securities,
                                                    col_name,
                                                    indicators['bollinger_bands'][0],
-                                                   indicators['bollinger_bands'][1]
+                                                   indicators['bollinger_bands'][1],
+                                                   signal_dtype='int8',
+                                                   output=output,
+                                                   float_dtype=float_dtype
                                                   )
 
     sec_port = security_portfolio(start_cash_amt, verbose=verbose)
     bought_securities = set()
 
-    _run_simulation()
-    _plot_simulation()
+    with _stage('simulation'):
+        if engine == 'array':
+            _run_simulation_arrays()
+        else:
+            _run_simulation()
+    _count('trades_executed', sec_port._n_trans)
+    with _stage('plotting'):
+        _plot_simulation()
     return sec_port
 
 
+# Data shared by the sweep_simulation() tasks of a process. Each worker
+# process receives it once, through the pool initializer, rather than a
+# copy with every task.
+_sweep_data = {}
+
+
+def _init_sweep_worker(sweep_data):
+    """Sets the data shared by the sweep_simulation() tasks of this
+    process."""
+    _sweep_data.clear()
+    _sweep_data.update(sweep_data)
+
+
+def _run_sweep_pool_task(task):
+    """Runs a (task_key, securities, indicators, start_cash_amt) task of
+    sweep_simulation() in a worker process and returns the task_key with
+    the result."""
+    task_key, securities, indicators, start_cash_amt = task
+    return task_key, _run_sweep_task(securities, indicators, start_cash_amt)
+
+
+def _run_sweep_task(securities, indicators, start_cash_amt):
+    """Runs one simulation of sweep_simulation() from the shared rolling
+    results and returns its row of the result table."""
+    sec_idx = [_sweep_data['securities'].index(sec) for sec in securities]
+    rolling_means = _sweep_data['rolling_means']
+    rolling_stds = _sweep_data['rolling_stds']
+
+    kwargs = {}
+    if 'ma_crossovers' in indicators:
+        short_n, long_n = indicators['ma_crossovers']
+        ma_diff = rolling_means[short_n][:, sec_idx]\
+            - rolling_means[long_n][:, sec_idx]
+        kwargs['ma_diff'] = ma_diff
+        kwargs['crossover'] = _get_crossovers(ma_diff)
+    if 'bollinger_bands' in indicators:
+        bollinger_len, bollinger_std = indicators['bollinger_bands']
+        rolling_mean = rolling_means[bollinger_len][:, sec_idx]
+        rolling_std = rolling_stds[bollinger_len][:, sec_idx]
+        kwargs['bollinger_high'] = rolling_mean + bollinger_std * rolling_std
+        kwargs['bollinger_low'] = rolling_mean - bollinger_std * rolling_std
+
+    trades = _simulate_trades(_sweep_data['prices'][:, sec_idx],
+                              start_cash_amt, **kwargs)
+    sec_port = security_portfolio(start_cash_amt)
+    sec_port._add_transactions(
+        _sweep_data['index'][trades['row']],
+        np.array(securities, dtype=object)[trades['security']],
+        trades['trans_type'],
+        trades['amount'],
+        trades['security_price'],
+        trades['total_cash_amt']
+    )
+
+    avg_freq = sec_port.get_avg_transaction_freq()
+    return {'final_cash_amt': float(sec_port.get_last_sell_cash_amt()),
+            'n_trades': len(trades['row']),
+            'avg_transaction_freq': (None if pd.isnull(avg_freq)
+                                         else avg_freq.total_seconds())}
+
+
+def sweep_simulation(security_data, col_name, param_grid, universe=None,
+                     start_cash_amt=10000, max_workers=None,
+                     checkpoint_file=None):
+    """Runs run_simulation_df() for every combination of indicator
+    parameters across a process pool, without printing or plotting.
+
+    Each distinct rolling window in the grid is computed once, before
+    the pool starts, and shared by every simulation that uses it.
+
+    Parameters
+    ----------
+    security_data : DataFrame
+        A Pandas DataFrame with the relevant stock data, as for
+        run_simulation_df()
+    col_name : str
+        Close, Open, etc.
+    param_grid : dict
+        A dictionary of the same keys as the run_simulation_df()
+        indicators, where each value is a list of parameters to try,
+        e.g. {'ma_crossovers': [[5, 10], [5, 20]],
+              'bollinger_bands': [(15, 2.0), (20, 2.0)]}
+    universe : list, default None
+        A list of securities to simulate separately, where each item is a
+        security or a list of securities traded together. If set to
+        None, trade all securities in security_data together.
+    start_cash_amt : int, default 10000
+        Starting portfolio cash amount
+    max_workers : int, default None
+        The number of worker processes. If set to None, use the number
+        of CPUs. If set to 1, run in this process.
+    checkpoint_file : str, default None
+        A file to which each result is appended as it finishes. If the
+        file already exists, the simulations recorded in it are not run
+        again, so an interrupted sweep resumes where it stopped.
+
+    Returns
+    -------
+    results_df : DataFrame
+        One row per simulation, with the securities, the indicator
+        parameters, the final cash amount, the number of trades and the
+        average transaction frequency
+    """
+
+    unknown_indicators = set(param_grid) - {'ma_crossovers', 'bollinger_bands'}
+    if unknown_indicators:
+        raise ValueError('Cannot sweep indicators: {}.'
+                         .format(', '.join(sorted(unknown_indicators))))
+
+    all_securities = _listify_security(_get_security_names(security_data))
+    if universe is None:
+        universe = [all_securities]
+    # Cash is shared across a group, so trade each group in the column
+    # order of security_data, as run_simulation_df() does
+    universe = [sorted([sec.lower() for sec in _listify_security(secs)],
+                       key=all_securities.index)
+                    for secs in universe]
+    col_name = col_name.lower()
+
+    indicator_names = sorted(param_grid)
+    tasks = []
+    for secs in universe:
+        for params in product(*[param_grid[name] for name in indicator_names]):
+            indicators = dict(zip(indicator_names, params))
+            task_key = json.dumps([secs, indicators], sort_keys=True)
+            tasks.append((task_key, secs, indicators))
+
+    # Load the results of a previous, interrupted sweep. A process killed
+    # mid-write can leave a truncated last line, which is dropped (and its
+    # simulation run again) so that new results start on a line of their
+    # own.
+    results = {}
+    if checkpoint_file is not None and os.path.exists(checkpoint_file):
+        valid_size = 0
+        with open(checkpoint_file, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                if line.strip():
+                    try:
+                        record = json.loads(line.decode('utf-8'))
+                    except ValueError:
+                        break
+                    results[record['key']] = record['result']
+                valid_size += len(line)
+        if valid_size < os.path.getsize(checkpoint_file):
+            with open(checkpoint_file, 'r+b') as f:
+                f.truncate(valid_size)
+
+    # Compute each distinct rolling window once
+    ma_lens = set()
+    bollinger_lens = set()
+    for _, _, indicators in tasks:
+        if 'ma_crossovers' in indicators:
+            ma_lens.update(indicators['ma_crossovers'])
+        if 'bollinger_bands' in indicators:
+            bollinger_lens.add(indicators['bollinger_bands'][0])
+
+    price_df = security_data[['{}_{}'.format(col_name, sec)
+                                  for sec in all_securities]]
+    sweep_data = {
+        'securities': all_securities,
+        'index': security_data.index,
+        'prices': price_df.values,
+        'rolling_means': {n: price_df.rolling(n).mean().values
+                              for n in ma_lens | bollinger_lens},
+        'rolling_stds': {n: price_df.rolling(n).std().values
+                             for n in bollinger_lens}
+    }
+
+    pending = [task for task in tasks if task[0] not in results]
+    checkpoint = None
+    if checkpoint_file is not None:
+        checkpoint = open(checkpoint_file, 'a')
+
+    def _record_result(task_key, result):
+        """Stores a finished result and appends it to the checkpoint."""
+        results[task_key] = result
+        if checkpoint is not None:
+            checkpoint.write(json.dumps({'key': task_key,
+                                         'result': result}) + '\n')
+            checkpoint.flush()
+
+    try:
+        if max_workers == 1:
+            _init_sweep_worker(sweep_data)
+            for task_key, secs, indicators in pending:
+                _record_result(task_key, _run_sweep_task(secs, indicators,
+                                                         start_cash_amt))
+        elif pending:
+            pool = multiprocessing.Pool(max_workers,
+                                        initializer=_init_sweep_worker,
+                                        initargs=(sweep_data,))
+            try:
+                for task_key, result in pool.imap_unordered(
+                        _run_sweep_pool_task,
+                        [(task_key, secs, indicators, start_cash_amt)
+                             for task_key, secs, indicators in pending]):
+                    _record_result(task_key, result)
+            finally:
+                pool.terminate()
+                pool.join()
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+        _sweep_data.clear()
+
+    rows = []
+    for task_key, secs, indicators in tasks:
+        row = {'securities': ','.join(secs)}
+        for name in indicator_names:
+            row[name] = tuple(indicators[name])
+        row.update(results[task_key])
+        rows.append(row)
+
+    columns = ['securities'] + indicator_names\
+        + ['final_cash_amt', 'n_trades', 'avg_transaction_freq']
+    results_df = pd.DataFrame(rows, columns=columns)
+    results_df['avg_transaction_freq'] = pd.to_timedelta(
+        results_df['avg_transaction_freq'], unit='s')
+    return results_df
+
+
+@_profiled
 def get_buy_sell_signals(security, col_name, start_date, end_date=None,
                          show_plot=True, indicators={'ma_crossovers': [5, 10]},
                          signals=[], candlesticks=False, sec_colour=False,
@@ -681,6 +3522,8 @@ def get_buy_sell_signals(security, col_name, start_date, end_date=None,
             the bollinger bands
         ma_crossovers : tuple
             A 2-tuple of the moving average crossover lengths
+        ewma_crossovers : tuple
+            A 2-tuple of the EWMA crossover spans
         rsi : tuple
             A 3-tuple of the form for the number of days and the
             RSI thresholds
@@ -711,19 +3554,14 @@ def get_buy_sell_signals(security, col_name, start_date, end_date=None,
                                      end_date,
                                      data_source=data_source
                                     )
-        elif security.upper() not in data_store.data_store_dict:
-            # If a data store is specified, use that to get security data
-            return data_store.get_security_data(security.upper(),
-                                                start_date,
-                                                end_date,
-                                                data_source=data_source
-                                               )
         else:
-            # If the security is in the data store, load it from there
-            return data_store.load_security_data(security.upper(),
-                                                 start_date,
-                                                 end_date
-                                                )
+            # If a data store is specified, use that to get security
+            # data. It only downloads dates that it does not have. The
+            # stored data is shared, so copy it once here and let each
+            # indicator add its columns in place.
+            return _copy_df(data_store.get_security_data(
+                security.upper(), start_date, end_date,
+                data_source=data_source))
 
     security = security.lower()
     col_name = col_name.lower()
@@ -765,19 +3603,29 @@ def get_buy_sell_signals(security, col_name, start_date, end_date=None,
                                            bollinger_std=bollinger_std,
                                            candlesticks=candlesticks,
                                            sec_colour=sec_colour,
-                                           ax=next_ax
+                                           ax=next_ax,
+                                           inplace=True
                                           )
 
         signal_col_name = 'bollinger_signal_{}'.format(security)
         _plot_signals(security_df, signal_col_name, ax)
 
     if 'ewma_crossovers' in indicators:
-        indicators['ewma_crossovers']
+        spans = indicators['ewma_crossovers']
 
         if plot_size > 1:
             next_ax = ax[ax_counter]
             ax_counter += 1
-
+        security_df = plot_ewma_crossovers(security_df,
+                                           col_name,
+                                           start_date,
+                                           end_date,
+                                           spans=spans,
+                                           candlesticks=candlesticks,
+                                           sec_colour=sec_colour,
+                                           ax=next_ax,
+                                           inplace=True
+                                          )
 
     if 'ma_crossovers' in indicators:
         ndays = indicators['ma_crossovers']
@@ -792,7 +3640,8 @@ def get_buy_sell_signals(security, col_name, start_date, end_date=None,
                                          ndays=ndays,
                                          candlesticks=candlesticks,
                                          sec_colour=sec_colour,
-                                         ax=next_ax
+                                         ax=next_ax,
+                                         inplace=True
                                         )
 
     if 'rsi' in indicators:
@@ -803,27 +3652,25 @@ def get_buy_sell_signals(security, col_name, start_date, end_date=None,
             next_ax = ax[ax_counter]
             ax_counter += 1
         security_df = plot_rsi(security_df, col_name, start_date, end_date,
-                               ndays, thresholds, ax=next_ax)
+                               ndays, thresholds, ax=next_ax, inplace=True)
 
     return security_df
 
 
+@_profiled
 def plot_trades(sec_port):
     """Plots the trades."""
 
-    trans_df = sec_port.get_all_transactions()
-    for row in trans_df.itertuples():
-        if row.trans_type == 'Buy':
-            plt.axvline(row.date, linestyle='--', linewidth=3, color=red)
-        elif row.trans_type == 'Sell':
-            plt.axvline(row.date, linestyle='--', linewidth=3, color=green)
+    _plot_trade_lines(sec_port.get_all_transactions(), linestyles='--',
+                      linewidths=3)
 
 
+@_profiled
 def plot_bollinger_bands(security, col_name, start_date, end_date=None,
                          bollinger_len=15, bollinger_std=2.0,
                          candlesticks=False, sec_colour=black,
                          plot_dim=(12, 8), ax=None, data_source='google',
-                         **kwargs):
+                         lod=False, inplace=False, **kwargs):
     """Plots a security and its bollinger bands.
 
     Parameters
@@ -852,6 +3699,13 @@ def plot_bollinger_bands(security, col_name, start_date, end_date=None,
     ax : Matplotlib Axes
     data_source : str, default 'google'
         The source of the security data
+    lod : bool, default False
+        Whether to plot the lines with at most four points per pixel
+        column, and candlesticks with one candle per pixel column,
+        re-aggregated on zoom. See plot_lod_line().
+    inplace : bool, default False
+        Whether to add the indicator columns to security itself, if it
+        is a DataFrame, rather than to a copy
     kwargs : Matplotlib keyword arguments
     """
 
@@ -863,17 +3717,20 @@ def plot_bollinger_bands(security, col_name, start_date, end_date=None,
                                         data_source=data_source)
     elif isinstance(security, pd.DataFrame):
         security_name = _get_security_names(security)
-        security_df = security.copy()
+        security_df = security
     col_name = col_name.lower()
 
     if candlesticks and ax is None:
         raise ValueError('If candlesticks is True, then ax must be specified.')
 
+    # Fetched data is not shared, so it never needs to be copied
+    output = 'inplace' if inplace or isinstance(security, str) else 'copy'
     security_df = generate_bollinger_columns(security_df,
                                              security_name,
                                              col_name,
                                              bollinger_len=bollinger_len,
-                                             bollinger_std=bollinger_std
+                                             bollinger_std=bollinger_std,
+                                             output=output
                                             )
 
     price_col_name = '{}_{}'.format(col_name, security_name)
@@ -884,39 +3741,41 @@ def plot_bollinger_bands(security, col_name, start_date, end_date=None,
     # Plot the upper and lower bollinger bands
     if ax is not None:
         if candlesticks:
-            plot_candlesticks(security_df, ax, **kwargs)
+            plot_candlesticks(security_df, ax, lod=lod, **kwargs)
         else:
             if 'c' in kwargs:
-                ax.plot(security_df.index, security_df[price_col_name],
-                        **kwargs)
+                _plot_series(ax, security_df[price_col_name], lod, **kwargs)
             else:
-                ax.plot(security_df.index, security_df[price_col_name],
-                        c=black, **kwargs)
+                _plot_series(ax, security_df[price_col_name], lod,
+                             c=black, **kwargs)
 
-        ax.plot(security_df.index, security_df[bollinger_high_col],
-                c=black, linestyle='--', alpha=0.5)
-        ax.plot(security_df.index, security_df[bollinger_low_col],
-                c=black, linestyle='--', alpha=0.5)
+        _plot_series(ax, security_df[bollinger_high_col], lod,
+                     c=black, linestyle='--', alpha=0.5)
+        _plot_series(ax, security_df[bollinger_low_col], lod,
+                     c=black, linestyle='--', alpha=0.5)
         _plot_signals(security_df, signal_col_name, ax)
     else:
         plt.figure(figsize=plot_dim)
         if 'c' in kwargs:
-            plt.plot(security_df.index, security_df[price_col_name], **kwargs)
+            _plot_series(None, security_df[price_col_name], lod, **kwargs)
         else:
-            plt.plot(security_df.index, security_df[price_col_name], c=black,
-                     **kwargs)
-        plt.plot(security_df.index, security_df[bollinger_high_col],
-                 c=black, linestyle='--', alpha=0.5)
-        plt.plot(security_df.index, security_df[bollinger_low_col],
-                 c=black, linestyle='--', alpha=0.5)
+            _plot_series(None, security_df[price_col_name], lod, c=black,
+                         **kwargs)
+        _plot_series(None, security_df[bollinger_high_col], lod,
+                     c=black, linestyle='--', alpha=0.5)
+        _plot_series(None, security_df[bollinger_low_col], lod,
+                     c=black, linestyle='--', alpha=0.5)
         _plot_signals(security_df, signal_col_name)
 
     return security_df
 
 
+@_profiled
 def plot_ewma_crossovers(security, col_name, start_date, end_date=None,
-                         com=None, span=None, halflife=None, alpha=None,
-                         plot_dim=(12, 8), data_source='google', **kwargs):
+                         spans=[12, 26], candlesticks=False,
+                         sec_colour=black, plot_dim=(12, 8), ax=None,
+                         data_source='google', lod=False, inplace=False,
+                         **kwargs):
     """Plots a security and its exponentially weighted moving averages.
 
     Parameters
@@ -932,21 +3791,34 @@ def plot_ewma_crossovers(security, col_name, start_date, end_date=None,
     end_date : str, default None
         A string indicating the end date of our data. If set to None,
         then end_date will be set as date.today()
-    com : float, default None
-        Decay in terms of center of mass
-    span : float, default None
-        Decay in terms of span
-    halflife : float, default None
-        Decay in terms of halflife
-    alpha : float, default None
-        Smoothing factor
+    spans : tuple, default [12, 26]
+        A 2-tuple of the EWMA crossover spans. This replaces the com,
+        span, halflife and alpha parameters of a single EWMA.
+    candlesticks : bool, default False
+        Whether to plot candlesticks
+    sec_colour : 3-tuple, default black
+        The colour of the security price line
     plot_dim : tuple, default (12, 8)
         The dimensions of the plot
+    ax : Matplotlib Axes
     data_source : str, default 'google'
         The source of the security data
+    lod : bool, default False
+        Whether to plot the lines with at most four points per pixel
+        column, and candlesticks with one candle per pixel column,
+        re-aggregated on zoom. See plot_lod_line().
+    inplace : bool, default False
+        Whether to add the indicator columns to security itself, if it
+        is a DataFrame, rather than to a copy
     kwargs : Matplotlib keyword arguments
     """
 
+    # com, span and halflife were replaced by spans, and would otherwise
+    # be passed on to Matplotlib
+    removed_params = sorted(set(kwargs) & {'com', 'span', 'halflife'})
+    if removed_params:
+        raise ValueError('Pass the two EWMA spans as spans, not {}.'
+                         .format(', '.join(removed_params)))
     if not isinstance(security, (str, pd.DataFrame)):
         raise ValueError('security must be str or DataFrame.')
     if isinstance(security, str):
@@ -955,46 +3827,53 @@ def plot_ewma_crossovers(security, col_name, start_date, end_date=None,
                                         data_source=data_source)
     elif isinstance(security, pd.DataFrame):
         security_name = _get_security_names(security)
-        security_df = security.copy()
+        security_df = security
     col_name = col_name.lower()
 
-    security_df = generate_ma_columns(security_df, security_name, col_name,
-                                      ndays=ndays)
+    if candlesticks and ax is None:
+        raise ValueError('If candlesticks is True, then ax must be specified.')
+
+    # Fetched data is not shared, so it never needs to be copied
+    output = 'inplace' if inplace or isinstance(security, str) else 'copy'
+    security_df = generate_ewma_columns(security_df, security_name, col_name,
+                                        spans=spans, output=output)
     price_col_name = '{}_{}'.format(col_name, security_name)
     signal_col_name = 'ewma_crossover_signal_{}'.format(security_name)
 
     # Take the first and fourth blue colours so they are not too similar
-    ma_blues = [blues[0], blues[3]]
+    ewma_blues = [blues[0], blues[3]]
 
-    if 'ax' in kwargs:
-        ax = kwargs['ax']
-        ax.plot(security_df.index, security_df[price_col_name],
-                c=black)
+    if ax is not None:
+        if candlesticks:
+            plot_candlesticks(security_df, ax, lod=lod, **kwargs)
+        else:
+            if 'c' in kwargs:
+                _plot_series(ax, security_df[price_col_name], lod, **kwargs)
+            else:
+                _plot_series(ax, security_df[price_col_name], lod,
+                             c=black, **kwargs)
 
-        for colour, nday in izip(ma_blues, ndays):
-            ma_crossover_col = '{}_{}d_ma_{}'\
-                .format(col_name, nday, security_name)
-            ax.plot(security_df.index, security_df[ma_crossover_col],
-                    c=colour, alpha=0.8)
+        for colour, span in izip(ewma_blues, spans):
+            ewma_col = '{}_{}d_ewma_{}'.format(col_name, span, security_name)
+            _plot_series(ax, security_df[ewma_col], lod, c=colour, alpha=0.8)
         _plot_signals(security_df, signal_col_name, ax)
     else:
         plt.figure(figsize=plot_dim)
-        plt.plot(security_df.index, security_df[price_col_name],
-                 c=black)
-        for colour, nday in izip(ma_blues, ndays):
-            ma_crossover_col = '{}_{}d_ma_{}'\
-                .format(col_name, nday, security_name)
-            plt.plot(security_df.index, security_df[ma_crossover_col],
-                     c=colour, alpha=0.8)
-        _plot_signals(security_df, signal_col)
+        _plot_series(None, security_df[price_col_name], lod, c=black)
+        for colour, span in izip(ewma_blues, spans):
+            ewma_col = '{}_{}d_ewma_{}'.format(col_name, span, security_name)
+            _plot_series(None, security_df[ewma_col], lod, c=colour,
+                         alpha=0.8)
+        _plot_signals(security_df, signal_col_name)
 
     return security_df
 
 
+@_profiled
 def plot_ma_crossovers(security, col_name, start_date, end_date=None,
                        ndays=[5, 15], candlesticks=False, sec_colour=black,
                        plot_dim=(12, 8), ax=None, data_source='google',
-                       **kwargs):
+                       lod=False, inplace=False, **kwargs):
     """Plots a security and its moving averages.
 
     Parameters
@@ -1021,6 +3900,13 @@ def plot_ma_crossovers(security, col_name, start_date, end_date=None,
     ax : Matplotlib Axes
     data_source : str, default 'google'
         The source of the security data
+    lod : bool, default False
+        Whether to plot the lines with at most four points per pixel
+        column, and candlesticks with one candle per pixel column,
+        re-aggregated on zoom. See plot_lod_line().
+    inplace : bool, default False
+        Whether to add the indicator columns to security itself, if it
+        is a DataFrame, rather than to a copy
     kwargs : Matplotlib keyword arguments
     """
 
@@ -1032,14 +3918,16 @@ def plot_ma_crossovers(security, col_name, start_date, end_date=None,
                                         data_source=data_source)
     elif isinstance(security, pd.DataFrame):
         security_name = _get_security_names(security)
-        security_df = security.copy()
+        security_df = security
     col_name = col_name.lower()
 
     if candlesticks and ax is None:
         raise ValueError('If candlesticks is True, then ax must be specified.')
 
+    # Fetched data is not shared, so it never needs to be copied
+    output = 'inplace' if inplace or isinstance(security, str) else 'copy'
     security_df = generate_ma_columns(security_df, security_name, col_name,
-                                      ndays=ndays)
+                                      ndays=ndays, output=output)
     price_col_name = '{}_{}'.format(col_name, security_name)
     signal_col_name = 'ma_crossover_signal_{}'.format(security_name)
 
@@ -1048,37 +3936,268 @@ def plot_ma_crossovers(security, col_name, start_date, end_date=None,
 
     if ax is not None:
         if candlesticks:
-            plot_candlesticks(security_df, ax, **kwargs)
+            plot_candlesticks(security_df, ax, lod=lod, **kwargs)
         else:
             if 'c' in kwargs:
-                ax.plot(security_df.index, security_df[price_col_name],
-                        **kwargs)
+                _plot_series(ax, security_df[price_col_name], lod, **kwargs)
             else:
-                ax.plot(security_df.index, security_df[price_col_name],
-                        c=black, **kwargs)
+                _plot_series(ax, security_df[price_col_name], lod,
+                             c=black, **kwargs)
 
         for colour, nday in izip(ma_blues, ndays):
             ma_crossover_col = '{}_{}d_ma_{}'\
                 .format(col_name, nday, security_name)
-            ax.plot(security_df.index, security_df[ma_crossover_col],
-                    c=colour, alpha=0.8)
+            _plot_series(ax, security_df[ma_crossover_col], lod,
+                         c=colour, alpha=0.8)
         _plot_signals(security_df, signal_col_name, ax)
     else:
         plt.figure(figsize=plot_dim)
-        plt.plot(security_df.index, security_df[price_col_name],
-                 c=black)
+        _plot_series(None, security_df[price_col_name], lod, c=black)
         for colour, nday in izip(ma_blues, ndays):
             ma_crossover_col = '{}_{}d_ma_{}'\
                 .format(col_name, nday, security_name)
-            plt.plot(security_df.index, security_df[ma_crossover_col],
-                     c=colour, alpha=0.8)
+            _plot_series(None, security_df[ma_crossover_col], lod,
+                         c=colour, alpha=0.8)
         _plot_signals(security_df, signal_col_name)
 
     return security_df
 
 
+class lod_pyramid:
+    def __init__(self, x, open_, high, low, close, min_bins=256):
+        """A multi-resolution pyramid of a series of bars for level of
+        detail plotting. Level 0 holds the bars themselves and each level
+        above merges pairs of bins of the level below, keeping the first
+        open, the highest high, the lowest low and the last close along
+        with their x positions. Bin j of level k covers bars j*2**k to
+        (j+1)*2**k - 1.
+
+        A line is a series of bars with the same open, high, low and
+        close, so its bins keep the first, last, minimum and maximum
+        point of each pixel column.
+
+        Parameters
+        ----------
+        x : array
+            The increasing x positions, e.g. Matplotlib date numbers
+        open_, high, low, close : array
+            The bar values
+        min_bins : int, default 256
+            Levels are added until one has at most min_bins bins
+        """
+        x = np.asarray(x, dtype=float)
+        level = {'x_first': x, 'open': np.asarray(open_, dtype=float),
+                 'x_high': x, 'high': np.asarray(high, dtype=float),
+                 'x_low': x, 'low': np.asarray(low, dtype=float),
+                 'x_last': x, 'close': np.asarray(close, dtype=float)}
+        self.levels = [level]
+        while len(level['x_first']) > min_bins:
+            level = self._merge_pairs(level)
+            self.levels.append(level)
+
+    @staticmethod
+    def _merge_pairs(level):
+        """Returns the next level up, where bin j merges bins 2j and
+        2j+1. An odd last bin is merged with itself."""
+        n_bins = len(level['x_first'])
+        first = np.arange(0, n_bins, 2)
+        second = np.minimum(first + 1, n_bins - 1)
+
+        # Skip missing values, like a security that did not trade for
+        # part of a bin
+        with np.errstate(invalid='ignore'):
+            take_second = {
+                'open': np.isnan(level['open'][first]),
+                'high': (level['high'][second] > level['high'][first])
+                        | np.isnan(level['high'][first]),
+                'low': (level['low'][second] < level['low'][first])
+                       | np.isnan(level['low'][first]),
+                'close': ~np.isnan(level['close'][second]),
+            }
+        merged = {}
+        for value_name, x_name in [('open', 'x_first'), ('high', 'x_high'),
+                                   ('low', 'x_low'), ('close', 'x_last')]:
+            locs = np.where(take_second[value_name], second, first)
+            merged[value_name] = level[value_name][locs]
+            merged[x_name] = level[x_name][locs]
+        return merged
+
+    def get_bins(self, x_start, x_end, n_pixels):
+        """Returns the level and the bins of the coarsest level that has
+        at most n_pixels bins between x_start and x_end, plus one bin on
+        either side so that lines continue off the edges.
+
+        Returns
+        -------
+        level : int
+        bins : dict of arrays
+            x_first, open, x_high, high, x_low, low, x_last and close
+        """
+        x = self.levels[0]['x_first']
+        start_loc = x.searchsorted(x_start, side='left')
+        end_loc = x.searchsorted(x_end, side='right')
+        n_visible = max(end_loc - start_loc, 1)
+
+        level = int(np.ceil(np.log2(max(n_visible / float(max(n_pixels, 1)),
+                                        1))))
+        level = min(level, len(self.levels) - 1)
+        bins = self.levels[level]
+        bin_start = max((start_loc >> level) - 1, 0)
+        bin_end = min(((max(end_loc, 1) - 1) >> level) + 2,
+                      len(bins['x_first']))
+        return level, {name: values[bin_start:bin_end]
+                       for name, values in bins.items()}
+
+    def get_line(self, x_start, x_end, n_pixels):
+        """Returns the x and y of a line through the first, the extreme
+        and the last points of each bin between x_start and x_end, in x
+        order, so that no peak or trough is lost."""
+        level, bins = self.get_bins(x_start, x_end, n_pixels)
+        if level == 0:
+            return bins['x_first'], bins['close']
+
+        high_first = bins['x_high'] <= bins['x_low']
+        x = np.column_stack([
+            bins['x_first'],
+            np.where(high_first, bins['x_high'], bins['x_low']),
+            np.where(high_first, bins['x_low'], bins['x_high']),
+            bins['x_last'],
+        ]).ravel()
+        y = np.column_stack([
+            bins['open'],
+            np.where(high_first, bins['high'], bins['low']),
+            np.where(high_first, bins['low'], bins['high']),
+            bins['close'],
+        ]).ravel()
+        return x, y
+
+
+def _get_plot_x(index, ax):
+    """Returns the x positions of an index for plotting. A
+    DatetimeIndex is converted to Matplotlib date numbers without
+    creating a datetime per row, and the x-axis is set to dates."""
+    if isinstance(index, pd.DatetimeIndex):
+        ax.xaxis_date()
+        epoch = mdates.date2num(pd.Timestamp('1970-01-01').to_pydatetime())
+        return index.asi8 / (24 * 60 * 60 * 1e9) + epoch
+    return np.asarray(index, dtype=float)
+
+
+def _connect_lod(ax, update_func):
+    """Calls update_func() now and whenever the x limits of ax change,
+    e.g. on zoom or pan."""
+    def _on_xlim_changed(changed_ax):
+        update_func()
+    ax.callbacks.connect('xlim_changed', _on_xlim_changed)
+    update_func()
+
+
+def plot_lod_line(x, y, ax=None, min_bins=256, **kwargs):
+    """Plots a long series as a line with at most four points per pixel
+    column: the first, the minimum, the maximum and the last. The line
+    is rebuilt from a lod_pyramid whenever the x limits change, so
+    zooming in shows more detail.
+
+    Parameters
+    ----------
+    x : Index or array
+        The x values, e.g. a DatetimeIndex
+    y : Series or array
+        The y values
+    ax : Matplotlib Axes, default None
+        If set to None, use the current Axes
+    min_bins : int, default 256
+        See lod_pyramid
+    kwargs : Matplotlib keyword arguments
+
+    Returns
+    -------
+    line : Line2D
+    """
+
+    if ax is None:
+        ax = plt.gca()
+    y = np.asarray(y, dtype=float)
+    pyramid = lod_pyramid(_get_plot_x(x, ax), y, y, y, y, min_bins=min_bins)
+
+    # Plot the full range first so that the data limits include every
+    # extreme
+    n_pixels = int(ax.bbox.width)
+    line, = ax.plot(*pyramid.get_line(-np.inf, np.inf, n_pixels), **kwargs)
+
+    def _update():
+        x_start, x_end = ax.get_xlim()
+        line.set_data(*pyramid.get_line(x_start, x_end, int(ax.bbox.width)))
+    _connect_lod(ax, _update)
+    return line
+
+
+def _plot_lod_candlesticks(security_df, ax, width, colour_up, colour_down,
+                           alpha):
+    """Plots candlesticks with at most one candle per pixel column, as a
+    LineCollection of wicks and a PolyCollection of bodies that are
+    rebuilt from a lod_pyramid whenever the x limits change. Each
+    candle's width is width times the number of bars it merges."""
+    ohlc = security_df.iloc[:, :4].values
+    pyramid = lod_pyramid(_get_plot_x(security_df.index, ax), ohlc[:, 0],
+                          ohlc[:, 1], ohlc[:, 2], ohlc[:, 3])
+    colour_up = mcolors.to_rgba(colour_up, alpha)
+    colour_down = mcolors.to_rgba(colour_down, alpha)
+
+    wicks = mcollections.LineCollection([], zorder=0.5)
+    bodies = mcollections.PolyCollection([], zorder=0.5)
+    ax.add_collection(wicks, autolim=False)
+    ax.add_collection(bodies, autolim=False)
+
+    def _set_candles(x_start, x_end):
+        level, bins = pyramid.get_bins(x_start, x_end, int(ax.bbox.width))
+        x = (bins['x_first'] + bins['x_last']) / 2
+        half_width = width * 2**level / 2.
+        n_bins = len(x)
+
+        wick_segments = np.empty((n_bins, 2, 2))
+        wick_segments[:, :, 0] = x[:, np.newaxis]
+        wick_segments[:, 0, 1] = bins['low']
+        wick_segments[:, 1, 1] = bins['high']
+
+        body_verts = np.empty((n_bins, 4, 2))
+        body_verts[:, [0, 3], 0] = (x - half_width)[:, np.newaxis]
+        body_verts[:, [1, 2], 0] = (x + half_width)[:, np.newaxis]
+        body_verts[:, [0, 1], 1] = bins['open'][:, np.newaxis]
+        body_verts[:, [2, 3], 1] = bins['close'][:, np.newaxis]
+
+        colours = np.where((bins['close'] >= bins['open'])[:, np.newaxis],
+                           colour_up, colour_down)
+        wicks.set_segments(wick_segments)
+        wicks.set_color(colours)
+        bodies.set_verts(body_verts)
+        bodies.set_facecolor(colours)
+        bodies.set_edgecolor(colours)
+        return bins
+
+    bins = _set_candles(-np.inf, np.inf)
+    with np.errstate(invalid='ignore'):
+        ax.update_datalim([(np.nanmin(bins['x_first']),
+                            np.nanmin(bins['low'])),
+                           (np.nanmax(bins['x_last']),
+                            np.nanmax(bins['high']))])
+    ax.autoscale_view()
+    _connect_lod(ax, lambda: _set_candles(*ax.get_xlim()))
+    return wicks, bodies
+
+
+def _plot_series(ax, series, lod, **kwargs):
+    """Plots a Series against its index on ax, or on the current Axes if
+    ax is None, through plot_lod_line() if lod is True."""
+    if lod:
+        return plot_lod_line(series.index, series.values, ax, **kwargs)
+    if ax is None:
+        return plt.plot(series.index, series, **kwargs)
+    return ax.plot(series.index, series, **kwargs)
+
+
 def plot_candlesticks(security_df, ax, width=0.2, colour_up=green,
-                      colour_down=red, alpha=1.0):
+                      colour_down=red, alpha=1.0, lod=False):
     """Plots the candlestick of a security with the proper date x-axis.
 
     Parameters
@@ -1094,20 +4213,30 @@ def plot_candlesticks(security_df, ax, width=0.2, colour_up=green,
         The colour of down candles
     alpha : float, default 1.0
         Transparency of the candles
+    lod : bool, default False
+        Whether to draw at most one candle per pixel column, aggregating
+        the open, high, low and close of the bars it covers, and to
+        re-aggregate on zoom. Use this for long series such as years of
+        minute bars.
     """
 
+    if lod:
+        return _plot_lod_candlesticks(security_df, ax, width, colour_up,
+                                      colour_down, alpha)
+
     # Select date and open, high, low, and close columns
     candlestick_df = security_df.reset_index().iloc[:, :5]
     candlestick_df['Date'] = candlestick_df['Date'].map(mdates.date2num)
     quotes = np.array(candlestick_df)
 
-    candlestick_ohlc(ax, quotes, width, colorup=colour_up,
-                     colordown=colour_down, alpha=alpha)
+    mpl_finance.candlestick_ohlc(ax, quotes, width, colorup=colour_up,
+                                 colordown=colour_down, alpha=alpha)
     ax.xaxis_date()
 
 
+@_profiled
 def plot_returns(security, col_name, start_date, end_date=None,
-                 data_source='google', **kwargs):
+                 data_source='google', inplace=False, **kwargs):
     """Plots the daily returns of a security.
 
     Parameters
@@ -1124,6 +4253,9 @@ def plot_returns(security, col_name, start_date, end_date=None,
         then end_date will be set as date.today()
     data_source : str, default 'google'
         The source of the security data
+    inplace : bool, default False
+        Whether to add the indicator columns to security itself, if it
+        is a DataFrame, rather than to a copy
     kwargs : Matplotlib keyword arguments
     """
 
@@ -1138,10 +4270,13 @@ def plot_returns(security, col_name, start_date, end_date=None,
                                         data_source=data_source)
     elif isinstance(security, pd.DataFrame):
         security_name = _get_security_names(security)
-        security_df = security.copy()
+        security_df = security
     col_name = col_name.lower()
 
-    security_df = generate_returns(security_df, security_name, col_name)
+    # Fetched data is not shared, so it never needs to be copied
+    output = 'inplace' if inplace or isinstance(security, str) else 'copy'
+    security_df = generate_returns(security_df, security_name, col_name,
+                                   output=output)
 
     returns_col_name = 'returns_{}'.format(security_name)
 
@@ -1154,9 +4289,10 @@ def plot_returns(security, col_name, start_date, end_date=None,
     return security_df
 
 
+@_profiled
 def plot_rsi(security, col_name, start_date, end_date=None, ndays=15,
              thresholds=[20, 80], plot_dim=(12, 8), data_source='google',
-             **kwargs):
+             inplace=False, **kwargs):
     """Plots the RSI of a single security.
 
     Parameters
@@ -1179,6 +4315,9 @@ def plot_rsi(security, col_name, start_date, end_date=None, ndays=15,
         The dimensions of the plot
     data_source : str, default 'google'
         The source of the security data
+    inplace : bool, default False
+        Whether to add the indicator columns to security itself, if it
+        is a DataFrame, rather than to a copy
     kwargs : Matplotlib keyword arguments
     """
 
@@ -1193,12 +4332,14 @@ def plot_rsi(security, col_name, start_date, end_date=None, ndays=15,
                                         data_source=data_source)
     elif isinstance(security, pd.DataFrame):
         security_name = _get_security_names(security)
-        security_df = security.copy()
+        security_df = security
     col_name = col_name.lower()
 
     signal_col_name = 'rsi_signal_{}'.format(security_name)
+    # Fetched data is not shared, so it never needs to be copied
+    output = 'inplace' if inplace or isinstance(security, str) else 'copy'
     security_df = generate_rsi_columns(security_df, security_name, col_name,
-                                       ndays, thresholds)
+                                       ndays, thresholds, output=output)
 
     rsi_col_name = 'rsi_{}'.format(security_name)
 
@@ -1222,47 +4363,390 @@ def plot_rsi(security, col_name, start_date, end_date=None, ndays=15,
     return security_df
 
 
+def _save_atomic(path, save_func):
+    """Writes a file by calling save_func on a temporary file in the same
+    directory, then renaming it over path, so that readers never see a
+    partially written file."""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                     suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            save_func(f)
+        if os.name == 'nt' and os.path.exists(path):
+            # os.rename does not overwrite on Windows
+            os.remove(path)
+        os.rename(temp_path, path)
+    except:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
 class data_storage:
-    def __init__(self):
+    def __init__(self, storage_dir=None, provider=None):
+        """Stores security data so that it is only downloaded once.
+
+        Parameters
+        ----------
+        storage_dir : str, default None
+            A directory in which to keep the security data between
+            sessions. Each security is stored as memory-mapped .npy
+            files, and a manifest.json records the files, the columns
+            and the date range covered by each security. If set to None,
+            the data is only kept in memory.
+        provider : function, default None
+            A function of (security, start_date, end_date, data_source)
+            that returns a DataFrame in the layout of
+            get_security_data(). If set to None, use
+            get_security_data().
+        """
         self.data_store_dict = {}
+        # The requested date range, as (start, end) Timestamps, that each
+        # security in the store covers
+        self.coverage_dict = {}
+        self.storage_dir = storage_dir
+        self.provider = provider if provider is not None else get_security_data
+        self._manifest = {}
+
+        if storage_dir is not None:
+            if not os.path.isdir(storage_dir):
+                os.makedirs(storage_dir)
+            manifest_path = os.path.join(storage_dir, 'manifest.json')
+            if os.path.exists(manifest_path):
+                with open(manifest_path) as f:
+                    self._manifest = json.load(f)
+            for security, entry in self._manifest.iteritems():
+                self.coverage_dict[security] = (pd.Timestamp(entry['start']),
+                                                pd.Timestamp(entry['end']))
+
+    def _get_file_path(self, security, kind, version=None):
+        """Returns the path of a version of the index or values file of
+        a security. Manifests written before files were versioned have
+        no version."""
+        if version is None:
+            file_name = '{}.{}.npy'.format(security, kind)
+        else:
+            file_name = '{}.{}.{}.npy'.format(security, version, kind)
+        return os.path.join(self.storage_dir, file_name)
+
+    def _read_security_data(self, security):
+        """Loads a security from the storage directory."""
+        entry = self._manifest[security]
+        version = entry.get('version')
+        index = np.load(self._get_file_path(security, 'index', version),
+                        mmap_mode='r')
+        values = np.load(self._get_file_path(security, 'values', version),
+                         mmap_mode='r')
+        security_df = pd.DataFrame(values, columns=entry['columns'],
+                                   index=pd.DatetimeIndex(index,
+                                                          name=entry['index_name']))
+        dtypes = {col: dtype for col, dtype in zip(entry['columns'],
+                                                   entry['dtypes'])
+                      if dtype != str(values.dtype)}
+        if dtypes:
+            security_df = security_df.astype(dtypes)
+        return security_df
+
+    def _write_security_data(self, security):
+        """Writes a new version of a security to the storage directory,
+        then points the manifest at it. The old version stays current
+        until the manifest is replaced, so a failed write leaves the
+        stored data consistent."""
+        security_df = self.data_store_dict[security]
+        index = security_df.index.values.astype('datetime64[ns]')
+        values = security_df.values.astype(float)
+        old_version = self._manifest.get(security, {}).get('version')
+        version = 1 if old_version is None else old_version + 1
+        _save_atomic(self._get_file_path(security, 'index', version),
+                     lambda f: np.save(f, index))
+        _save_atomic(self._get_file_path(security, 'values', version),
+                     lambda f: np.save(f, values))
+
+        start, end = self.coverage_dict[security]
+        had_entry = security in self._manifest
+        self._manifest[security] = {
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'version': version,
+            'columns': list(security_df.columns),
+            'dtypes': [str(dtype) for dtype in security_df.dtypes],
+            'index_name': security_df.index.name
+        }
+        manifest_json = json.dumps(self._manifest, indent=1, sort_keys=True)
+        _save_atomic(os.path.join(self.storage_dir, 'manifest.json'),
+                     lambda f: f.write(manifest_json))
+
+        if had_entry:
+            for kind in ('index', 'values'):
+                try:
+                    os.remove(self._get_file_path(security, kind,
+                                                  old_version))
+                except OSError:
+                    # e.g. the old file is still memory-mapped on Windows
+                    pass
+
+    def _get_missing_ranges(self, security, start_date, end_date):
+        """Returns the (start, end) date ranges between start_date and
+        end_date that the store does not cover for a security."""
+        if security not in self.coverage_dict:
+            return [(start_date, end_date)]
+
+        covered_start, covered_end = self.coverage_dict[security]
+        missing_ranges = []
+        if start_date < covered_start:
+            missing_ranges.append((start_date,
+                                   covered_start - pd.Timedelta(days=1)))
+        if end_date > covered_end:
+            missing_ranges.append((covered_end + pd.Timedelta(days=1),
+                                   end_date))
+        return missing_ranges
 
     def get_security_data(self, security, start_date, end_date=None,
                           data_source='google', return_df=True):
-        """Obtains security data and stores it into dictionary."""
+        """Obtains security data and stores it into dictionary. Only the
+        date ranges that are not already stored are downloaded. A range
+        is only recorded as stored up to the last date that it returned,
+        so a range that fails or comes back empty, or the days after the
+        latest published data, are downloaded again next time."""
         if end_date is None:
             end_date = date.today()
 
-        security_df = get_security_data(security, start_date, end_date,
-                                        data_source)
-        self.data_store_dict[security] = security_df
-        if return_df: 
-            return security_df
+        security = security.upper()
+        start_date = pd.Timestamp(start_date).normalize()
+        end_date = pd.Timestamp(end_date).normalize()
 
-    def load_security_data(self, security, start_date=None, end_date=None):
-        """Loads the security data if it is in the dictionary."""
+        missing_ranges = self._get_missing_ranges(security, start_date,
+                                                  end_date)
+        _count('data_store_misses' if missing_ranges else 'data_store_hits')
+        df_list = []
+        range_df = None
+        covered_start, covered_end = self.coverage_dict.get(security,
+                                                            (None, None))
+        for range_start, range_end in missing_ranges:
+            range_df = self.provider(security, range_start, range_end,
+                                     data_source)
+            if range_df is None or len(range_df) == 0:
+                continue
+            df_list.append(range_df)
+            # Each missing range adjoins the covered range, so the
+            # covered range stays contiguous. The days after the last
+            # date returned, e.g. bars not published yet, stay missing.
+            range_end = min(range_end, range_df.index.max())
+            covered_start = (range_start if covered_start is None
+                                 else min(covered_start, range_start))
+            covered_end = (range_end if covered_end is None
+                               else max(covered_end, range_end))
+
+        if df_list:
+            if security in self.coverage_dict:
+                df_list.append(self._get_stored_data(security))
+
+            security_df = pd.concat(df_list).sort_index()
+            security_df = security_df[~security_df.index.duplicated(keep='last')]
+            self.data_store_dict[security] = security_df
+            self.coverage_dict[security] = (covered_start, covered_end)
+
+            if self.storage_dir is not None:
+                self._write_security_data(security)
+
+        if return_df:
+            if security not in self.coverage_dict:
+                # Nothing could be downloaded, so return what the
+                # provider returned, e.g. an empty DataFrame
+                return range_df
+            return self.load_security_data(security, start_date, end_date)
+
+    def _get_stored_data(self, security):
+        """Returns the full history of a security, from memory or from
+        the storage directory."""
         if security not in self.data_store_dict:
-            raise KeyError('security not in data dictionary.')
-        security_df = self.data_store_dict[security].copy()
-
-        if start_date is None and end_date is None: 
-            return security_df
-        elif start_date is None and end_date is not None:
-            return security_df.query('index <= @end_date')
-        elif start_date is not None and end_date is None:
-            return security_df.query('index >= @start_date')
-        else:
-            return security_df.query('index >= @start_date & index <= @end_date')
+            if security not in self._manifest:
+                raise KeyError('security not in data dictionary.')
+            self.data_store_dict[security] =\
+                self._read_security_data(security)
+        return self.data_store_dict[security]
+
+    def load_security_data(self, security, start_date=None, end_date=None,
+                           copy=False):
+        """Loads the security data if it is in the dictionary.
+
+        The dates are found by binary search on the sorted index, and the
+        returned DataFrame is a view of the stored data unless copy is
+        True, so it should not be modified in place.
+
+        Parameters
+        ----------
+        security : str
+            The ticker symbol
+        start_date : str, default None
+            The first date to load. If set to None, load from the start
+            of the stored data.
+        end_date : str, default None
+            The last date to load. If set to None, load to the end of
+            the stored data.
+        copy : bool, default False
+            Whether to return a copy rather than a view
+        """
+        security_df = self._get_stored_data(security.upper())
+        index = security_df.index
+
+        start_loc = 0
+        end_loc = len(index)
+        if start_date is not None:
+            start_loc = index.searchsorted(pd.Timestamp(start_date),
+                                           side='left')
+        if end_date is not None:
+            end_loc = index.searchsorted(pd.Timestamp(end_date), side='right')
+
+        security_df = security_df.iloc[start_loc:end_loc]
+        if copy:
+            return _copy_df(security_df)
+        return security_df
+
+    def load_securities_data(self, securities, start_date=None,
+                             end_date=None):
+        """Loads the data of several securities in the dictionary and
+        aligns them on their combined dates, in the layout of
+        get_security_data().
+
+        Parameters
+        ----------
+        securities : str or list of str
+            The ticker symbols
+        start_date : str, default None
+            The first date to load. If set to None, load from the start
+            of the stored data.
+        end_date : str, default None
+            The last date to load. If set to None, load to the end of
+            the stored data.
+
+        Returns
+        -------
+        security_df : DataFrame
+            The merged DataFrame of security data
+        """
+        securities = _listify_security(securities)
+        df_list = [self.load_security_data(security, start_date, end_date)
+                       for security in securities]
+        if len(df_list) == 1:
+            return _copy_df(df_list[0])
+        return align_security_data(df_list)
+
 
+# Columns of the security_portfolio transaction ledger. trans_type holds
+# BUY or SELL and is converted to 'Buy' or 'Sell' in get_all_transactions(),
+# and security holds the position of the ticker symbol in the portfolio's
+# list of symbols. Without object fields, growing the ledger is a plain
+# memory copy.
+_TRANS_DTYPE = np.dtype([('date', 'datetime64[ns]'),
+                         ('security', np.int32),
+                         ('trans_type', np.int8),
+                         ('security_price', float),
+                         ('amt', float),
+                         ('total_cash_amt', float)])
 
-class security_portfolio:
+
+class security_portfolio(object):
     def __init__(self, total_cash_amt, verbose=False):
         self.start_cash_amt = total_cash_amt
         self.total_cash_amt = total_cash_amt
         self.security_dict = {}
         self.verbose = verbose
-        self.trans_df = pd.DataFrame(columns=['date', 'security', 'trans_type',
-                                              'security_price', 'amt',
-                                              'total_cash_amt'])
+
+        # Transactions are stored in a structured array that doubles in
+        # size when full. Single trades are kept as tuples until the array
+        # is read, and the DataFrame is only built when asked for.
+        self._trans_array = np.empty(16, dtype=_TRANS_DTYPE)
+        self._pending_trans = []
+        self._n_trans = 0
+        self._trans_df = None
+        # The ticker symbols of the transactions and their codes
+        self._securities = []
+        self._security_codes = {}
+
+    @property
+    def trans_df(self):
+        """The DataFrame of all transactions, as from
+        get_all_transactions(). Assigning a DataFrame of the same columns
+        replaces the transactions. Changes made to the DataFrame in place
+        are lost at the next transaction."""
+        return self.get_all_transactions()
+
+    @trans_df.setter
+    def trans_df(self, trans_df):
+        n_trans = len(trans_df)
+        self._trans_array = np.empty(max(n_trans, 16), dtype=_TRANS_DTYPE)
+        self._securities = []
+        self._security_codes = {}
+        self._pending_trans = []
+        trans_array = self._trans_array[:n_trans]
+        trans_array['date'] = pd.to_datetime(trans_df['date']).values
+        trans_array['security'] = self._get_security_codes(
+            trans_df['security'])
+        trans_codes = {_SIGNAL_STRS[BUY]: BUY, _SIGNAL_STRS[SELL]: SELL}
+        trans_array['trans_type'] = [trans_codes.get(trans_type, trans_type)
+                                         for trans_type in trans_df['trans_type']]
+        for field in ['security_price', 'amt', 'total_cash_amt']:
+            trans_array[field] = trans_df[field]
+        self._n_trans = n_trans
+        self._trans_df = None
+
+    def _get_security_code(self, ticker_symbol):
+        """Returns the code of a ticker symbol in the ledger."""
+        code = self._security_codes.get(ticker_symbol)
+        if code is None:
+            code = len(self._securities)
+            self._securities.append(ticker_symbol)
+            self._security_codes[ticker_symbol] = code
+        return code
+
+    def _get_security_codes(self, ticker_symbols):
+        """Returns the codes of an array of ticker symbols."""
+        labels, uniques = pd.factorize(np.asarray(ticker_symbols,
+                                                  dtype=object))
+        codes = np.array([self._get_security_code(ticker_symbol)
+                              for ticker_symbol in uniques], dtype=np.int32)
+        return codes[labels]
+
+    def _reserve_transactions(self, n_new):
+        """Grows the transaction array so that it can hold n_new more
+        transactions."""
+        n_stored = self._n_trans - len(self._pending_trans)
+        n_needed = n_stored + n_new
+        capacity = len(self._trans_array)
+        if n_needed > capacity:
+            while capacity < n_needed:
+                capacity *= 2
+            trans_array = np.empty(capacity, dtype=_TRANS_DTYPE)
+            trans_array[:n_stored] = self._trans_array[:n_stored]
+            self._trans_array = trans_array
+
+    def _get_trans_array(self):
+        """Moves the pending single trades into the transaction array and
+        returns the filled part of the array."""
+        if self._pending_trans:
+            n_pending = len(self._pending_trans)
+            self._reserve_transactions(n_pending)
+            self._trans_array[self._n_trans - n_pending:self._n_trans] =\
+                np.array(self._pending_trans, dtype=_TRANS_DTYPE)
+            self._pending_trans = []
+        return self._trans_array[:self._n_trans]
+
+    def _record_transaction(self, trans_date, ticker_symbol, trans_type,
+                            security_price, amount):
+        """Appends a transaction to the pending single trades."""
+        # Storing the nanoseconds is much faster than converting a
+        # Timestamp to datetime64
+        if not isinstance(trans_date, pd.Timestamp):
+            trans_date = pd.Timestamp(trans_date)
+        code = self._security_codes.get(ticker_symbol)
+        if code is None:
+            code = self._get_security_code(ticker_symbol)
+        self._pending_trans.append((trans_date.value, code, trans_type,
+                                    security_price, security_price * amount,
+                                    self.total_cash_amt))
+        self._n_trans += 1
+        self._trans_df = None
 
     def buy_max_securities(self, ticker_symbol, security_price, trans_date):
         """Buy as many securities as possible with current cash."""
@@ -1281,9 +4765,8 @@ class security_portfolio:
             # Decrease total cash amount
             start_cash_amt = self.total_cash_amt
             self.total_cash_amt -= amount * security_price
-            added_row = [trans_date, ticker_symbol, 'Buy', security_price,
-                         security_price * amount, self.total_cash_amt]
-            self.trans_df.loc[self.trans_df.shape[0]] = added_row
+            self._record_transaction(trans_date, ticker_symbol, BUY,
+                                     security_price, amount)
 
             if self.verbose:
                 print 'Bought {} shares of {} at {}.\n\tStart cash: {}.\n\tRemaining cash: {}.\n\tDate: {}'\
@@ -1292,6 +4775,66 @@ class security_portfolio:
         else:
             raise Exception('You do not own enough cash to purchase this many securities.')
 
+    def _add_transactions(self, trans_dates, ticker_symbols, trans_types,
+                          amounts, security_prices, total_cash_amts):
+        """Records trades that have already been executed elsewhere, such
+        as by _simulate_trades(). The trades are appended to the
+        transaction array in one step and the holdings and cash are
+        updated to match.
+
+        Parameters
+        ----------
+        trans_dates : array
+            The date of each trade
+        ticker_symbols : array of str
+            The security of each trade
+        trans_types : array
+            BUY or SELL
+        amounts : array of int
+            The number of shares of each trade
+        security_prices : array of float
+            The security price of each trade
+        total_cash_amts : array of float
+            The total cash amount after each trade
+        """
+
+        if len(trans_dates) == 0:
+            return
+
+        if self.verbose:
+            start_cash_amts = [self.total_cash_amt]\
+                + list(total_cash_amts[:-1])
+            for i, ticker_symbol in enumerate(ticker_symbols):
+                action = 'Bought' if trans_types[i] == BUY else 'Sold'
+                print '{} {} shares of {} at {}.\n\tStart cash: {}.\n\tRemaining cash: {}.\n\tDate: {}'\
+                      .format(action, amounts[i], ticker_symbol,
+                              security_prices[i], start_cash_amts[i],
+                              total_cash_amts[i], trans_dates[i])
+
+        # Net change in the number of shares of each security
+        signed_amounts = np.where(np.asarray(trans_types) == BUY,
+                                  amounts, -np.asarray(amounts))
+        net_amounts = pd.Series(signed_amounts)\
+            .groupby(np.asarray(ticker_symbols, dtype=object), sort=False)\
+            .sum()
+        for ticker_symbol, net_amount in net_amounts.iteritems():
+            self.security_dict[ticker_symbol] =\
+                self.security_dict.get(ticker_symbol, 0) + int(net_amount)
+
+        n_new = len(trans_dates)
+        self._get_trans_array()
+        self._reserve_transactions(n_new)
+        added = self._trans_array[self._n_trans:self._n_trans + n_new]
+        added['date'] = pd.to_datetime(trans_dates).values
+        added['security'] = self._get_security_codes(ticker_symbols)
+        added['trans_type'] = trans_types
+        added['security_price'] = security_prices
+        added['amt'] = np.asarray(security_prices) * np.asarray(amounts)
+        added['total_cash_amt'] = total_cash_amts
+        self._n_trans += n_new
+        self._trans_df = None
+        self.total_cash_amt = total_cash_amts[-1]
+
     def get_total_cash_amt(self):
         """Shows the total cash amount."""
         return self.total_cash_amt
@@ -1308,9 +4851,8 @@ class security_portfolio:
                 start_cash_amt = self.total_cash_amt
                 # Increase total cash amount
                 self.total_cash_amt += amount * security_price
-                added_row = [trans_date, ticker_symbol, 'Sell', security_price,
-                             security_price * amount, self.total_cash_amt]
-                self.trans_df.loc[self.trans_df.shape[0]] = added_row
+                self._record_transaction(trans_date, ticker_symbol, SELL,
+                                         security_price, amount)
                 if self.verbose:
                     print 'Sold {} shares of {} at {}.\n\tStart cash: {}.\n\tRemaining cash: {}.\n\tDate: {}'\
                           .format(amount, ticker_symbol, security_price, start_cash_amt, self.total_cash_amt, trans_date)
@@ -1332,19 +4874,38 @@ class security_portfolio:
 
     def get_all_transactions(self):
         """Returns a Pandas DataFrame of all transactions."""
-        return self.trans_df
+        if self._trans_df is None:
+            trans_array = self._get_trans_array()
+            self._trans_df = pd.DataFrame(
+                {'date': trans_array['date'],
+                 'security': np.array(self._securities, dtype=object)[
+                     trans_array['security']],
+                 'trans_type': _format_signals(trans_array['trans_type'],
+                                               'str'),
+                 'security_price': trans_array['security_price'],
+                 'amt': trans_array['amt'],
+                 'total_cash_amt': trans_array['total_cash_amt']
+                }, columns=list(_TRANS_DTYPE.names))
+        return self._trans_df
 
     def get_avg_transaction_freq(self):
         """Returns the average transaction frequency."""
-        return self.trans_df.date.diff().mean()
+        if self._n_trans < 2:
+            return pd.NaT
+        # The mean of the successive differences is the total time
+        # divided by the number of differences
+        dates = self._get_trans_array()['date']
+        return (pd.Timestamp(dates[self._n_trans - 1])
+                    - pd.Timestamp(dates[0])) / (self._n_trans - 1)
 
     def get_last_sell_cash_amt(self):
         """Get the total cash amt at the last sale. This is an indicator of
         the final cash value of the portfolio.
         """
-        df = self.get_all_transactions()
-        if 'Sell' in set(df.trans_type):
-            return float(df[df.trans_type == 'Sell'].tail(1)['total_cash_amt'])
+        trans_array = self._get_trans_array()
+        sell_index = np.flatnonzero(trans_array['trans_type'] == SELL)
+        if len(sell_index) > 0:
+            return float(trans_array['total_cash_amt'][sell_index[-1]])
         else:
             # If there are no sales, return the starting cash amount
             return self.start_cash_amt
@@ -1393,10 +4954,71 @@ class security_portfolio:
         pass
 
 
-def pairs_trade(df_1, df_2, column, suffixes, start_date,
-                end_date=date.today(), threshold=2, cash_amt=10000):
+def _get_pairs_positions(zscore, threshold, exit_threshold):
+    """Returns the leg held after each row of a spread z-score: 0 for
+    none, 1 for the first security and 2 for the second.
+
+    The second security is bought when the z-score rises above threshold
+    and sold when it falls back to exit_threshold, and the first is
+    bought when the z-score falls below -threshold and sold when it rises
+    back to -exit_threshold. Only the rows where the z-score moves into
+    a different band can change the position, so the loop runs over
+    those rows rather than every row.
+    """
+
+    # The bands: 2 buys the second security, 1 buys the first, 0 sells
+    # either, 3 only sells the first, 4 only sells the second and -1 is a
+    # missing z-score, which changes nothing
+    with np.errstate(invalid='ignore'):
+        bands = np.select([zscore > threshold,
+                           zscore < -threshold,
+                           np.abs(zscore) <= exit_threshold,
+                           zscore > exit_threshold,
+                           zscore < -exit_threshold],
+                          [2, 1, 0, 3, 4], -1).astype(np.int8)
+
+    band_changes = np.flatnonzero(np.diff(bands) != 0) + 1
+    if len(bands) > 0 and bands[0] != -1:
+        band_changes = np.concatenate([[0], band_changes])
+
+    position = 0
+    change_rows = []
+    change_positions = []
+    for row, band in izip(band_changes.tolist(),
+                          bands[band_changes].tolist()):
+        if band in (1, 2):
+            new_position = band
+        elif band == 0 or (band == 3 and position == 1)\
+                or (band == 4 and position == 2):
+            new_position = 0
+        else:
+            continue
+        if new_position != position:
+            position = new_position
+            change_rows.append(row)
+            change_positions.append(position)
+
+    # Each position holds until the next change
+    change_ids = np.zeros(len(bands), dtype=np.int64)
+    change_ids[change_rows] = np.arange(1, len(change_rows) + 1)
+    change_ids = np.maximum.accumulate(change_ids)
+    return np.concatenate([[0], change_positions]).astype(np.int8)[change_ids]
+
+
+def pairs_trade(df_1, df_2, column, suffixes, start_date=None,
+                end_date=None, threshold=2, cash_amt=10000, lookback=200,
+                exit_threshold=0.0, verbose=False):
     """Run pairs trading model.
 
+    The spread is the log of the ratio of the two prices, and its
+    z-score is taken against the mean and standard deviation of the
+    previous lookback rows. When the z-score rises above threshold the
+    second security is cheap relative to the first, so all cash is put
+    into it until the z-score falls back to exit_threshold, and
+    likewise for the first security below -threshold. Only the cheap
+    leg is bought, since security_portfolio does not hold short
+    positions.
+
     Parameters
     ----------
     df_1 : DataFrame
@@ -1406,33 +5028,352 @@ def pairs_trade(df_1, df_2, column, suffixes, start_date,
     column : str
         The column to look at
     suffixes : list of str
-        The suffixes appended to the columns
-    start_date : str
-        Date indicating when to start trading
-    end_date : str
-        Date indicating when to stop trading
-    threshold : int, default 2
+        The suffixes appended to the columns, e.g. ['_aapl', '_msft'].
+        Without the underscores, they are the securities' names in the
+        portfolio.
+    start_date : str, default None
+        Date indicating when to start trading. The rows before it are
+        still used for the rolling statistics. If set to None, start at
+        the first date.
+    end_date : str, default None
+        Date indicating when to stop trading. If set to None, trade to
+        the last date. A position still held on the last date up to
+        end_date is sold on that date.
+    threshold : float, default 2
         The threshold to surpass to trade
     cash_amt : int, default 10000
         Starting cash amount
+    lookback : int, default 200
+        The number of rows for the rolling mean and standard deviation
+        of the spread
+    exit_threshold : float, default 0.0
+        The z-score at which a position is sold
+    verbose : bool, default False
+        Whether to print each trade
 
     Returns
     -------
+    sec_port : security_portfolio
+        The portfolio with the trades
     join_df : DataFrame
+        The joined security data with the spread, spread_zscore and
+        position columns, where position is 0 for no holdings, 1 for the
+        first security and 2 for the second
     """
 
     def _get_column_names(column, suffixes):
         """Retrieves desired column name."""
         return [column + suf for suf in suffixes]
 
-    holding = False
-    join_df = pd.merge(df_1, df_2, on='date', suffixes=suffixes)
+    if threshold <= exit_threshold:
+        raise ValueError('threshold must be larger than exit_threshold.')
+
+    # Join on a date column if there is one, otherwise on the index
+    if 'date' in df_1.columns and 'date' in df_2.columns:
+        join_df = pd.merge(df_1, df_2, on='date', suffixes=suffixes)
+        dates = join_df['date'].values
+    else:
+        join_df = pd.merge(df_1, df_2, left_index=True, right_index=True,
+                           suffixes=suffixes)
+        dates = join_df.index.values
 
     column_names = _get_column_names(column, suffixes)
+    prices_1 = join_df[column_names[0]].values.astype(float)
+    prices_2 = join_df[column_names[1]].values.astype(float)
+
+    # The statistics of the previous lookback rows, as in
+    # spread[i - lookback:i]
+    spread = pd.Series(np.log(prices_1) - np.log(prices_2))
+    previous_spread = spread.shift(1).rolling(lookback)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        zscore = ((spread - previous_spread.mean())
+                  / previous_spread.std(ddof=0)).values
+    zscore[~np.isfinite(zscore)] = np.nan
+
+    # Only trade between start_date and end_date
+    trade_dates = pd.DatetimeIndex(dates)
+    start_loc = 0
+    end_loc = len(join_df)
+    if start_date is not None:
+        start_loc = trade_dates.searchsorted(pd.Timestamp(start_date))
+    if end_date is not None:
+        end_loc = trade_dates.searchsorted(pd.Timestamp(end_date),
+                                           side='right')
+    positions = np.zeros(len(join_df), dtype=np.int8)
+    positions[start_loc:end_loc] = _get_pairs_positions(
+        zscore[start_loc:end_loc], threshold, exit_threshold)
+    # Sell whatever is still held on the last trading date
+    if end_loc > start_loc:
+        positions[end_loc - 1] = 0
+
+    join_df['spread'] = spread.values
+    join_df['spread_zscore'] = zscore
+    join_df['position'] = positions
+
+    # Sell the held leg and buy the new one wherever the position changes
+    securities = [suf.strip('_') for suf in suffixes]
+    leg_prices = [None, prices_1, prices_2]
+    held_positions = np.concatenate([[0], positions[:-1]])
+    trade_rows = []
+    trade_securities = []
+    trade_types = []
+    trade_amounts = []
+    trade_prices = []
+    trade_cash_amts = []
+    cash = cash_amt
+    amount_held = 0
+    for row in np.flatnonzero(positions != held_positions).tolist():
+        for leg, trade_type in [(held_positions[row], SELL),
+                                (positions[row], BUY)]:
+            if leg == 0:
+                continue
+            price = leg_prices[leg][row]
+            if trade_type == SELL:
+                amount = amount_held
+                cash += amount * price
+                amount_held = 0
+            else:
+                amount = int(np.floor(cash / price))
+                cash -= amount * price
+                amount_held = amount
+            if amount == 0:
+                continue
+            trade_rows.append(row)
+            trade_securities.append(securities[leg - 1])
+            trade_types.append(trade_type)
+            trade_amounts.append(amount)
+            trade_prices.append(price)
+            trade_cash_amts.append(cash)
+
+    sec_port = security_portfolio(cash_amt, verbose=verbose)
+    sec_port._add_transactions(
+        trade_dates[trade_rows],
+        np.array(trade_securities, dtype=object),
+        np.array(trade_types, dtype=np.int8),
+        np.array(trade_amounts, dtype=np.int64),
+        np.array(trade_prices, dtype=float),
+        np.array(trade_cash_amts, dtype=float)
+    )
+    return sec_port, join_df
+
+
+# Data shared by the screen_pairs() tasks of a process. Each worker
+# process receives it once, through the pool initializer, like
+# _sweep_data.
+_screen_data = {}
+
+
+def _init_screen_worker(screen_data):
+    """Sets the data shared by the screen_pairs() tasks of this
+    process."""
+    _screen_data.clear()
+    _screen_data.update(screen_data)
+
+
+def _run_pair_stats_pool_task(task):
+    """Runs a (firsts, seconds, lookback) task of screen_pairs() in a
+    worker process."""
+    return _run_pair_stats_task(*task)
+
+
+def _get_top_correlations(returns, top_k, block_size, min_periods):
+    """Returns the pairs of columns of returns that are among the top_k
+    most correlated for either column, as arrays of the first column,
+    the second column and the correlation.
+
+    The correlation matrix is computed block_size rows at a time. Each
+    column is standardized on its own mean and standard deviation and
+    missing returns count as zero, so it matches the Pearson
+    correlation when nothing is missing.
+    """
+
+    n_securities = returns.shape[1]
+    is_valid = ~np.isnan(returns)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        zscores = (returns - np.nanmean(returns, axis=0))\
+            / np.nanstd(returns, axis=0)
+    zscores[~np.isfinite(zscores)] = 0
+    # float32 counts are exact below 2**24 dates and halve the work
+    is_valid = is_valid.astype(np.float32)
+
+    top_k = min(top_k, n_securities - 1)
+    firsts = []
+    seconds = []
+    for block_start in xrange(0, n_securities, block_size):
+        block_end = min(block_start + block_size, n_securities)
+        n_rows = block_end - block_start
+        counts = is_valid[:, block_start:block_end].T.dot(is_valid)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corrs = zscores[:, block_start:block_end].T.dot(zscores) / counts
+        corrs[counts < min_periods] = -np.inf
+        corrs[np.arange(n_rows), np.arange(block_start, block_end)] = -np.inf
+        corrs[np.isnan(corrs)] = -np.inf
+
+        top_cols = np.argpartition(-corrs, top_k - 1, axis=1)[:, :top_k]
+        top_corrs = corrs[np.arange(n_rows)[:, np.newaxis], top_cols]
+        is_kept = np.isfinite(top_corrs)
+        firsts.append(np.repeat(np.arange(block_start, block_end),
+                                top_k)[is_kept.ravel()])
+        seconds.append(top_cols[is_kept])
+
+    # Each pair once, with the lower column first
+    firsts = np.concatenate(firsts)
+    seconds = np.concatenate(seconds)
+    pair_ids = np.unique(np.minimum(firsts, seconds) * n_securities
+                         + np.maximum(firsts, seconds))
+    firsts = pair_ids // n_securities
+    seconds = pair_ids % n_securities
+
+    # Recompute the kept correlations, since a pair may have been found
+    # from either column
+    counts = (is_valid[:, firsts] * is_valid[:, seconds]).sum(axis=0)
+    corrs = (zscores[:, firsts] * zscores[:, seconds]).sum(axis=0) / counts
+    return firsts, seconds, corrs
+
+
+def _run_pair_stats_task(firsts, seconds, lookback):
+    """Returns the spread statistics of the pairs of columns of the
+    shared log prices, one tuple per pair of the hedge ratio, the
+    Dickey-Fuller statistic, the half-life, the latest spread z-score and
+    the number of observations."""
+    log_prices = _screen_data['log_prices']
+    results = []
+    for first, second in izip(firsts, seconds):
+        y = log_prices[:, first]
+        x = log_prices[:, second]
+        is_valid = ~(np.isnan(x) | np.isnan(y))
+        y = y[is_valid]
+        x = x[is_valid]
+        n_obs = len(y)
+        if n_obs < 3 or np.var(x) == 0:
+            results.append((np.nan, np.nan, np.nan, np.nan, n_obs))
+            continue
+
+        # Hedge ratio from least squares of y on x
+        hedge_ratio = np.cov(x, y, bias=True)[0, 1] / np.var(x)
+        spread = y - hedge_ratio * x
+
+        # Dickey-Fuller regression of the change in the spread on its
+        # previous value, with a constant
+        lagged = spread[:-1] - spread[:-1].mean()
+        changes = np.diff(spread)
+        lagged_var = (lagged**2).sum()
+        if lagged_var == 0:
+            results.append((hedge_ratio, np.nan, np.nan, np.nan, n_obs))
+            continue
+        phi = lagged.dot(changes) / lagged_var
+        residuals = changes - changes.mean() - phi * lagged
+        phi_se = np.sqrt(residuals.dot(residuals) / (n_obs - 3)
+                         / lagged_var)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            df_stat = phi / phi_se
+        half_life = -np.log(2) / phi if phi < 0 else np.inf
+
+        recent = spread[-lookback:]
+        recent_std = recent.std()
+        spread_zscore = ((spread[-1] - recent.mean()) / recent_std
+                         if recent_std > 0 else np.nan)
+        results.append((hedge_ratio, df_stat, half_life, spread_zscore,
+                        n_obs))
+    return results
+
+
+def screen_pairs(security_data, col_name='close', top_k=5, block_size=500,
+                 min_periods=60, lookback=200, max_workers=None,
+                 chunk_size=1000):
+    """Finds candidate pairs for pairs_trade() in a universe of
+    securities. The return correlation matrix is computed in blocks from
+    the same returns as generate_returns(), only the top_k most correlated
+    partners of each security are kept, and the spread of each kept
+    pair is tested for mean reversion across a process pool.
+
+    Each row can be traded with, e.g.
+
+        pairs_trade(security_data[['close_' + row.security_1]],
+                    security_data[['close_' + row.security_2]], 'close',
+                    ['_' + row.security_1, '_' + row.security_2])
+
+    Parameters
+    ----------
+    security_data : DataFrame
+        The merged DataFrame of security data, e.g. from
+        get_security_data()
+    col_name : str, default 'close'
+        Close, Open, etc.
+    top_k : int, default 5
+        The number of most correlated partners kept for each security
+    block_size : int, default 500
+        The number of securities per block of the correlation matrix,
+        which bounds its memory to block_size times the number of
+        securities
+    min_periods : int, default 60
+        The minimum number of dates both securities need returns for
+    lookback : int, default 200
+        The number of rows for the latest spread z-score
+    max_workers : int, default None
+        The number of worker processes. If set to None, use the number
+        of CPUs. If set to 1, run in this process.
+    chunk_size : int, default 1000
+        The number of pairs per task
 
-    for i in range(200, len(join_df)):
-        rolling_means = [np.mean(join_df[col][i-200 : i]) for col in column_names]
-        rolling_stds = [np.std(join_df[col][i-200 : i]) for col in column_names]
-        norm_values = [(join_df[column_names[j]][i] - rolling_means[j])/rolling_stds[j] for j in range(2)]
+    Returns
+    -------
+    pairs_df : DataFrame
+        One row per candidate pair, most mean reverting first, with the
+        securities, the return correlation, the hedge ratio of the log
+        prices, the Dickey-Fuller statistic of the spread (below about
+        -3.34 rejects no cointegration at 5%), the half-life of the
+        spread in rows, the latest spread z-score and the number of
+        observations
+    """
 
-    return join_df
+    col_name = col_name.lower()
+    securities = _listify_security(_get_security_names(security_data))
+    price_cols = ['{}_{}'.format(col_name, sec) for sec in securities]
+    prices = security_data[price_cols].values.astype(float)
+
+    # The returns of generate_returns(), without adding thousands of
+    # columns to a DataFrame
+    returns = _get_returns(prices)
+    returns[~np.isfinite(returns)] = np.nan
+
+    firsts, seconds, corrs = _get_top_correlations(returns, top_k,
+                                                   block_size, min_periods)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        log_prices = np.log(prices)
+    log_prices[~np.isfinite(log_prices)] = np.nan
+
+    tasks = [(firsts[start:start + chunk_size],
+              seconds[start:start + chunk_size], lookback)
+                 for start in xrange(0, len(firsts), chunk_size)]
+    screen_data = {'log_prices': log_prices}
+    try:
+        if max_workers == 1 or not tasks:
+            _init_screen_worker(screen_data)
+            chunk_results = [_run_pair_stats_task(*task) for task in tasks]
+        else:
+            pool = multiprocessing.Pool(max_workers,
+                                        initializer=_init_screen_worker,
+                                        initargs=(screen_data,))
+            try:
+                # map() keeps the results in the order of the pairs
+                chunk_results = pool.map(_run_pair_stats_pool_task, tasks)
+            finally:
+                pool.terminate()
+                pool.join()
+    finally:
+        _screen_data.clear()
+
+    stats = [result for results in chunk_results for result in results]
+    columns = ['hedge_ratio', 'df_stat', 'half_life', 'spread_zscore',
+               'n_obs']
+    pairs_df = pd.DataFrame(stats, columns=columns)
+    securities = np.array(securities, dtype=object)
+    pairs_df.insert(0, 'security_1', securities[firsts])
+    pairs_df.insert(1, 'security_2', securities[seconds])
+    pairs_df.insert(2, 'correlation', corrs)
+    pairs_df['n_obs'] = pairs_df['n_obs'].astype(int)
+    return pairs_df.sort_values(['df_stat', 'correlation'],
+                                ascending=[True, False])\
+                   .reset_index(drop=True)
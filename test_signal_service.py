@@ -0,0 +1,102 @@
+"""Tests for signal_service. Run from the repository root with
+
+    python -m unittest test_signal_service
+"""
+
+import shutil
+import tempfile
+import unittest
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+import signal_service as ss
+import ta_functions as ta
+from test_ta_functions import fake_provider, make_security_df
+
+
+class signal_service_test(unittest.TestCase):
+    indicators = {'bollinger_bands': (20, 2.0), 'ma_crossovers': [5, 20],
+                  'rsi': (14, 30, 70)}
+
+    def setUp(self):
+        self.security_df = make_security_df(500, ('aapl',))
+
+    def _run(self, ticks, **kwargs):
+        """Runs a service over the ticks with one subscriber and returns
+        the service and subscriber."""
+        service = ss.signal_service(ss.signal_engine(self.indicators))
+        subscriber = service.subscribe(**kwargs)
+        service.run(ticks)
+        return service, subscriber
+
+    def test_replay_matches_get_buy_sell_signals(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            store = ta.data_storage(tmp_dir,
+                                    provider=fake_provider(self.security_df))
+            signal_df = ta.get_buy_sell_signals(
+                'aapl', 'Close', '2015-01-01', '2016-05-14',
+                indicators=self.indicators, data_store=store)
+        finally:
+            plt.close('all')
+            shutil.rmtree(tmp_dir)
+
+        service, subscriber = self._run(ss.replay_ticks(self.security_df))
+        events = list(subscriber)
+        self.assertEqual(service.n_ticks, len(self.security_df))
+        self.assertEqual(service.n_events, len(events))
+
+        for indicator, signal_col in [
+                ('bollinger_bands', 'bollinger_signal_aapl'),
+                ('ma_crossovers', 'ma_crossover_signal_aapl'),
+                ('rsi', 'rsi_signal_aapl')]:
+            signals = signal_df[signal_col]
+            signals = signals[signals != 'N/A']
+            expected = [(str(timestamp), signal)
+                        for timestamp, signal in signals.iteritems()]
+            self.assertTrue(expected)
+            self.assertEqual([(event.timestamp, event.signal)
+                              for event in events
+                              if event.indicator == indicator], expected)
+
+    def test_replay_skips_missing_prices(self):
+        security_df = make_security_df(50, ('aapl', 'msft'), gap_prob=0.1)
+        ticks = list(ss.replay_ticks(security_df))
+        prices = security_df[['close_aapl', 'close_msft']]
+        self.assertEqual(len(ticks), prices.count().sum())
+        self.assertFalse(any(np.isnan(price) for _, _, price in ticks))
+
+    def test_drop_counts_overflow(self):
+        service, subscriber = self._run(ss.replay_ticks(self.security_df),
+                                        maxsize=3, overflow='drop')
+        self.assertGreater(service.n_events, 3)
+        # Closing a full queue drops its oldest event to make room
+        self.assertEqual(subscriber.n_dropped, service.n_events - 2)
+        events = list(subscriber)
+        self.assertEqual(len(events), 2)
+        self.assertTrue(subscriber.queue.empty())
+
+    def test_block_waits_for_subscriber(self):
+        service = ss.signal_service(ss.signal_engine(self.indicators))
+        subscriber = service.subscribe(maxsize=1)
+        thread = ss.threading.Thread(
+            target=service.run, args=(ss.replay_ticks(self.security_df),))
+        thread.start()
+        events = list(subscriber)
+        thread.join()
+        self.assertEqual(len(events), service.n_events)
+        self.assertEqual(subscriber.n_dropped, 0)
+
+    def test_serve_connect_round_trip(self):
+        ticks = list(ss.replay_ticks(make_security_df(200, ('aapl', 'msft'))))
+        server = ss.serve_ticks(iter(ticks))
+        try:
+            host, port = server.server_address
+            self.assertEqual(list(ss.connect_ticks(host, port)), ticks)
+        finally:
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
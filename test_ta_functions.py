@@ -0,0 +1,1698 @@
+"""Tests for ta_functions. Run from the repository root with
+
+    python -m unittest test_ta_functions
+"""
+
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from timeit import default_timer
+import unittest
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import benchmarks
+import ta_functions as ta
+
+
+def make_security_df(n_rows, securities=('aapl', 'msft'), seed=0,
+                     gap_prob=0.0):
+    """Returns a deterministic DataFrame of synthetic prices in the
+    layout of get_security_data(), with a random walk of close prices."""
+    rng = np.random.RandomState(seed)
+    index = pd.date_range('2015-01-01', periods=n_rows, freq='D',
+                          name='Date')
+    columns = []
+    values = []
+    for security in securities:
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n_rows)))
+        if gap_prob > 0:
+            close[rng.rand(n_rows) < gap_prob] = np.nan
+        for col_name in ['open', 'high', 'low', 'close']:
+            columns.append('{}_{}'.format(col_name, security))
+            values.append(close)
+        columns.append('volume_{}'.format(security))
+        values.append(rng.randint(100, 10000, n_rows).astype(float))
+    return pd.DataFrame(np.column_stack(values), index=index,
+                        columns=columns)
+
+
+class rsi_test(unittest.TestCase):
+    def _assert_matches_agg(self, prices, ndays=15):
+        """Checks _get_rsi() against _rsi_agg() over each rolling window,
+        as generate_rsi_columns() used to compute it."""
+        expected = pd.Series(prices).rolling(ndays)\
+            .aggregate(ta._rsi_agg).values
+        np.testing.assert_allclose(ta._get_rsi(prices, ndays), expected,
+                                   rtol=0, atol=1e-10)
+
+    def test_flat_prices(self):
+        self._assert_matches_agg(np.full(100, 50.))
+
+    def test_monotonic_prices(self):
+        self._assert_matches_agg(np.arange(100, 200, dtype=float))
+        self._assert_matches_agg(np.arange(200, 100, -1, dtype=float))
+
+    def test_random_prices(self):
+        prices = make_security_df(2000, ('aapl',))['close_aapl'].values
+        for ndays in [2, 5, 15, 50]:
+            self._assert_matches_agg(prices, ndays)
+
+    def test_missing_prices(self):
+        prices = make_security_df(2000, ('aapl',),
+                                  gap_prob=0.02)['close_aapl'].values
+        self._assert_matches_agg(prices)
+
+    def test_flat_and_monotonic_stretches(self):
+        prices = np.concatenate([np.full(30, 50.), np.arange(50., 80.),
+                                 np.arange(80., 50., -1), [np.nan],
+                                 np.full(30, 50.)])
+        self._assert_matches_agg(prices, 10)
+
+
+class signal_test(unittest.TestCase):
+    def setUp(self):
+        self.security_df = make_security_df(1000, gap_prob=0.01)
+        self.prices = self.security_df['close_aapl']
+
+    def _get_strs(self, buy, sell):
+        """Returns the signals as the per-row code that the signal codes
+        replaced made them."""
+        return ['Buy' if is_buy else 'Sell' if is_sell else 'N/A'
+                    for is_buy, is_sell in zip(buy, sell)]
+
+    def _assert_signals(self, generate, signal_col_name, expected):
+        """Checks the signal column of every signal_dtype against the
+        expected strings."""
+        dtypes = {'str': np.object_, 'int8': np.int8, 'category': 'category'}
+        for signal_dtype, dtype in dtypes.items():
+            signals = generate(signal_dtype=signal_dtype)[signal_col_name]
+            self.assertEqual(signals.dtype, dtype)
+            self.assertEqual(ta.signal_strings(signals).tolist(), expected)
+
+    def test_bollinger_signals(self):
+        rolling_window = self.prices.rolling(20)
+        high = rolling_window.mean() + 2.0 * rolling_window.std()
+        low = rolling_window.mean() - 2.0 * rolling_window.std()
+        self._assert_signals(
+            lambda **kwargs: ta.generate_bollinger_columns(
+                self.security_df, 'aapl', 'close', 20, 2.0, **kwargs),
+            'bollinger_signal_aapl',
+            self._get_strs(self.prices < low, self.prices > high))
+
+    def test_ma_crossover_signals(self):
+        short_ma = self.prices.rolling(5).mean()
+        long_ma = self.prices.rolling(20).mean()
+        ma_diff = (short_ma - long_ma).values
+        crossover = [0] + (np.sign(ma_diff[:-1] * ma_diff[1:]) == -1)\
+            .astype(int).tolist()
+        is_crossover = np.array(crossover) == 1
+
+        generate = lambda **kwargs: ta.generate_ma_columns(
+            self.security_df, 'aapl', 'close', [5, 20], **kwargs)
+        self.assertEqual(generate()['crossover_aapl'].tolist(), crossover)
+        self._assert_signals(
+            generate, 'ma_crossover_signal_aapl',
+            self._get_strs(is_crossover & (short_ma > long_ma),
+                           is_crossover & (short_ma < long_ma)))
+
+    def test_rsi_signals(self):
+        rsi = self.prices.rolling(14).aggregate(ta._rsi_agg)
+        self._assert_signals(
+            lambda **kwargs: ta.generate_rsi_columns(
+                self.security_df, 'aapl', 'close', 14, [30, 70], **kwargs),
+            'rsi_signal_aapl', self._get_strs(rsi < 30, rsi > 70))
+
+
+class output_test(unittest.TestCase):
+    def setUp(self):
+        self.security_df = make_security_df(300, gap_prob=0.02)
+        securities = ['aapl', 'msft']
+        # Each generator with its default output
+        self.generators = [
+            (lambda df, **kwargs: ta.generate_bollinger_columns(
+                df, securities, 'close', 20, 2.0, **kwargs), 'copy'),
+            (lambda df, **kwargs: ta.generate_ma_columns(
+                df, securities, 'close', [5, 20], **kwargs), 'copy'),
+            (lambda df, **kwargs: ta.generate_ewma_columns(
+                df, securities, 'close', [12, 26], **kwargs), 'copy'),
+            (lambda df, **kwargs: ta.generate_rsi_columns(
+                df, securities, 'close', 14, [30, 70], **kwargs), 'copy'),
+            (lambda df, **kwargs: ta.generate_returns(
+                df, securities, 'close', **kwargs), 'inplace')]
+
+    def test_copy(self):
+        for generate, _ in self.generators:
+            security_df = self.security_df.copy()
+            result_df = generate(security_df, output='copy')
+            self.assertIsNot(result_df, security_df)
+            pd.testing.assert_frame_equal(security_df, self.security_df)
+            pd.testing.assert_frame_equal(
+                result_df[self.security_df.columns], self.security_df)
+            self.assertGreater(len(result_df.columns),
+                               len(self.security_df.columns))
+
+    def test_inplace(self):
+        for generate, _ in self.generators:
+            expected_df = generate(self.security_df, output='copy')
+            security_df = self.security_df.copy()
+            result_df = generate(security_df, output='inplace')
+            self.assertIs(result_df, security_df)
+            pd.testing.assert_frame_equal(security_df, expected_df)
+
+    def test_columns(self):
+        for generate, _ in self.generators:
+            expected_df = generate(self.security_df, output='copy')
+            new_cols = [col for col in expected_df.columns
+                        if col not in self.security_df.columns]
+            security_df = self.security_df.copy()
+            result_df = generate(security_df, output='columns')
+            pd.testing.assert_frame_equal(security_df, self.security_df)
+            self.assertEqual(list(result_df.columns), new_cols)
+            pd.testing.assert_index_equal(result_df.index,
+                                          self.security_df.index)
+            pd.testing.assert_frame_equal(result_df, expected_df[new_cols])
+
+    def test_default_output(self):
+        for generate, default in self.generators:
+            security_df = self.security_df.copy()
+            result_df = generate(security_df)
+            self.assertEqual(result_df is security_df, default == 'inplace')
+            pd.testing.assert_frame_equal(
+                result_df, generate(self.security_df, output='copy'))
+
+    def test_invalid_output(self):
+        for generate, _ in self.generators:
+            security_df = self.security_df.copy()
+            with self.assertRaises(ValueError):
+                generate(security_df, output='view')
+            pd.testing.assert_frame_equal(security_df, self.security_df)
+
+
+class simulation_test(unittest.TestCase):
+    def _run(self, security_df, indicators, engine, **kwargs):
+        port = ta.run_simulation_df(security_df, 'close',
+                                    indicators=indicators, verbose=False,
+                                    plot_options=set(), engine=engine,
+                                    **kwargs)
+        return port.get_all_transactions()
+
+    def test_array_engine_matches_iterrows(self):
+        security_df = make_security_df(2000, ('aapl', 'msft', 'ibm'))
+        for indicators in [{'ma_crossovers': [5, 20]},
+                           {'ewma_crossovers': [12, 26]},
+                           {'bollinger_bands': (20, 2.0)},
+                           {'ma_crossovers': [5, 20],
+                            'ewma_crossovers': [12, 26],
+                            'bollinger_bands': (20, 2.0)}]:
+            array_trans = self._run(security_df, indicators, 'array')
+            iterrows_trans = self._run(security_df, indicators, 'iterrows')
+            self.assertGreater(len(array_trans), 0)
+            pd.testing.assert_frame_equal(array_trans, iterrows_trans)
+
+    def test_array_engine_with_missing_prices(self):
+        security_df = make_security_df(1000, gap_prob=0.02)
+        indicators = {'ma_crossovers': [5, 20], 'bollinger_bands': (20, 2.0)}
+        pd.testing.assert_frame_equal(
+            self._run(security_df, indicators, 'array'),
+            self._run(security_df, indicators, 'iterrows'))
+
+    def test_input_is_not_changed(self):
+        security_df = make_security_df(500)
+        original_df = security_df.copy()
+        self._run(security_df, {'ma_crossovers': [5, 20],
+                                'bollinger_bands': (20, 2.0)}, 'array')
+        pd.testing.assert_frame_equal(security_df, original_df)
+
+
+class precision_test(unittest.TestCase):
+    def test_float32_is_within_tolerance(self):
+        security_df = make_security_df(3000, ('aapl', 'msft', 'ibm'),
+                                       gap_prob=0.01)
+        securities = ['aapl', 'msft', 'ibm']
+        for generate in [
+                lambda **kwargs: ta.generate_bollinger_columns(
+                    security_df, securities, 'close', 20, 2.0, **kwargs),
+                lambda **kwargs: ta.generate_ma_columns(
+                    security_df, securities, 'close', [5, 20], **kwargs),
+                lambda **kwargs: ta.generate_ewma_columns(
+                    security_df, securities, 'close', [12, 26], **kwargs),
+                lambda **kwargs: ta.generate_rsi_columns(
+                    security_df, securities, 'close', 14, [30, 70],
+                    **kwargs)]:
+            expected_df = generate(output='columns')
+            float32_df = generate(output='columns', float_dtype='float32')
+            self.assertEqual(list(float32_df.columns),
+                             list(expected_df.columns))
+            for col in expected_df.columns:
+                if float32_df[col].dtype == np.float32:
+                    np.testing.assert_allclose(float32_df[col],
+                                               expected_df[col], rtol=1e-7)
+                else:
+                    np.testing.assert_array_equal(
+                        float32_df[col].astype(expected_df[col].dtype),
+                        expected_df[col])
+
+    def test_float32_simulation_makes_the_same_trades(self):
+        # Over a flat stretch of prices the bands equal the price, so
+        # comparing the price to bands rounded to float32 would trade
+        security_df = make_security_df(600).round(2)
+        rows = np.arange(len(security_df))
+        for start in [200, 400]:
+            rows[start:start + 40] = start
+        security_df = pd.DataFrame(security_df.values[rows],
+                                   index=security_df.index,
+                                   columns=security_df.columns)
+        for indicators in [{'bollinger_bands': (20, 2.0)},
+                           {'ma_crossovers': [5, 20],
+                            'ewma_crossovers': [12, 26],
+                            'bollinger_bands': (20, 2.0)}]:
+            for engine in ['array', 'iterrows']:
+                transactions = [
+                    ta.run_simulation_df(
+                        security_df, 'close', indicators=indicators,
+                        verbose=False, plot_options=set(), engine=engine,
+                        float_dtype=float_dtype).get_all_transactions()
+                    for float_dtype in ['float64', 'float32']]
+                pd.testing.assert_frame_equal(*transactions)
+
+
+class security_panel_test(unittest.TestCase):
+    def test_fields_of_other_securities_are_kept(self):
+        security_df = make_security_df(300)
+        panel = ta.security_panel.from_frame(security_df)
+        panel = ta.generate_bollinger_columns(panel, 'aapl', 'close', 20, 2.0)
+        panel = ta.generate_bollinger_columns(panel, 'msft', 'close', 20, 2.0)
+
+        expected_df = ta.generate_bollinger_columns(
+            security_df, ['aapl', 'msft'], 'close', 20, 2.0)
+        high = panel.get_field('close_bollinger_high')
+        self.assertEqual(list(np.isnan(high).sum(axis=0)), [19, 19])
+        for i, security in enumerate(['aapl', 'msft']):
+            np.testing.assert_array_equal(
+                high[:, i],
+                expected_df['close_bollinger_high_{}'.format(security)])
+
+
+class portfolio_test(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.dates = pd.date_range('2015-01-01', periods=200, freq='D')
+        self.securities = rng.choice(['aapl', 'msft'], 200)
+        self.prices = rng.uniform(50, 150, 200).round(2)
+
+    def _trade(self, sec_port):
+        """Buys and sells each security in turn, one trade at a time."""
+        for trans_date, security, price in zip(self.dates, self.securities,
+                                               self.prices):
+            if sec_port.security_dict.get(security):
+                sec_port.sell_all_securities(security, price, trans_date)
+            else:
+                sec_port.buy_securities(security, 10, price, trans_date)
+
+    def _get_old_transactions(self):
+        """Returns the transactions of _trade() as the old ledger, which
+        appended each trade to a DataFrame, recorded them."""
+        trans_df = pd.DataFrame(columns=['date', 'security', 'trans_type',
+                                         'security_price', 'amt',
+                                         'total_cash_amt'])
+        cash_amt = 1e6
+        holdings = {}
+        for trans_date, security, price in zip(self.dates, self.securities,
+                                               self.prices):
+            if holdings.get(security):
+                amount, trans_type = holdings[security], 'Sell'
+                cash_amt += amount * price
+                holdings[security] = 0
+            else:
+                amount, trans_type = 10, 'Buy'
+                cash_amt -= amount * price
+                holdings[security] = amount
+            trans_df.loc[trans_df.shape[0]] = [trans_date, security,
+                                               trans_type, price,
+                                               price * amount, cash_amt]
+        return trans_df
+
+    def test_matches_old_ledger(self):
+        sec_port = ta.security_portfolio(1e6)
+        self._trade(sec_port)
+        old_trans_df = self._get_old_transactions()
+        pd.testing.assert_frame_equal(sec_port.get_all_transactions(),
+                                      old_trans_df)
+        self.assertEqual(sec_port.get_avg_transaction_freq(),
+                         old_trans_df['date'].diff().mean())
+        sells = old_trans_df[old_trans_df['trans_type'] == 'Sell']
+        self.assertEqual(sec_port.get_last_sell_cash_amt(),
+                         sells['total_cash_amt'].iloc[-1])
+
+    def test_bulk_trades_match_single_trades(self):
+        sec_port = ta.security_portfolio(1e6)
+        self._trade(sec_port)
+        trans_df = sec_port.get_all_transactions()
+
+        bulk_port = ta.security_portfolio(1e6)
+        # Interleave single trades with bulk ones
+        self._trade_rows(bulk_port, trans_df.iloc[:50])
+        bulk_port._add_transactions(
+            trans_df['date'].iloc[50:].values,
+            trans_df['security'].iloc[50:].values,
+            np.where(trans_df['trans_type'].iloc[50:] == 'Buy', ta.BUY,
+                     ta.SELL),
+            (trans_df['amt'] / trans_df['security_price']).round()
+                .astype(int).iloc[50:].values,
+            trans_df['security_price'].iloc[50:].values,
+            trans_df['total_cash_amt'].iloc[50:].values)
+        pd.testing.assert_frame_equal(bulk_port.get_all_transactions(),
+                                      trans_df)
+        self.assertEqual(bulk_port.security_dict, sec_port.security_dict)
+
+    def _trade_rows(self, sec_port, trans_df):
+        """Makes the trades of a transaction DataFrame one at a time."""
+        for row in trans_df.itertuples():
+            if row.trans_type == 'Buy':
+                sec_port.buy_securities(row.security, 10, row.security_price,
+                                        row.date)
+            else:
+                sec_port.sell_all_securities(row.security,
+                                             row.security_price, row.date)
+
+    def test_trans_df_can_be_assigned(self):
+        sec_port = ta.security_portfolio(1e6)
+        self._trade(sec_port)
+        trans_df = sec_port.trans_df.copy()
+
+        new_port = ta.security_portfolio(1e6)
+        new_port.trans_df = trans_df.iloc[:100]
+        pd.testing.assert_frame_equal(new_port.trans_df, trans_df.iloc[:100])
+        new_port.total_cash_amt = trans_df['total_cash_amt'].iloc[99]
+        self._trade_rows(new_port, trans_df.iloc[100:])
+        pd.testing.assert_frame_equal(new_port.trans_df, trans_df)
+
+    def test_records_500k_trades_quickly(self):
+        n_trades = 500000
+        dates = pd.date_range('2000-01-03', periods=n_trades, freq='T')
+        trans_types = np.tile(np.array([ta.BUY, ta.SELL], dtype=np.int8),
+                              n_trades // 2)
+        prices = np.tile([100.0, 101.0], n_trades // 2)
+        amounts = np.full(n_trades, 10, dtype=np.int64)
+        cash_amts = 1e12 + np.cumsum(np.where(trans_types == ta.BUY, -1, 1)
+                                         * prices * amounts)
+
+        start_time = default_timer()
+        sec_port = ta.security_portfolio(1e12)
+        sec_port._add_transactions(dates,
+                                   np.full(n_trades, 'aapl', dtype=object),
+                                   trans_types, amounts, prices, cash_amts)
+        self.assertEqual(len(sec_port.get_all_transactions()), n_trades)
+        self.assertLess(default_timer() - start_time, 1.)
+
+        # One at a time, the calls to buy_securities() and
+        # sell_securities() cost about as much as the recording
+        dates = list(dates)
+        start_time = default_timer()
+        sec_port = ta.security_portfolio(1e12)
+        for i in xrange(0, n_trades, 2):
+            sec_port.buy_securities('aapl', 10, 100.0, dates[i])
+            sec_port.sell_securities('aapl', 10, 101.0, dates[i + 1])
+        self.assertEqual(len(sec_port.get_all_transactions()), n_trades)
+        self.assertLess(default_timer() - start_time, 2.)
+
+
+class sweep_test(unittest.TestCase):
+    def setUp(self):
+        self.security_df = make_security_df(1500, ('aapl', 'msft', 'ibm'))
+        self.param_grid = {'ma_crossovers': [[5, 20], [10, 30]],
+                           'bollinger_bands': [(20, 2.0)]}
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _sweep(self, universe, **kwargs):
+        return ta.sweep_simulation(self.security_df, 'close', self.param_grid,
+                                   universe=universe, max_workers=1, **kwargs)
+
+    def test_group_order_does_not_matter(self):
+        results_df = self._sweep([['msft', 'ibm'], ['ibm', 'msft']])
+        n_rows = len(results_df) // 2
+        first = results_df.iloc[:n_rows].reset_index(drop=True)
+        second = results_df.iloc[n_rows:].reset_index(drop=True)
+        pd.testing.assert_frame_equal(first, second)
+
+        port = ta.run_simulation_df(
+            self.security_df[[col for col in self.security_df.columns
+                              if not col.endswith('_aapl')]],
+            'close', indicators={'ma_crossovers': [5, 20],
+                                 'bollinger_bands': (20, 2.0)},
+            verbose=False, plot_options=set())
+        self.assertAlmostEqual(first['final_cash_amt'][0],
+                               port.get_last_sell_cash_amt())
+        self.assertEqual(first['n_trades'][0],
+                         len(port.get_all_transactions()))
+
+    def test_process_pool_matches_serial_run(self):
+        universe = [['aapl', 'msft'], 'ibm', ['aapl', 'msft', 'ibm']]
+        pd.testing.assert_frame_equal(
+            ta.sweep_simulation(self.security_df, 'close', self.param_grid,
+                                universe=universe, max_workers=2),
+            self._sweep(universe))
+
+    def test_col_name_prices(self):
+        # Open prices that differ from the close prices
+        other_df = make_security_df(1500, ('aapl', 'msft', 'ibm'), seed=1)
+        for sec in ['aapl', 'msft', 'ibm']:
+            self.security_df['open_' + sec] = other_df['close_' + sec].values
+        self.param_grid = {'ma_crossovers': [[5, 20]],
+                           'bollinger_bands': [(20, 2.0)]}
+
+        results_df = ta.sweep_simulation(self.security_df, 'open',
+                                         self.param_grid, max_workers=1)
+        port = ta.run_simulation_df(
+            self.security_df, 'open',
+            indicators={'ma_crossovers': [5, 20],
+                        'bollinger_bands': (20, 2.0)},
+            verbose=False, plot_options=set())
+        self.assertAlmostEqual(results_df['final_cash_amt'][0],
+                               port.get_last_sell_cash_amt())
+        self.assertEqual(results_df['n_trades'][0],
+                         len(port.get_all_transactions()))
+        self.assertNotEqual(
+            results_df['final_cash_amt'][0],
+            self._sweep(None)['final_cash_amt'][0])
+
+    def test_resume_after_truncated_checkpoint(self):
+        checkpoint_file = os.path.join(self.tmp_dir, 'sweep.jsonl')
+        expected_df = self._sweep(None, checkpoint_file=checkpoint_file)
+        with open(checkpoint_file) as f:
+            lines = f.readlines()
+        with open(checkpoint_file, 'w') as f:
+            f.writelines(lines[:-1])
+            f.write(lines[-1][:len(lines[-1]) // 2])
+
+        resumed_df = self._sweep(None, checkpoint_file=checkpoint_file)
+        pd.testing.assert_frame_equal(resumed_df, expected_df)
+        with open(checkpoint_file) as f:
+            self.assertEqual(f.readlines(), lines)
+
+
+class streaming_test(unittest.TestCase):
+    def _get_bands(self, prices, bollinger_len, bollinger_std):
+        """Returns the (high, low) Bollinger bands of a Series with
+        pandas."""
+        rolling = prices.rolling(bollinger_len)
+        return (rolling.mean() + bollinger_std * rolling.std(),
+                rolling.mean() - bollinger_std * rolling.std())
+
+    def test_bollinger_matches_pandas(self):
+        prices = make_security_df(5000, ('aapl',))['close_aapl']
+        bollinger = ta.streaming_bollinger(20, 2.0)
+        values = np.array([bollinger.update(price)[0]
+                               for price in prices.tolist()])
+        high, low = self._get_bands(prices, 20, 2.0)
+        np.testing.assert_allclose(values[:, 0], high.values, rtol=1e-10)
+        np.testing.assert_allclose(values[:, 1], low.values, rtol=1e-10)
+
+    def test_bollinger_skips_missing_prices(self):
+        prices = make_security_df(2000, ('aapl',), gap_prob=0.05)['close_aapl']
+        bollinger = ta.streaming_bollinger(20, 2.0)
+        values = [bollinger.update(price)[0] for price in prices.tolist()]
+        is_valid = prices.notnull().values
+        values = np.array(values)[is_valid]
+        high, low = self._get_bands(prices.dropna(), 20, 2.0)
+        np.testing.assert_allclose(values[:, 0], high.values, rtol=1e-10)
+        np.testing.assert_allclose(values[:, 1], low.values, rtol=1e-10)
+
+        seeded = ta.streaming_bollinger(20, 2.0)
+        seeded.seed(prices.values)
+        np.testing.assert_allclose(seeded.value, bollinger.value, rtol=1e-10)
+
+    def test_bollinger_does_not_drift(self):
+        # Prices far from zero with small changes lose the most precision
+        rng = np.random.RandomState(0)
+        prices = 1e6 + np.cumsum(rng.normal(0, 1e-3, 200000))
+        bollinger = ta.streaming_bollinger(20, 2.0)
+        for price in prices.tolist():
+            bollinger.update(price)
+        window = prices[-20:]
+        expected_std = window.std(ddof=1)
+        self.assertAlmostEqual((bollinger.value[0] - bollinger.value[1]) / 4,
+                               expected_std, delta=expected_std * 1e-6)
+
+    def _update_all(self, indicator, prices):
+        """Returns the value after each price, then the signal if any."""
+        return [indicator.update(price) for price in prices.tolist()]
+
+    def test_sma_matches_pandas(self):
+        for gap_prob in (0.0, 0.05):
+            prices = make_security_df(2000, ('aapl',),
+                                      gap_prob=gap_prob)['close_aapl']
+            values = self._update_all(ta.streaming_sma(10), prices)
+            np.testing.assert_allclose(values,
+                                       prices.rolling(10).mean().values,
+                                       rtol=1e-10)
+
+            seeded = ta.streaming_sma(10)
+            seeded.seed(prices.values[:1000])
+            for price in prices.values[1000:].tolist():
+                seeded.update(price)
+            np.testing.assert_allclose(seeded.value, values[-1], rtol=1e-10)
+
+    def test_sma_gap_leaves_window(self):
+        prices = pd.Series([1., 2., 3., 4., 5., 6., np.nan, np.nan, 7., 8.,
+                            9., 10.])
+        values = self._update_all(ta.streaming_sma(3), prices)
+        np.testing.assert_allclose(values, prices.rolling(3).mean().values)
+
+    def test_ewma_matches_pandas(self):
+        prices = make_security_df(2000, ('aapl',), gap_prob=0.05)['close_aapl']
+        # Leading missing prices have no average
+        prices.iloc[:3] = np.nan
+        for adjust in (True, False):
+            values = self._update_all(ta.streaming_ewma(span=12,
+                                                        adjust=adjust),
+                                      prices)
+            expected = prices.ewm(span=12, adjust=adjust).mean().values
+            np.testing.assert_allclose(values, expected, rtol=1e-12)
+
+            seeded = ta.streaming_ewma(span=12, adjust=adjust)
+            seeded.seed(prices.values[:1000])
+            for price in prices.values[1000:].tolist():
+                seeded.update(price)
+            np.testing.assert_allclose(seeded.value, values[-1], rtol=1e-12)
+
+    def test_ewma_matches_generate_ewma_columns(self):
+        security_df = make_security_df(2000, ('aapl',), gap_prob=0.05)
+        ewma_df = ta.generate_ewma_columns(security_df, 'aapl', 'Close',
+                                           spans=[12, 26])
+        values = self._update_all(ta.streaming_ewma(span=12),
+                                  security_df['close_aapl'])
+        np.testing.assert_allclose(values,
+                                   ewma_df['close_12d_ewma_aapl'].values,
+                                   rtol=1e-10)
+
+    def test_ma_crossover_matches_generate_ma_columns(self):
+        for gap_prob in (0.0, 0.05):
+            security_df = make_security_df(3000, ('aapl',),
+                                           gap_prob=gap_prob)
+            ma_df = ta.generate_ma_columns(security_df, 'aapl', 'Close',
+                                           [5, 20], signal_dtype='int8')
+            values = self._update_all(ta.streaming_ma_crossover([5, 20]),
+                                      security_df['close_aapl'])
+            ma_diffs, signals = zip(*values)
+            np.testing.assert_allclose(ma_diffs, ma_df['ma_diff_aapl'].values,
+                                       rtol=1e-8, atol=1e-10)
+            np.testing.assert_array_equal(
+                signals, ma_df['ma_crossover_signal_aapl'].values)
+            self.assertTrue((np.array(signals) != ta.NO_SIGNAL).any())
+
+    def test_rsi_matches_generate_rsi_columns(self):
+        for method in ('simple', 'wilder'):
+            for gap_prob in (0.0, 0.02):
+                security_df = make_security_df(3000, ('aapl',),
+                                               gap_prob=gap_prob)
+                rsi_df = ta.generate_rsi_columns(security_df, 'aapl', 'Close',
+                                                 14, [30, 70], method=method,
+                                                 signal_dtype='int8')
+                prices = security_df['close_aapl']
+                values = self._update_all(
+                    ta.streaming_rsi(14, [30, 70], method=method), prices)
+                rsis, signals = zip(*values)
+                np.testing.assert_allclose(rsis, rsi_df['rsi_aapl'].values,
+                                           rtol=0, atol=1e-8)
+                np.testing.assert_array_equal(
+                    signals, rsi_df['rsi_signal_aapl'].values)
+
+                seeded = ta.streaming_rsi(14, [30, 70], method=method)
+                seeded.seed(prices.values[:1500])
+                for price in prices.values[1500:].tolist():
+                    seeded.update(price)
+                np.testing.assert_allclose(seeded.value, rsis[-1],
+                                           rtol=0, atol=1e-8)
+
+    def test_rsi_gap_is_not_a_flat_day(self):
+        # Without the gap the window would have no losses, giving 100
+        prices = np.array([1., 2., 3., np.nan, 4., 5., 6., 7.])
+        values = self._update_all(ta.streaming_rsi(3, [30, 70]), prices)
+        rsis = [rsi for rsi, _ in values]
+        np.testing.assert_allclose(rsis, ta._get_rsi(prices, 3))
+        self.assertTrue(np.isnan(rsis[5]))
+        self.assertEqual(rsis[6], 100.)
+
+
+class align_test(unittest.TestCase):
+    def setUp(self):
+        security_df = make_security_df(300, ('aapl', 'msft', 'ibm'))
+        rng = np.random.RandomState(0)
+        # Each security misses different dates
+        self.df_list = []
+        for security in ['aapl', 'msft', 'ibm']:
+            df = security_df[[col for col in security_df.columns
+                              if col.endswith('_' + security)]]
+            self.df_list.append(df[rng.rand(len(df)) > 0.1])
+
+    def _join(self, df_list, how):
+        """Merges the DataFrames with repeated joins, as
+        get_security_data() used to."""
+        security_df = df_list[0]
+        for df in df_list[1:]:
+            security_df = security_df.join(df, how=how)
+        return security_df
+
+    def test_matches_join(self):
+        for how in ['outer', 'inner', 'left']:
+            pd.testing.assert_frame_equal(
+                ta.align_security_data(self.df_list, how=how),
+                self._join(self.df_list, how))
+
+    def test_forward_fill(self):
+        for fill_limit in [None, 1]:
+            pd.testing.assert_frame_equal(
+                ta.align_security_data(self.df_list, fill_method='ffill',
+                                       fill_limit=fill_limit),
+                self._join(self.df_list, 'outer')
+                    .fillna(method='ffill', limit=fill_limit))
+
+    def test_aligned_and_integer_columns(self):
+        df_list = [df.astype({df.columns[-1]: np.int64})
+                       for df in self.df_list]
+        # Integer volumes stay integers when no dates are missing...
+        aligned_list = [df.loc[df_list[0].index.intersection(df.index)]
+                            for df in [df_list[0]] * 2]
+        aligned_list[1].columns = [col + '_2' for col in df_list[0].columns]
+        pd.testing.assert_frame_equal(
+            ta.align_security_data(aligned_list),
+            self._join(aligned_list, 'outer'))
+        # ...and become floats when they are
+        pd.testing.assert_frame_equal(ta.align_security_data(df_list),
+                                      self._join(df_list, 'outer'))
+
+
+class chunked_test(unittest.TestCase):
+    indicators = {'bollinger_bands': (20, 2.0), 'ma_crossovers': [5, 50],
+                  'rsi': (14, 30, 70)}
+
+    def _run(self, security_df, **kwargs):
+        """Returns generate_columns_chunked() of security_df read back
+        from its CSV file, and the indicator columns of security_df
+        computed in memory."""
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            input_path = os.path.join(tmp_dir, 'prices.csv')
+            output_path = os.path.join(tmp_dir, 'indicators.csv')
+            security_df.to_csv(input_path)
+            n_rows = ta.generate_columns_chunked(
+                input_path, output_path, self.indicators,
+                signal_dtype='int8', **kwargs)
+            chunked_df = pd.read_csv(output_path, index_col=0,
+                                     parse_dates=True,
+                                     float_precision='round_trip')
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        self.assertEqual(n_rows, len(security_df))
+        expected_df = ta._generate_indicator_columns(
+            security_df.copy(), ['aapl', 'msft'], 'close', self.indicators,
+            'int8')
+        self.assertEqual(list(chunked_df.columns), list(expected_df.columns))
+        return chunked_df, expected_df
+
+    def test_matches_in_memory(self):
+        security_df = make_security_df(3000, gap_prob=0.02)
+        # 8 bytes for each of 30 output columns, four times over, so
+        # about 300 rows per chunk after the 50 warmup rows
+        chunked_df, expected_df = self._run(
+            security_df, memory_budget=350 * 4 * 8 * 30)
+
+        # The prices, signals and crossovers are exact. read_csv() reads
+        # the int8 signals back as int64.
+        value_cols = [col for col in expected_df.columns
+                      if col not in security_df.columns
+                      and expected_df[col].dtype.kind == 'f']
+        exact_cols = [col for col in expected_df.columns
+                      if col not in value_cols]
+        pd.testing.assert_frame_equal(chunked_df[exact_cols],
+                                      expected_df[exact_cols],
+                                      check_dtype=False, check_exact=True,
+                                      check_names=False)
+        # The indicator values match to the rounding of the rolling sums,
+        # which restart at each chunk, as documented
+        for col in value_cols:
+            np.testing.assert_array_equal(chunked_df[col].isnull(),
+                                          expected_df[col].isnull())
+            np.testing.assert_allclose(chunked_df[col], expected_df[col],
+                                       rtol=1e-9, atol=1e-9)
+
+    def test_single_chunk_is_exact(self):
+        # With no chunk to restart the sums, only the CSV round trip is
+        # left, and it is lossless
+        chunked_df, expected_df = self._run(make_security_df(300))
+        pd.testing.assert_frame_equal(chunked_df, expected_df,
+                                      check_dtype=False, check_exact=True,
+                                      check_names=False)
+
+
+class import_test(unittest.TestCase):
+    plot_modules = ('IPython', 'matplotlib.pyplot', 'mpl_finance',
+                    'pandas_datareader', 'seaborn')
+
+    def _get_loaded(self, statement):
+        """Returns which plot_modules are loaded after running statement
+        in a new interpreter."""
+        code = ('import sys\n{}\nprint(",".join(m for m in {!r} '
+                'if m in sys.modules))'.format(statement, self.plot_modules))
+        output = subprocess.check_output(
+            [sys.executable, '-c', code],
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        return [name for name in output.strip().split(',') if name]
+
+    def test_import_skips_plot_modules(self):
+        self.assertEqual(self._get_loaded('import ta_functions'), [])
+
+    def test_plot_modules_load_on_use(self):
+        loaded = self._get_loaded('import ta_functions as ta\n'
+                                  'ta.plt.close("all")')
+        self.assertIn('matplotlib.pyplot', loaded)
+        # seaborn sets the plot style, as the eager import used to
+        self.assertIn('seaborn', loaded)
+
+    def test_colours_match_seaborn(self):
+        import seaborn as sns
+        colours = [ta.blue, ta.green, ta.red, ta.purple, ta.yellow, ta.teal]
+        np.testing.assert_allclose(colours,
+                                   sns.color_palette('colorblind')[:6])
+        np.testing.assert_allclose(
+            ta.blues, sns.color_palette('Blues', n_colors=6)[::-1])
+
+
+class ma_bank_test(unittest.TestCase):
+    def setUp(self):
+        # Long enough for several prefix sum blocks
+        self.security_df = make_security_df(3000, ('aapl', 'msft', 'ibm'),
+                                            gap_prob=0.01)
+        self.securities = ['aapl', 'msft', 'ibm']
+        self.ndays = [1, 5, 20, 256, 300]
+
+    def test_matches_rolling_mean(self):
+        bank = ta.ma_bank(self.security_df, self.securities, 'Close',
+                          self.ndays)
+        prices = self.security_df[['close_' + sec
+                                   for sec in self.securities]]
+        self.assertEqual(bank.values.shape, (3000, 5, 3))
+        for i, nday in enumerate(self.ndays):
+            np.testing.assert_allclose(bank.values[:, i],
+                                       prices.rolling(nday).mean().values,
+                                       rtol=1e-10)
+
+        ma_df = bank.to_frame()
+        self.assertTrue(np.shares_memory(ma_df.values, bank.values))
+        expected_df = ta.generate_ma_columns(self.security_df,
+                                             self.securities, 'close',
+                                             [20, 300])
+        ma_cols = ['close_{}d_ma_{}'.format(nday, sec)
+                   for sec in self.securities for nday in (20, 300)]
+        pd.testing.assert_index_equal(ma_df.index, expected_df.index)
+        np.testing.assert_allclose(ma_df[ma_cols].values,
+                                   expected_df[ma_cols].values, rtol=1e-10)
+
+    def test_crossover_matrix_matches_generate_ma_columns(self):
+        bank = ta.ma_bank(self.security_df, self.securities, 'close',
+                          [5, 20, 50])
+        pairs, signals = bank.get_crossover_matrix()
+        self.assertEqual(pairs, [(5, 20), (5, 50), (20, 50)])
+        for k, pair in enumerate(pairs):
+            ma_df = ta.generate_ma_columns(self.security_df, self.securities,
+                                           'close', list(pair),
+                                           signal_dtype='int8')
+            for j, security in enumerate(self.securities):
+                np.testing.assert_array_equal(
+                    signals[:, k, j],
+                    ma_df['ma_crossover_signal_' + security].values)
+        self.assertTrue((signals == ta.BUY).any())
+
+    def test_float32(self):
+        bank = ta.ma_bank(self.security_df, self.securities, 'close',
+                          self.ndays)
+        bank_32 = ta.ma_bank(self.security_df, self.securities, 'close',
+                             self.ndays, float_dtype='float32')
+        self.assertEqual(bank_32.values.dtype, np.float32)
+        np.testing.assert_allclose(bank_32.values, bank.values, rtol=1e-7)
+
+    def test_invalid_ndays(self):
+        for ndays in ([], [0, 5]):
+            with self.assertRaises(ValueError):
+                ta.ma_bank(self.security_df, 'aapl', 'close', ndays)
+
+
+class plot_ewma_test(unittest.TestCase):
+    def setUp(self):
+        self.security_df = make_security_df(500, ('aapl',))
+
+    def tearDown(self):
+        ta.plt.close('all')
+
+    def test_spans(self):
+        original_df = self.security_df.copy()
+        f, ax = ta.plt.subplots()
+        ewma_df = ta.plot_ewma_crossovers(self.security_df, 'Close', None,
+                                          spans=[5, 50], ax=ax)
+        pd.testing.assert_frame_equal(self.security_df, original_df)
+        pd.testing.assert_frame_equal(
+            ewma_df, ta.generate_ewma_columns(self.security_df, 'aapl',
+                                              'close', spans=[5, 50]))
+
+        # The price, then each EWMA
+        self.assertEqual(len(ax.lines), 3)
+        for line, span in zip(ax.lines[1:], [5, 50]):
+            np.testing.assert_array_equal(
+                line.get_ydata(),
+                ewma_df['close_{}d_ewma_aapl'.format(span)].values)
+
+    def test_default_spans(self):
+        ewma_df = ta.plot_ewma_crossovers(self.security_df, 'close', None)
+        self.assertIn('close_12d_ewma_aapl', ewma_df)
+        self.assertIn('close_26d_ewma_aapl', ewma_df)
+
+    def test_removed_parameters(self):
+        for param in ('com', 'span', 'halflife'):
+            with self.assertRaises(ValueError):
+                ta.plot_ewma_crossovers(self.security_df, 'close', None,
+                                        **{param: 12})
+
+
+class plot_signals_test(unittest.TestCase):
+    def setUp(self):
+        self.security_df = ta.generate_ma_columns(make_security_df(500),
+                                                  'aapl', 'close', [5, 20])
+
+    def tearDown(self):
+        ta.plt.close('all')
+
+    def _get_axvline_x(self, ax, dates, **kwargs):
+        """Draws one axvline per date, as the plots used to, and returns
+        their x positions."""
+        for x in dates:
+            ax.axvline(x, **kwargs)
+        return [line.get_xdata(orig=False)[0] for line in ax.lines]
+
+    def _get_segment_x(self, collection):
+        """Returns the x positions of the lines of a LineCollection."""
+        return [segment[0, 0] for segment in collection.get_segments()]
+
+    def _assert_in_view(self, ax):
+        """Checks that the x-axis shows every line, as it does for
+        axvline()."""
+        x = [x for collection in ax.collections
+             for x in self._get_segment_x(collection)]
+        x_min, x_max = ax.get_xlim()
+        self.assertLessEqual(x_min, min(x))
+        self.assertGreaterEqual(x_max, max(x))
+
+    def test_signals_match_axvline(self):
+        f, (ax, axvline_ax) = ta.plt.subplots(2, 1)
+        ta._plot_signals(self.security_df, 'ma_crossover_signal_aapl', ax)
+        self.assertEqual(len(ax.collections), 2)
+
+        signals = self.security_df['ma_crossover_signal_aapl']
+        n_lines = 0
+        for collection, signal, colour in zip(ax.collections,
+                                              ['Buy', 'Sell'],
+                                              [ta.red, ta.green]):
+            self.assertEqual(collection.get_label(),
+                             'ma_crossover_signal_aapl ' + signal)
+            np.testing.assert_allclose(collection.get_colors()[0][:3], colour)
+            expected_x = self._get_axvline_x(
+                axvline_ax, signals.index[signals == signal])[n_lines:]
+            n_lines += len(expected_x)
+            self.assertGreater(len(expected_x), 0)
+            self.assertEqual(self._get_segment_x(collection), expected_x)
+
+        self._assert_in_view(ax)
+        _, labels = ax.get_legend_handles_labels()
+        self.assertEqual(labels, ['ma_crossover_signal_aapl Buy',
+                                  'ma_crossover_signal_aapl Sell'])
+
+    def test_no_signals_draws_nothing(self):
+        security_df = self.security_df.copy()
+        security_df['ma_crossover_signal_aapl'] = 'N/A'
+        f, ax = ta.plt.subplots()
+        ta._plot_signals(security_df, 'ma_crossover_signal_aapl', ax)
+        self.assertEqual(ax.collections, [])
+
+    def test_trades_match_axvline(self):
+        port = ta.run_simulation_df(make_security_df(500), 'close',
+                                    indicators={'ma_crossovers': [5, 20]},
+                                    verbose=False, plot_options=set())
+        trans_df = port.get_all_transactions()
+        f, (ax, axvline_ax) = ta.plt.subplots(2, 1)
+        ta.plt.sca(ax)
+        ta.plot_trades(port)
+        n_lines = 0
+        for collection, trans_type in zip(ax.collections, ['Buy', 'Sell']):
+            expected_x = self._get_axvline_x(
+                axvline_ax,
+                trans_df['date'][trans_df['trans_type'] == trans_type]
+            )[n_lines:]
+            n_lines += len(expected_x)
+            self.assertEqual(collection.get_label(), trans_type)
+            self.assertEqual(self._get_segment_x(collection), expected_x)
+            self.assertEqual(collection.get_linewidths()[0], 3)
+        self._assert_in_view(ax)
+
+
+def make_pair_dfs(n_rows, seed=0, mean_reversion=0.95):
+    """Returns two DataFrames with a 'close' column whose log spread is a
+    mean-reverting AR(1) process, i.e. a cointegrated pair."""
+    rng = np.random.RandomState(seed)
+    index = pd.date_range('2015-01-01', periods=n_rows, freq='D',
+                          name='Date')
+    close_1 = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n_rows)))
+    shocks = rng.normal(0, 0.01, n_rows)
+    spread = np.zeros(n_rows)
+    for i in xrange(1, n_rows):
+        spread[i] = mean_reversion * spread[i - 1] + shocks[i]
+    return (pd.DataFrame({'close': close_1}, index=index),
+            pd.DataFrame({'close': close_1 * np.exp(-spread)}, index=index))
+
+
+class pairs_trade_test(unittest.TestCase):
+    def setUp(self):
+        self.df_1, self.df_2 = make_pair_dfs(2000)
+
+    def _run(self, **kwargs):
+        params = {'threshold': 2, 'exit_threshold': 0.5, 'lookback': 50}
+        params.update(kwargs)
+        return ta.pairs_trade(self.df_1, self.df_2, 'close', ['_a', '_b'],
+                              **params)
+
+    def _get_positions(self, zscore, threshold=2, exit_threshold=0.5):
+        """Returns the leg held after each row, one row at a time."""
+        position = 0
+        positions = []
+        for z in zscore:
+            if z > threshold:
+                position = 2
+            elif z < -threshold:
+                position = 1
+            elif position == 2 and z <= exit_threshold:
+                position = 0
+            elif position == 1 and z >= -exit_threshold:
+                position = 0
+            positions.append(position)
+        return np.array(positions)
+
+    def test_zscore_matches_loop(self):
+        _, join_df = self._run()
+        spread = np.log(self.df_1['close'].values)\
+            - np.log(self.df_2['close'].values)
+        np.testing.assert_allclose(join_df['spread'].values, spread)
+        expected = np.full(len(spread), np.nan)
+        for i in xrange(50, len(spread)):
+            window = spread[i - 50:i]
+            expected[i] = (spread[i] - window.mean()) / window.std()
+        np.testing.assert_allclose(join_df['spread_zscore'].values, expected,
+                                   rtol=1e-8)
+
+    def test_positions_match_bands(self):
+        for exit_threshold in (0.0, 0.5):
+            _, join_df = self._run(exit_threshold=exit_threshold)
+            expected = self._get_positions(join_df['spread_zscore'].values,
+                                           exit_threshold=exit_threshold)
+            positions = join_df['position'].values
+            self.assertTrue((expected == 1).any() and (expected == 2).any())
+            np.testing.assert_array_equal(positions[:-1], expected[:-1])
+            # Everything is sold on the last date
+            self.assertEqual(positions[-1], 0)
+
+    def test_trades_follow_positions(self):
+        sec_port, join_df = self._run()
+        trans_df = sec_port.get_all_transactions()
+        self.assertEqual(list(trans_df['trans_type'][::2]),
+                         ['Buy'] * (len(trans_df) // 2))
+        self.assertEqual(list(trans_df['trans_type'][1::2]),
+                         ['Sell'] * (len(trans_df) // 2))
+        buys = trans_df.iloc[::2].reset_index(drop=True)
+        sells = trans_df.iloc[1::2].reset_index(drop=True)
+        pd.testing.assert_series_equal(sells['security'], buys['security'])
+        np.testing.assert_allclose(sells['amt'] / sells['security_price'],
+                                   buys['amt'] / buys['security_price'])
+
+        # Each buy is of the leg held from its date
+        positions = join_df['position']
+        np.testing.assert_array_equal(
+            buys['security'].map({'a': 1, 'b': 2}).values,
+            positions[buys['date'].values].values)
+        prices = join_df[['close_a', 'close_b']]
+        for _, trans in trans_df.iterrows():
+            self.assertEqual(trans['security_price'],
+                             prices.loc[trans['date'],
+                                        'close_' + trans['security']])
+        self.assertAlmostEqual(trans_df['total_cash_amt'].iloc[-1],
+                               10000 + sells['amt'].sum() - buys['amt'].sum())
+
+    def test_end_date_sells_on_last_trading_date(self):
+        _, join_df = self._run()
+        positions = join_df['position'].values
+        held = np.flatnonzero((positions[1:-1] != 0)
+                              & (positions[:-2] == positions[1:-1])) + 1
+        end_row = held[len(held) // 2]
+        end_date = join_df.index[end_row]
+
+        # Between two dates, and past or up to the end of data that stops
+        # while a position is held
+        df_1, df_2 = self.df_1, self.df_2
+        for end_date_arg, n_rows in [
+                (str(end_date + pd.Timedelta(hours=12)), len(join_df)),
+                ('2030-01-01', end_row + 1),
+                (None, end_row + 1)]:
+            self.df_1, self.df_2 = df_1[:n_rows], df_2[:n_rows]
+            sec_port, end_df = self._run(end_date=end_date_arg)
+            trans_df = sec_port.get_all_transactions()
+            self.assertEqual(trans_df['trans_type'].iloc[-1], 'Sell')
+            self.assertEqual(trans_df['date'].iloc[-1], end_date)
+            self.assertTrue((end_df['position'][end_date:] == 0).all())
+            np.testing.assert_array_equal(end_df['position'][:end_row],
+                                          positions[:end_row])
+            self.assertEqual(sec_port.get_last_sell_cash_amt(),
+                             trans_df['total_cash_amt'].iloc[-1])
+
+    def test_start_date(self):
+        start_date = self.df_1.index[500]
+        sec_port, join_df = self._run(start_date=str(start_date.date()))
+        trans_df = sec_port.get_all_transactions()
+        self.assertGreaterEqual(trans_df['date'].min(), start_date)
+        self.assertTrue((join_df['position'][:start_date].iloc[:-1] == 0)
+                        .all())
+        # The rows before start_date still feed the statistics
+        self.assertFalse(np.isnan(join_df['spread_zscore'][start_date]))
+
+
+class screen_pairs_test(unittest.TestCase):
+    def setUp(self):
+        self.securities = ['s{}'.format(i) for i in range(20)]
+        self.security_df = make_security_df(600, self.securities)
+        # s18 and s19 are cointegrated, the rest are independent
+        df_1, df_2 = make_pair_dfs(600, seed=1, mean_reversion=0.8)
+        self.security_df['close_s18'] = df_1['close'].values
+        self.security_df['close_s19'] = df_2['close'].values
+        self.returns = self.security_df[['close_' + sec
+                                         for sec in self.securities]]\
+            .pct_change()
+
+    def test_correlations_match_corr(self):
+        firsts, seconds, corrs = ta._get_top_correlations(
+            self.returns.values, 19, 7, 60)
+        # Every pair once, with the lower column first
+        self.assertEqual(len(firsts), 20 * 19 // 2)
+        self.assertTrue((firsts < seconds).all())
+        expected = self.returns.corr().values
+        np.testing.assert_allclose(corrs, expected[firsts, seconds],
+                                   rtol=1e-10)
+
+    def test_top_k_pruning(self):
+        firsts, seconds, corrs = ta._get_top_correlations(
+            self.returns.values, 3, 7, 60)
+        corr_df = self.returns.corr()
+        corr_df.values[np.arange(20), np.arange(20)] = -np.inf
+        expected = set()
+        for i in range(20):
+            for j in np.argsort(-corr_df.values[i])[:3]:
+                expected.add((min(i, j), max(i, j)))
+        self.assertEqual(set(zip(firsts, seconds)), expected)
+
+    def test_cointegrated_pair_ranks_first(self):
+        pairs_df = ta.screen_pairs(self.security_df, top_k=3, max_workers=1)
+        self.assertEqual(list(pairs_df.loc[0, ['security_1', 'security_2']]),
+                         ['s18', 's19'])
+        self.assertLess(pairs_df.loc[0, 'df_stat'], -3.34)
+        self.assertEqual(ta._screen_data, {})
+
+    def test_process_pool_matches_serial(self):
+        serial_df = ta.screen_pairs(self.security_df, top_k=3, max_workers=1,
+                                    chunk_size=4)
+        pool_df = ta.screen_pairs(self.security_df, top_k=3, max_workers=2,
+                                  chunk_size=4)
+        pd.testing.assert_frame_equal(pool_df, serial_df)
+        self.assertEqual(ta._screen_data, {})
+
+
+class lod_test(unittest.TestCase):
+    def setUp(self):
+        security_df = benchmarks.make_security_df(5000, gap_prob=0.05)
+        self.x = np.arange(len(security_df), dtype=float)
+        self.ohlc = security_df.iloc[:, :4].values
+
+    def tearDown(self):
+        ta.plt.close('all')
+
+    def _aggregate(self, level):
+        """Returns the open, high, low and close of every block of
+        2**level bars, skipping missing values, as a resample would."""
+        n = 2**level
+        aggregated = []
+        for start in xrange(0, len(self.ohlc), n):
+            block = self.ohlc[start:start + n]
+            opens = block[:, 0][~np.isnan(block[:, 0])]
+            closes = block[:, 3][~np.isnan(block[:, 3])]
+            with warnings.catch_warnings():
+                # A block may be all missing
+                warnings.simplefilter('ignore', RuntimeWarning)
+                aggregated.append([opens[0] if len(opens) else np.nan,
+                                   np.nanmax(block[:, 1]),
+                                   np.nanmin(block[:, 2]),
+                                   closes[-1] if len(closes) else np.nan])
+        return np.array(aggregated)
+
+    def test_levels_match_aggregation(self):
+        pyramid = ta.lod_pyramid(self.x, *self.ohlc.T, min_bins=64)
+        self.assertLessEqual(len(pyramid.levels[-1]['open']), 64)
+        for level, bins in enumerate(pyramid.levels):
+            np.testing.assert_array_equal(
+                np.column_stack([bins['open'], bins['high'], bins['low'],
+                                 bins['close']]),
+                self._aggregate(level))
+            # Each x is that of the bar the value came from
+            for value_name, x_name, col in [('open', 'x_first', 0),
+                                            ('high', 'x_high', 1),
+                                            ('low', 'x_low', 2),
+                                            ('close', 'x_last', 3)]:
+                is_valid = ~np.isnan(bins[value_name])
+                locs = bins[x_name][is_valid].astype(int)
+                np.testing.assert_array_equal(
+                    self.ohlc[locs, col], bins[value_name][is_valid])
+                self.assertTrue((locs >> level
+                                 == np.flatnonzero(is_valid)).all())
+
+    def test_line_keeps_extremes(self):
+        y = self.ohlc[:, 3]
+        pyramid = ta.lod_pyramid(self.x, y, y, y, y, min_bins=64)
+        line_x, line_y = pyramid.get_line(-np.inf, np.inf, 100)
+        self.assertLessEqual(len(line_x), 4 * 102)
+        self.assertEqual(np.nanmax(line_y), np.nanmax(y))
+        self.assertEqual(np.nanmin(line_y), np.nanmin(y))
+        # Every point is one of the original points, in x order
+        self.assertTrue((np.diff(line_x) >= 0).all())
+        is_valid = ~np.isnan(line_y)
+        np.testing.assert_array_equal(y[line_x[is_valid].astype(int)],
+                                      line_y[is_valid])
+
+        # Zoomed in to fewer bars than pixels, the bars are drawn as is
+        line_x, line_y = pyramid.get_line(1000, 1050, 100)
+        np.testing.assert_array_equal(line_x, self.x[999:1052])
+        np.testing.assert_array_equal(line_y, y[999:1052])
+
+    def test_plot_lod_line_updates_on_zoom(self):
+        f, ax = ta.plt.subplots()
+        y = self.ohlc[:, 3]
+        line = ta.plot_lod_line(self.x, y, ax)
+        self.assertLess(len(line.get_xdata()), len(y))
+        self.assertEqual(np.nanmax(line.get_ydata()), np.nanmax(y))
+
+        ax.set_xlim(2000, 2100)
+        np.testing.assert_array_equal(line.get_xdata(), self.x[1999:2102])
+        np.testing.assert_array_equal(line.get_ydata(), y[1999:2102])
+
+    def test_lod_candlesticks_match_bars(self):
+        # With fewer bars than pixels, each candle is a bar
+        security_df = benchmarks.make_security_df(100, freq='D')
+        f, ax = ta.plt.subplots()
+        wicks, bodies = ta._plot_lod_candlesticks(security_df, ax, 0.2,
+                                                  ta.green, ta.red, 1.0)
+        x = ta._get_plot_x(security_df.index, ax)
+        segments = np.array(wicks.get_segments())
+        np.testing.assert_allclose(segments[:, 0, 0], x)
+        np.testing.assert_array_equal(segments[:, 0, 1],
+                                      security_df['low_aapl'].values)
+        np.testing.assert_array_equal(segments[:, 1, 1],
+                                      security_df['high_aapl'].values)
+        for verts, (open_, close) in zip(
+                bodies.get_paths(),
+                security_df[['open_aapl', 'close_aapl']].values):
+            self.assertEqual(sorted(set(verts.vertices[:4, 1])),
+                             sorted([open_, close]))
+
+
+class cache_test(unittest.TestCase):
+    def setUp(self):
+        self.security_df = make_security_df(1000)
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _generate(self, security_df):
+        """Returns the Bollinger, MA crossover and RSI columns."""
+        return [
+            ta.generate_bollinger_columns(security_df, ['aapl', 'msft'],
+                                          'close', 20, 2.0, output='columns'),
+            ta.generate_ma_columns(security_df, ['aapl', 'msft'], 'close',
+                                   [5, 20], output='columns'),
+            ta.generate_rsi_columns(security_df, ['aapl', 'msft'], 'close',
+                                    14, [30, 70], output='columns')]
+
+    def test_hits_match_uncached(self):
+        expected = self._generate(self.security_df)
+        with ta.indicator_cache() as cache:
+            # Each security has its own entry for each indicator
+            first = self._generate(self.security_df)
+            self.assertEqual((cache.hits, cache.misses), (0, 6))
+            second = self._generate(self.security_df.copy())
+            self.assertEqual((cache.hits, cache.misses), (6, 6))
+        for results in (first, second):
+            for df, expected_df in zip(results, expected):
+                pd.testing.assert_frame_equal(df, expected_df)
+
+        # Changing the returned columns does not change the cache
+        first[0].iloc[:, 0] = 0.
+        with cache:
+            pd.testing.assert_frame_equal(self._generate(self.security_df)[0],
+                                          expected[0])
+        self.assertEqual(cache.get_stats()['hit_rate'], 12 / 18.)
+
+    def test_changed_prices_or_params_miss(self):
+        with ta.indicator_cache() as cache:
+            self._generate(self.security_df)
+            changed_df = self.security_df.copy()
+            changed_df.iloc[500, changed_df.columns.get_loc('close_msft')] *= 2
+            # Only the changed security is recomputed
+            self._generate(changed_df)
+            self.assertEqual((cache.hits, cache.misses), (3, 9))
+
+            ta.generate_ma_columns(self.security_df, ['aapl', 'msft'],
+                                   'close', [5, 30])
+            self.assertEqual((cache.hits, cache.misses), (3, 11))
+
+    def test_same_prices_hit_across_securities(self):
+        renamed_df = self.security_df.rename(columns=lambda col:
+                                             col.replace('aapl', 'ibm'))
+        with ta.indicator_cache() as cache:
+            ma_df = ta.generate_ma_columns(self.security_df, ['aapl', 'msft'],
+                                           'close', [5, 20], output='columns')
+            renamed_ma_df = ta.generate_ma_columns(renamed_df, ['ibm', 'msft'],
+                                                   'close', [5, 20],
+                                                   output='columns')
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+        pd.testing.assert_frame_equal(
+            renamed_ma_df.rename(columns=lambda col:
+                                 col.replace('ibm', 'aapl')), ma_df)
+
+    def test_lru_eviction(self):
+        cache = ta.indicator_cache(max_bytes=2000)
+        cache.put('a', (np.zeros(100),))
+        cache.put('b', (np.ones(100),))
+        # 'a' is now the most recently used, so 'b' is evicted
+        cache.get('a')
+        cache.put('c', (np.full(100, 2.),))
+        self.assertIsNone(cache.get('b'))
+        np.testing.assert_array_equal(cache.get('a')[0], np.zeros(100))
+        np.testing.assert_array_equal(cache.get('c')[0], np.full(100, 2.))
+        self.assertEqual(cache.get_stats(),
+                         {'hits': 3, 'disk_hits': 0, 'misses': 1,
+                          'hit_rate': 0.75, 'evictions': 1, 'n_entries': 2,
+                          'n_bytes': 1600})
+
+        # An entry over the budget is not kept
+        cache.put('d', (np.zeros(1000),))
+        self.assertIsNone(cache.get('d'))
+        self.assertEqual(cache.n_bytes, 1600)
+
+    def test_spilled_entries_load_back(self):
+        cache = ta.indicator_cache(max_bytes=1000, spill_dir=self.tmp_dir)
+        cache.put('a', (np.arange(100.), np.arange(100) % 3 == 0))
+        cache.put('b', (np.ones(100),))
+        self.assertEqual(cache.evictions, 1)
+        arrays = cache.get('a')
+        self.assertEqual(cache.disk_hits, 1)
+        np.testing.assert_array_equal(arrays[0], np.arange(100.))
+        np.testing.assert_array_equal(arrays[1], np.arange(100) % 3 == 0)
+        self.assertFalse(arrays[0].flags.writeable)
+
+    def test_context_restores_previous_cache(self):
+        outer = ta.indicator_cache()
+        self.assertIsNone(ta.set_indicator_cache(outer))
+        try:
+            with ta.indicator_cache() as inner:
+                self.assertIs(ta._indicator_cache, inner)
+            self.assertIs(ta._indicator_cache, outer)
+        finally:
+            self.assertIs(ta.set_indicator_cache(None), outer)
+
+
+class profiler_test(unittest.TestCase):
+    def test_simulation_is_unchanged(self):
+        security_df = make_security_df(1000)
+        indicators = {'ma_crossovers': [5, 20], 'bollinger_bands': (20, 2.0)}
+
+        def _run():
+            return ta.run_simulation_df(security_df, 'close',
+                                        indicators=indicators, verbose=False,
+                                        plot_options=set())\
+                .get_all_transactions()
+
+        trans_df = _run()
+        measurements = []
+        with ta.pipeline_profiler(
+                callback=lambda *args: measurements.append(args)) as profiler:
+            profiled_trans_df = _run()
+        pd.testing.assert_frame_equal(profiled_trans_df, trans_df)
+
+        self.assertEqual(profiler.counters['trades_executed'], len(trans_df))
+        stage_report = profiler.get_stage_report()
+        for stage in ['run_simulation_df', 'simulation',
+                      'generate_ma_columns', 'generate_bollinger_columns']:
+            self.assertEqual(stage_report.loc[stage, 'calls'], 1)
+        self.assertLessEqual(stage_report.loc['simulation', 'total_time'],
+                             stage_report.loc['run_simulation_df',
+                                              'total_time'])
+
+        # The callback sees every measurement
+        counts = {}
+        for kind, name, value in measurements:
+            if kind == 'count':
+                counts[name] = counts.get(name, 0) + value
+        self.assertEqual(counts, profiler.counters)
+        self.assertEqual(sum(kind == 'time' for kind, _, _ in measurements),
+                         stage_report['calls'].sum())
+
+    def test_generate_counters(self):
+        security_df = make_security_df(500)
+        n_bytes = security_df.memory_usage(index=True).sum()
+        with ta.pipeline_profiler() as profiler:
+            ta.generate_ma_columns(security_df, ['aapl', 'msft'], 'close',
+                                   [5, 20])
+            ta.generate_ma_columns(security_df, ['aapl', 'msft'], 'close',
+                                   [5, 20], output='inplace')
+        self.assertEqual(profiler.counters['rows_processed'], 2 * 500 * 2)
+        # Only the 'copy' output copies security_df
+        self.assertEqual(profiler.counters['bytes_copied'], n_bytes)
+
+    def test_data_store_counters(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            store = ta.data_storage(
+                tmp_dir, provider=fake_provider(make_security_df(365,
+                                                                 ('aapl',))))
+            with ta.pipeline_profiler() as profiler:
+                store.get_security_data('aapl', '2015-01-01', '2015-06-30')
+                store.get_security_data('aapl', '2015-02-01', '2015-03-31')
+        finally:
+            shutil.rmtree(tmp_dir)
+        self.assertEqual(profiler.counters['data_store_misses'], 1)
+        self.assertEqual(profiler.counters['data_store_hits'], 1)
+
+    def test_inactive_after_exit(self):
+        with self.assertRaises(ZeroDivisionError):
+            with ta.pipeline_profiler() as profiler:
+                1 / 0
+        self.assertEqual(ta._active_profilers, [])
+        ta.generate_ma_columns(make_security_df(100), 'aapl', 'close',
+                               [5, 20])
+        self.assertEqual(profiler.counters, {})
+        self.assertEqual(profiler.stage_times, {})
+        # The stages keep the names of the functions they time
+        self.assertEqual(ta.generate_ma_columns.__name__,
+                         'generate_ma_columns')
+
+
+class benchmark_test(unittest.TestCase):
+    def test_synthetic_data_is_deterministic(self):
+        security_df = benchmarks.make_security_df(1000, ('aapl', 'msft'),
+                                                  seed=1, gap_prob=0.01)
+        pd.testing.assert_frame_equal(
+            security_df, benchmarks.make_security_df(1000, ('aapl', 'msft'),
+                                                     seed=1, gap_prob=0.01))
+        self.assertFalse(security_df.equals(
+            benchmarks.make_security_df(1000, ('aapl', 'msft'), seed=2,
+                                        gap_prob=0.01)))
+
+    def test_trading_calendar_and_gaps(self):
+        security_df = benchmarks.make_security_df(1000, ('aapl',), freq='D',
+                                                  holidays=True,
+                                                  gap_prob=0.05)
+        index = security_df.index
+        self.assertEqual(len(index), 1000)
+        self.assertTrue((index.dayofweek < 5).all())
+        holidays = pd.tseries.holiday.USFederalHolidayCalendar()\
+            .holidays(index[0], index[-1])
+        self.assertFalse(index.isin(holidays).any())
+
+        # A missing row is missing in every column
+        is_missing = security_df.isnull()
+        self.assertTrue(is_missing.any().all())
+        self.assertTrue((is_missing.all(axis=1)
+                         == is_missing.any(axis=1)).all())
+        valid_df = security_df.dropna()
+        self.assertTrue((valid_df['high_aapl']
+                         >= valid_df[['open_aapl', 'close_aapl']].max(axis=1))
+                        .all())
+        self.assertTrue((valid_df['low_aapl']
+                         <= valid_df[['open_aapl', 'close_aapl']].min(axis=1))
+                        .all())
+
+    def test_suite_writes_json(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            output = os.path.join(tmp_dir, 'results.json')
+            benchmarks.run_suite(
+                row_counts=(1000,), security_counts=(1, 2),
+                functions=['generate_ma_columns', 'run_simulation_df'],
+                max_cells=1500, output=output)
+            with open(output) as f:
+                results = json.load(f)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        self.assertEqual(sorted(results['environment']),
+                         ['commit', 'numpy', 'pandas', 'platform', 'python',
+                          'timestamp'])
+        self.assertEqual(sorted((result['function'], result['n_securities'])
+                                for result in results['results']),
+                         [('generate_ma_columns', 1),
+                          ('run_simulation_df', 1)])
+        for result in results['results']:
+            self.assertEqual(result['n_rows'], 1000)
+            self.assertGreater(result['wall_time'], 0)
+            self.assertGreater(result['peak_rss_mb'], 0)
+        self.assertEqual(len(results['skipped']), 2)
+        self.assertEqual(results['failed'], [])
+
+        with self.assertRaises(ValueError):
+            benchmarks.run_suite(functions=['generate_nothing'])
+
+    def test_suite_reports_failed_cases(self):
+        suite_functions = list(benchmarks._SUITE_FUNCTIONS)
+        benchmarks._SUITE_FUNCTIONS += [
+            ('crash', lambda security_df, securities: os._exit(3)),
+            ('hang', lambda security_df, securities: time.sleep(60))]
+        try:
+            results = benchmarks.run_suite(row_counts=(1000,),
+                                           security_counts=(1,),
+                                           functions=['crash', 'hang'],
+                                           timeout=2)
+        finally:
+            benchmarks._SUITE_FUNCTIONS[:] = suite_functions
+
+        self.assertEqual(results['results'], [])
+        errors = {result['function']: result['error']
+                  for result in results['failed']}
+        self.assertEqual(errors, {'crash': 'exited with code 3 without a '
+                                           'result',
+                                  'hang': 'timed out after 2s'})
+
+
+class fake_provider:
+    def __init__(self, security_df, n_failures=0):
+        """A data_storage provider that serves security_df and returns an
+        empty DataFrame, as get_security_data() does for a security that
+        cannot be fetched, for its first n_failures calls."""
+        self.security_df = security_df
+        self.n_failures = n_failures
+        self.calls = []
+
+    def __call__(self, security, start_date, end_date, data_source):
+        self.calls.append((start_date, end_date))
+        if len(self.calls) <= self.n_failures:
+            return self.security_df.iloc[:0]
+        return self.security_df.loc[start_date:end_date]
+
+
+class failing_provider:
+    def __init__(self, error, security_df=None):
+        """A get_security_data() provider that raises error, then serves
+        security_df if it is set."""
+        self.error = error
+        self.security_df = security_df
+        self.n_calls = 0
+
+    def get_data(self, security, start_date, end_date):
+        self.n_calls += 1
+        if self.security_df is None or self.n_calls == 1:
+            raise self.error
+        return self.security_df.copy()
+
+
+class fetch_test(unittest.TestCase):
+    def test_transient_error_is_retried(self):
+        provider = failing_provider(socket.timeout('timed out'),
+                                    pd.DataFrame({'Close': [1.0, 2.0]}))
+        result = ta.get_security_data('aapl', '2015-01-01', '2015-01-02',
+                                      data_source=provider, backoff=0,
+                                      return_result=True)
+        self.assertEqual(provider.n_calls, 2)
+        self.assertEqual(result.get_failed_securities(), [])
+        self.assertEqual(list(result.security_df.columns), ['close_aapl'])
+
+    def test_other_errors_are_not_retried(self):
+        provider = failing_provider(ValueError('unknown ticker'))
+        result = ta.get_security_data('zzzz', '2015-01-01', '2015-01-02',
+                                      data_source=provider, backoff=0,
+                                      return_result=True)
+        self.assertEqual(provider.n_calls, 1)
+        self.assertEqual(result.get_failed_securities(), ['zzzz'])
+
+
+class data_storage_test(unittest.TestCase):
+    def setUp(self):
+        self.security_df = make_security_df(365, ('aapl',))
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _read_manifest(self):
+        with open(os.path.join(self.tmp_dir, 'manifest.json')) as f:
+            return json.load(f)
+
+    def test_failed_fetch_is_not_stored(self):
+        provider = fake_provider(self.security_df, n_failures=1)
+        store = ta.data_storage(self.tmp_dir, provider=provider)
+        self.assertEqual(len(store.get_security_data('aapl', '2015-01-01',
+                                                     '2015-06-30')), 0)
+        self.assertNotIn('AAPL', store.coverage_dict)
+
+        security_df = store.get_security_data('aapl', '2015-01-01',
+                                              '2015-06-30')
+        pd.testing.assert_frame_equal(
+            security_df, self.security_df.loc['2015-01-01':'2015-06-30'])
+        self.assertEqual(len(provider.calls), 2)
+
+    def test_coverage_only_grows_over_fetched_ranges(self):
+        provider = fake_provider(self.security_df)
+        store = ta.data_storage(self.tmp_dir, provider=provider)
+        store.get_security_data('aapl', '2015-03-01', '2015-06-30')
+
+        # The range before the stored data fails, the one after succeeds
+        provider.n_failures = len(provider.calls) + 1
+        store.get_security_data('aapl', '2015-01-01', '2015-12-31')
+        self.assertEqual(store.coverage_dict['AAPL'],
+                         (pd.Timestamp('2015-03-01'),
+                          pd.Timestamp('2015-12-31')))
+        self.assertEqual(self._read_manifest()['AAPL']['start'],
+                         '2015-03-01T00:00:00')
+
+        security_df = store.get_security_data('aapl', '2015-01-01',
+                                              '2015-12-31')
+        self.assertEqual(provider.calls[-1], (pd.Timestamp('2015-01-01'),
+                                              pd.Timestamp('2015-02-28')))
+        pd.testing.assert_frame_equal(
+            security_df, self.security_df.loc['2015-01-01':'2015-12-31'])
+
+    def test_new_rows_are_fetched(self):
+        # The provider only has the first half of the year at first
+        provider = fake_provider(self.security_df.loc[:'2015-06-30'])
+        store = ta.data_storage(self.tmp_dir, provider=provider)
+        security_df = store.get_security_data('aapl', '2015-01-01',
+                                              '2015-12-31')
+        self.assertEqual(security_df.index[-1], pd.Timestamp('2015-06-30'))
+        self.assertEqual(store.coverage_dict['AAPL'][1],
+                         pd.Timestamp('2015-06-30'))
+
+        provider.security_df = self.security_df
+        security_df = store.get_security_data('aapl', '2015-01-01',
+                                              '2015-12-31')
+        self.assertEqual(provider.calls[-1], (pd.Timestamp('2015-07-01'),
+                                              pd.Timestamp('2015-12-31')))
+        pd.testing.assert_frame_equal(security_df, self.security_df)
+        self.assertEqual(store.coverage_dict['AAPL'][1],
+                         pd.Timestamp('2015-12-31'))
+
+    def test_load_returns_views_unless_copied(self):
+        # A weekday-only calendar, so that some dates fall between rows
+        security_df = self.security_df[self.security_df.index.dayofweek < 5]
+        store = ta.data_storage(provider=fake_provider(security_df))
+        store.get_security_data('aapl', '2015-01-01', '2015-12-31',
+                                return_df=False)
+        stored_df = store.load_security_data('aapl')
+
+        for start_date, end_date in [('2015-03-01', '2015-03-31'),
+                                     ('2015-03-07', '2015-03-08'),
+                                     ('2014-06-01', '2015-01-10'),
+                                     ('2015-12-20', '2016-06-01'),
+                                     (None, '2015-02-01'),
+                                     ('2015-11-01', None)]:
+            expected_df = security_df.loc[start_date:end_date]
+            view_df = store.load_security_data('aapl', start_date, end_date)
+            pd.testing.assert_frame_equal(view_df, expected_df)
+            if len(view_df):
+                self.assertTrue(np.shares_memory(view_df.values,
+                                                 stored_df.values))
+
+            copy_df = store.load_security_data('aapl', start_date, end_date,
+                                               copy=True)
+            pd.testing.assert_frame_equal(copy_df, expected_df)
+            self.assertFalse(np.shares_memory(copy_df.values,
+                                              stored_df.values))
+            copy_df.iloc[:, :] = -1.
+            pd.testing.assert_frame_equal(
+                store.load_security_data('aapl', start_date, end_date),
+                expected_df)
+
+    def test_manifest_points_at_current_files(self):
+        provider = fake_provider(self.security_df)
+        store = ta.data_storage(self.tmp_dir, provider=provider)
+        store.get_security_data('aapl', '2015-01-01', '2015-06-30')
+        store.get_security_data('aapl', '2015-01-01', '2015-12-31')
+
+        entry = self._read_manifest()['AAPL']
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)),
+                         ['AAPL.{}.index.npy'.format(entry['version']),
+                          'AAPL.{}.values.npy'.format(entry['version']),
+                          'manifest.json'])
+        reopened_store = ta.data_storage(self.tmp_dir, provider=provider)
+        pd.testing.assert_frame_equal(
+            reopened_store.load_security_data('aapl'),
+            self.security_df.loc['2015-01-01':'2015-12-31'])
+
+    def test_failed_manifest_write_keeps_old_version(self):
+        provider = fake_provider(self.security_df)
+        store = ta.data_storage(self.tmp_dir, provider=provider)
+        store.get_security_data('aapl', '2015-01-01', '2015-06-30')
+
+        save_atomic = ta._save_atomic
+        def failing_save_atomic(path, save_func):
+            if path.endswith('manifest.json'):
+                raise IOError('disk full')
+            save_atomic(path, save_func)
+        ta._save_atomic = failing_save_atomic
+        try:
+            with self.assertRaises(IOError):
+                store.get_security_data('aapl', '2015-01-01', '2015-12-31')
+        finally:
+            ta._save_atomic = save_atomic
+
+        reopened_store = ta.data_storage(self.tmp_dir, provider=provider)
+        self.assertEqual(reopened_store.coverage_dict['AAPL'][1],
+                         pd.Timestamp('2015-06-30'))
+        pd.testing.assert_frame_equal(
+            reopened_store.load_security_data('aapl'),
+            self.security_df.loc['2015-01-01':'2015-06-30'])
+
+
+if __name__ == '__main__':
+    unittest.main()